@@ -1,16 +1,36 @@
-from fastapi import FastAPI, Query, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.requests import ClientDisconnect
+from contextlib import asynccontextmanager
 from typing import Optional
-import hd_features as hd
 import hd_constants
 import convertJSON as cj
+import hd_cache
+import hd_metrics
+import hd_store
+import hd_runtime
+import hd_tz
+import hd_workers
 from geocode import get_latitude_longitude
-from timezonefinder import TimezoneFinder
+import asyncio
 import json
+import threading
+import time
 
 
-app = FastAPI(title="Human Design API")
+@asynccontextmanager
+async def lifespan(app):
+    #timezone finder, ephemeris, lookup tables and worker processes are built in background, see /ready
+    hd_runtime.start_warm_up()
+    pool = hd_workers.get_pool()
+    threading.Thread(target=pool.start, name="hd_worker_pool", daemon=True).start()
+    yield
+    pool.shutdown()
+
+app = FastAPI(title="Human Design API", lifespan=lifespan)
+if hd_metrics.enabled:
+    app.add_middleware(hd_metrics.RequestMetrics)
 
 import os
 from dotenv import load_dotenv
@@ -34,13 +54,25 @@ if not TOKEN:
     raise RuntimeError("HD_API_TOKEN environment variable is not set. Please set it before running the API or add it to your .env file.")
 security = HTTPBearer()
 
+#batch endpoint: records per chunk and chunks calculated at the same time (memory bound)
+BATCH_CHUNK_SIZE = int(os.getenv("HD_BATCH_CHUNK_SIZE", 500))
+BATCH_CHUNKS_IN_FLIGHT = int(os.getenv("HD_BATCH_CHUNKS_IN_FLIGHT", 4))
+#max. bytes of one record (line), longer records are skipped with an error
+BATCH_MAX_LINE = int(os.getenv("HD_BATCH_MAX_LINE", 64*1024))
+#max. seconds a batch chunk waits for a free worker
+BATCH_QUEUE_TIMEOUT = 60.0
+BATCH_ORDER_LIST = ["input", "completion"]
+BATCH_TIME_KEYS = ["year", "month", "day", "hour", "minute"]
+BATCH_OUTPUT_KEYS = ["index", "id", "result", "error"]
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if credentials.credentials != TOKEN:
         raise HTTPException(status_code=401, detail="Invalid or missing authentication token.")
     return True
 
 @app.get("/calculate")
-def calculate_hd(
+async def calculate_hd(
+    request: Request,
     year: int = Query(..., description="Birth year"),
     month: int = Query(..., description="Birth month"),
     day: int = Query(..., description="Birth day"),
@@ -53,66 +85,292 @@ def calculate_hd(
     # 1. Validate and collect input
     birth_time = (year, month, day, hour, minute, second)
 
-    # 2. Geocode and timezone
-    try:
-        latitude, longitude = get_latitude_longitude(place)
-        if latitude is not None and longitude is not None:
-            tf = TimezoneFinder()
-            zone = tf.timezone_at(lat=latitude, lng=longitude)
-            if not zone:
-                zone = 'Etc/UTC'
-        else:
-            raise HTTPException(status_code=400, detail=f"Geocoding failed for place: '{place}'. Please check the place name or try a different format.")
-        hours = hd.get_utc_offset_from_tz(birth_time, zone)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error determining timezone or offset: {str(e)}")
+    # 2. Geocode and timezone (cached, see hd_cache), blocking lookups run in a thread
+    hours = await asyncio.to_thread(resolve_offset, birth_time, place)
 
     # 3. Prepare timestamp
-    timestamp = tuple(list(birth_time) + [int(hours)])
+    timestamp = tuple(list(birth_time) + [hours]) #decimal hours, e.g. 5.5 for India
+    response_key = hd_cache.utc_instant(birth_time, hours)
+    cached_result = hd_cache.response_cache.get(response_key)
+    if cached_result is not None:
+        #birth date of the response is local time
+        general_output = dict(cached_result["general"], birth_date="{}".format(timestamp[:-2]))
+        return render_response(dict(cached_result, general=general_output), request)
 
-    # 4. Calculate Human Design Features
+    # 4. Calculate Human Design Features and format data for JSON output (worker process)
     try:
-        single_result = hd.calc_single_hd_features(timestamp, report=False, channel_meaning=False, day_chart_only=False)
+        final_result = await hd_workers.get_pool().run(hd_workers.calc_response, timestamp)
+    except hd_workers.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Server busy, please retry: {e}")
+    except hd_workers.WorkerCrashError as e:
+        raise HTTPException(status_code=503, detail=f"Calculation interrupted, please retry: {e}")
+    except hd_workers.CalculationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating Human Design features: {str(e)}")
 
-    # 5. Format Data for JSON Output
+    hd_cache.response_cache.set(response_key, final_result)
+    return render_response(final_result, request)
+
+def render_response(data, request):
+    ''' response dict serialized once, format by Accept/Accept-Encoding header (see convertJSON.render) '''
+    headers = request.headers if request is not None else {}
+    with hd_metrics.stage("serialization"):
+        body, header_dict = cj.render(data, headers.get("accept"), headers.get("accept-encoding"))
+    return Response(content=body, headers=header_dict)
+
+def resolve_offset(birth_time, place):
+    ''' utc offset (hours) of local birth time at place, raises HTTPException '''
     try:
-        data = {
-            "birth_date": single_result[9],
-            "create_date": single_result[10],
-            "energie_type": single_result[0],
-            "inner_authority": single_result[1],
-            "inc_cross": single_result[2],
-            "profile": single_result[4],
-            "active_chakras": single_result[7],
-            "split": "{}".format(single_result[5]),
-            "variables": {
-                'right_up': 'right',
-                'right_down': 'left',
-                'left_up': 'right',
-                'left_down': 'right'
-            }
-        }
-        general_json_str = cj.general(data)
-        gates_json_str = cj.gatesJSON(single_result[6])
-        channels_json_str = cj.channelsJSON(single_result[8], False)
-        general_output = json.loads(general_json_str)
-        gates_output = json.loads(gates_json_str)
-        channels_output = json.loads(channels_json_str)
-    except IndexError as e:
-        raise HTTPException(status_code=500, detail=f"Error processing calculation results: Missing expected data at index {e}")
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Internal error generating JSON output: {e}")
+        zone = resolve_zone(place)
+        return hd_cache.offset_cache.get_or_set(
+            (zone, hd_cache.normalize_time(birth_time)), hd_tz.get_utc_offset, birth_time, zone)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error processing results: {e}")
-
-    final_result = {
-        "general": general_output,
-        "gates": gates_output,
-        "channels": channels_output
-    }
-    return JSONResponse(content=final_result)
+        raise HTTPException(status_code=500, detail=f"Error determining timezone or offset: {str(e)}")
+
+def resolve_zone(place):
+    ''' timezone of place (cached), raises HTTPException if geocoding failed '''
+    coordinates = hd_cache.place_cache.get_or_set(
+        hd_cache.normalize_place(place), geocode_place, place)
+    if coordinates is None:
+        raise HTTPException(status_code=400, detail=f"Geocoding failed for place: '{place}'. Please check the place name or try a different format.")
+    latitude, longitude = coordinates
+    zone = hd_runtime.timezone_at(latitude, longitude)
+    if not zone:
+        zone = 'Etc/UTC'
+    return zone
+
+@app.post("/calculate/batch")
+async def calculate_hd_batch(
+    request: Request,
+    order: str = Query("input", description="Order of results: input or completion"),
+    authorized: bool = Depends(verify_token)
+):
+    """
+    Charts of many birth records. Body: NDJSON, one record per line with the
+    parameters of /calculate (year, month, day, hour, minute, second, place)
+    and an optional "id". Response: NDJSON, one line per record with "index"
+    (line number), "id" and "result" or "error".
+    """
+    if order not in BATCH_ORDER_LIST:
+        raise HTTPException(status_code=400, detail=f"order must be one of {BATCH_ORDER_LIST}")
+    return BodyStreamingResponse(stream_batch(read_batch_chunks(request), order), media_type="application/x-ndjson")
+
+class BodyStreamingResponse(StreamingResponse):
+    '''
+    streaming response whose iterator reads the request body itself: starlette's
+    disconnect listener (ASGI spec < 2.4, e.g. uvicorn) would consume the body messages,
+    a disconnect is detected by the body reader (ClientDisconnect) or by send
+    '''
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+async def read_batch_chunks(request):
+    '''
+    (index, line) chunks of BATCH_CHUNK_SIZE records, body is read incrementally,
+    records longer than BATCH_MAX_LINE bytes are not buffered (line None, error per record)
+    '''
+    buffer = bytearray()
+    oversized = False #rest of current record is skipped
+    chunk = []
+    index = 0
+    async for data in request.stream():
+        line_list = []
+        start = 0
+        end = data.find(b"\n")
+        while end >= 0:
+            if not oversized:
+                buffer += data[start:end]
+            line_list.append(None if oversized or len(buffer) > BATCH_MAX_LINE else bytes(buffer))
+            buffer.clear()
+            oversized = False
+            start = end + 1
+            end = data.find(b"\n", start)
+        if not oversized:
+            buffer += data[start:]
+            if len(buffer) > BATCH_MAX_LINE:
+                oversized = True
+                buffer.clear()
+        for line in line_list:
+            if line is None or line.strip():
+                chunk.append((index, line))
+                index += 1
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if oversized or buffer.strip():
+        chunk.append((index, None if oversized else bytes(buffer)))
+    if chunk:
+        yield chunk
+
+async def stream_batch(chunks, order):
+    '''
+    NDJSON lines of all chunks, at most BATCH_CHUNKS_IN_FLIGHT chunks are calculated at
+    the same time (bounded memory), lines in input order or in order of completion
+    '''
+    pending = []
+    async for chunk in chunks:
+        pending.append(asyncio.ensure_future(calc_batch_chunk(chunk)))
+        while len(pending) >= BATCH_CHUNKS_IN_FLIGHT:
+            for lines in await next_batch_results(pending, order):
+                yield lines
+    while pending:
+        for lines in await next_batch_results(pending, order):
+            yield lines
+
+async def next_batch_results(pending, order):
+    ''' wait for first chunk (input order) or any chunk (completion order), removed from pending '''
+    if order == "input":
+        return [await pending.pop(0)]
+    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        pending.remove(task)
+    return [task.result() for task in done]
+
+def record_int(record, key, default=None):
+    ''' integer field of a batch record (json number without fraction, no bool/string/null), default if missing '''
+    value = record.get(key, default) if default is not None else record[key]
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f"{key} must be an integer")
+    return value
+
+async def calc_batch_chunk(chunk):
+    '''
+    NDJSON lines of one chunk: places, offsets and instants are resolved/calculated
+    once per unique value, errors are reported per record
+    Args:
+        chunk(list of tuple): (index, line) of body
+    Return:
+        lines(bytes): one json line per record (input order)
+    '''
+    item_list = []
+    for index, line in chunk:
+        item = {"index": index}
+        try:
+            if line is None:
+                raise ValueError(f"record longer than {BATCH_MAX_LINE} bytes")
+            record = json.loads(line)
+            if "id" in record:
+                item["id"] = record["id"]
+            item["birth_time"] = tuple(record_int(record, key) for key in BATCH_TIME_KEYS) + (record_int(record, "second", 0),)
+            hd_cache.normalize_time(item["birth_time"]) #raises ValueError for invalid dates
+            if not isinstance(record.get("place"), str) or not record["place"].strip():
+                raise TypeError("place must be a non-empty string")
+            item["place"] = record["place"]
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            item["error"] = f"Invalid record: {type(e).__name__}: {e}"
+        item_list.append(item)
+    valid_list = [item for item in item_list if "error" not in item]
+
+    # 1. timezone once per place (geocoding in a thread)
+    place_dict = {hd_cache.normalize_place(item["place"]): item["place"] for item in valid_list}
+    zone_dict = await asyncio.to_thread(resolve_zones, place_dict)
+    for item in valid_list:
+        zone = zone_dict[hd_cache.normalize_place(item["place"])]
+        if isinstance(zone, HTTPException):
+            item["error"] = zone.detail
+        else:
+            item["zone"] = zone
+    valid_list = [item for item in valid_list if "error" not in item]
+
+    # 2. offsets of all records in one vectorized call
+    if valid_list:
+        try:
+            hours_list = hd_tz.resolve_offsets_zones([item["birth_time"] for item in valid_list],
+                                                     [item["zone"] for item in valid_list]).tolist()
+        except Exception as e:
+            for item in valid_list:
+                item["error"] = f"Error determining timezone or offset: {str(e)}"
+        else:
+            for item, hours in zip(valid_list, hours_list):
+                item["timestamp"] = item["birth_time"] + (hours,)
+                item["instant"] = hd_cache.utc_instant(item["birth_time"], hours)
+    valid_list = [item for item in valid_list if "error" not in item]
+
+    # 3. charts once per utc instant (response cache, batch calculation in worker pool)
+    result_dict = {}
+    for item in valid_list:
+        if item["instant"] not in result_dict:
+            result_dict[item["instant"]] = hd_cache.response_cache.get(item["instant"])
+    missing_dict = {item["instant"]: item["timestamp"] for item in valid_list if result_dict[item["instant"]] is None}
+    if missing_dict:
+        try:
+            response_list = await run_batch_job(hd_workers.calc_responses, list(missing_dict.values()))
+        except Exception as e:
+            response_list = [{"error": f"Error calculating Human Design features: {str(e)}"}]*len(missing_dict)
+        for instant, response in zip(missing_dict, response_list):
+            result_dict[instant] = response.get("result", response)
+            if "result" in response:
+                hd_cache.response_cache.set(instant, response["result"])
+    for item in valid_list:
+        result = result_dict[item["instant"]]
+        if "error" in result:
+            item["error"] = result["error"]
+        else:
+            #birth date of the response is local time
+            item["result"] = dict(result, general=dict(result["general"], birth_date="{}".format(item["timestamp"][:-2])))
+
+    with hd_metrics.stage("serialization"):
+        return b"".join(cj.dumps_json({key: item[key] for key in BATCH_OUTPUT_KEYS if key in item}) + b"\n"
+                        for item in item_list)
+
+def resolve_zones(place_dict):
+    ''' normalized place -> timezone or HTTPException (see resolve_zone) '''
+    zone_dict = {}
+    for key, place in place_dict.items():
+        try:
+            zone_dict[key] = resolve_zone(place)
+        except HTTPException as e:
+            zone_dict[key] = e
+        except Exception as e:
+            zone_dict[key] = HTTPException(status_code=500, detail=f"Error determining timezone or offset: {str(e)}")
+    return zone_dict
+
+async def run_batch_job(func, *args):
+    ''' run func in the worker pool, waits (up to BATCH_QUEUE_TIMEOUT seconds) while the queue is full '''
+    pool = hd_workers.get_pool()
+    deadline = time.monotonic() + BATCH_QUEUE_TIMEOUT
+    while True:
+        try:
+            return await pool.run(func, *args)
+        except hd_workers.QueueFullError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+def geocode_place(place):
+    ''' coordinates of place, None if geocoding failed (not cached) '''
+    latitude, longitude = get_latitude_longitude(place)
+    if latitude is None or longitude is None:
+        return None
+    return latitude, longitude
+
+@app.get("/cache_stats")
+def get_cache_stats(authorized: bool = Depends(verify_token)):
+    """hit/miss counters and sizes of the result caches, the persistent chart store and the worker pool"""
+    store = hd_store.get_default_store()
+    return JSONResponse(content=dict(hd_cache.cache_stats(), store=store.stats() if store else None,
+                                     workers=hd_workers.get_pool().stats()))
+
+@app.get("/metrics")
+def get_metrics():
+    """prometheus metrics (no token): stage latency histograms, cache hit ratios, worker pool queue depth, in flight requests"""
+    return Response(content=hd_metrics.render(hd_workers.get_pool()), media_type=hd_metrics.CONTENT_TYPE)
+
+@app.get("/ready")
+def get_ready():
+    """readiness probe: 200 once all runtime resources and worker processes are warm, else 503"""
+    pool = hd_workers.get_pool()
+    ready = hd_runtime.is_ready() and pool.ready
+    return JSONResponse(content=dict(hd_runtime.readiness(), ready=ready, workers=pool.stats()),
+                        status_code=200 if ready else 503)
 
 if __name__ == "__main__":
     import uvicorn
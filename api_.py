@@ -1,10 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import hd_features as hd
 import hd_constants
 import convertJSON as cj
 from geocode import get_latitude_longitude
-from timezonefinder import TimezoneFinder
-import json # Import the json library to parse the string outputs
+import hd_runtime
+import hd_tz
 
 app = Flask(__name__)
 
@@ -35,8 +35,7 @@ def calculate_hd():
     try:
         latitude, longitude = get_latitude_longitude(birth_place)
         if latitude is not None and longitude is not None:
-            tf = TimezoneFinder()
-            zone = tf.timezone_at(lat=latitude, lng=longitude)
+            zone = hd_runtime.timezone_at(latitude, longitude)
             # Provide a default fallback timezone if lookup fails
             if not zone:
                  print(f"Warning: Timezone lookup failed for '{birth_place}'. Falling back to UTC.")
@@ -49,7 +48,7 @@ def calculate_hd():
 
         # --- 3. Calculate UTC Offset ---
         # Ensure birth_time is passed correctly to the offset function
-        hours = hd.get_utc_offset_from_tz(birth_time, zone)
+        hours = hd_tz.get_utc_offset(birth_time, zone)
 
     except Exception as e:
         # Log the specific error for debugging
@@ -58,7 +57,7 @@ def calculate_hd():
 
 
     # --- 4. Prepare Timestamp ---
-    timestamp = tuple(list(birth_time) + [int(hours)])
+    timestamp = tuple(list(birth_time) + [hours]) # decimal hours, e.g. 5.5 for India
     # print(f"DEBUG: timestamp={timestamp}, zone={zone}, birth_time={birth_time}, hours={hours}", flush=True)
 
     # --- 5. Calculate Human Design Features ---
@@ -93,23 +92,14 @@ def calculate_hd():
 
         # --- 7. Generate JSON Outputs ---
         # The convertJSON functions return JSON *strings*, we need to parse them back to objects
-        general_json_str = cj.general(data)
-        gates_json_str = cj.gatesJSON(single_result[6])
-        channels_json_str = cj.channelsJSON(single_result[8], False)
-
-        # Parse the JSON strings into Python dictionaries/lists
-        general_output = json.loads(general_json_str)
-        gates_output = json.loads(gates_json_str)
-        channels_output = json.loads(channels_json_str)
+        general_output = cj.general_dict(data)
+        gates_output = cj.gates_dict(single_result[6])
+        channels_output = cj.channels_dict(single_result[8], False)
 
     except IndexError as e:
          # Handle cases where single_result doesn't have expected indices
          print(f"Error accessing calculation results: {e}. Result array: {single_result}")
          return jsonify({"error": f"Error processing calculation results: Missing expected data at index {e}"}), 500
-    except json.JSONDecodeError as e:
-         # Handle errors if the convertJSON functions don't return valid JSON strings
-         print(f"Error decoding JSON from helper functions: {e}")
-         return jsonify({"error": f"Internal error generating JSON output: {e}"}), 500
     except Exception as e:
         # Catch any other unexpected errors during data formatting/JSON generation
         print(f"Unexpected error during JSON generation: {e}")
@@ -122,9 +112,17 @@ def calculate_hd():
         "channels": channels_output
     }
 
-    return jsonify(final_result)
+    # serialized once, format by Accept/Accept-Encoding header (see convertJSON.render)
+    body, headers = cj.render(final_result, request.headers.get("Accept"), request.headers.get("Accept-Encoding"))
+    return Response(body, headers=headers)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # readiness probe: 200 once all runtime resources are warm, else 503
+    return jsonify(hd_runtime.readiness()), 200 if hd_runtime.is_ready() else 503
 
 if __name__ == '__main__':
+    hd_runtime.start_warm_up()
     # Run the Flask app
     # Debug=True allows for auto-reloading on code changes and provides better error messages
     app.run(debug=True, port=5001) # Use a different port than default 5000 if needed
@@ -1,6 +1,25 @@
 import json
+import gzip
+import time
 import hd_constants
-def general(data):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#responses smaller than this (bytes) are not compressed
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+def general_dict(data):
     output = {
         "birth_date": data['birth_date'],
         "create_date": data['create_date'],
@@ -14,9 +33,12 @@ def general(data):
         "variables": data['variables']
   }
   
-    return json.dumps(output, indent=2)
+    return output
 
-def gatesJSON(data):
+def general(data):
+    return json.dumps(general_dict(data), indent=2)
+
+def gates_dict(data):
     # Initialize the structure for 'prs' and 'des'
     output = {
         "prs": {
@@ -46,10 +68,13 @@ def gatesJSON(data):
         else:
             output['des']['Planets'].append(planet_data)
 
+    return output
+
+def gatesJSON(data):
     # Convert the result to JSON string (optional, for display purposes)
-    return json.dumps(output, indent=2)
+    return json.dumps(gates_dict(data), indent=2)
 
-def channelsJSON(data, details=False):
+def channels_dict(data, details=False):
     # details: get all details or only channels numbers
     result = []
     
@@ -83,6 +108,91 @@ def channelsJSON(data, details=False):
             }
         result.append(channel_data)
     
+    return {"Channels": result}
+
+def channelsJSON(data, details=False):
     # Convert the result to a JSON string
-    return json.dumps({"Channels": result}, indent=4)
+    return json.dumps(channels_dict(data, details), indent=4)
 
+
+# --- response layer: response dicts are serialized once, format by Accept header ---
+
+def dumps_json(data):
+    # compact JSON (orjson if installed), utf-8 bytes
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def dumps_msgpack(data):
+    return msgpack.packb(data, use_bin_type=True)
+
+# media type -> encoder, first entry is the default
+FORMAT_DICT = {"application/json": dumps_json}
+if msgpack is not None:
+    FORMAT_DICT["application/msgpack"] = dumps_msgpack
+    FORMAT_DICT["application/x-msgpack"] = dumps_msgpack
+
+# content encoding -> compressor
+ENCODING_DICT = {"gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL)}
+if brotli is not None:
+    ENCODING_DICT["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+def parse_header_values(header):
+    # "a/b;q=0.5, c/d" -> [("c/d", 1.0), ("a/b", 0.5)], sorted by quality
+    value_list = []
+    for idx, part in enumerate((header or "").split(",")):
+        value, *param_list = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in param_list:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if value and quality > 0:
+            value_list.append((value.lower(), quality, -idx))
+    return [(value, quality) for value, quality, _ in sorted(value_list, key=lambda item: item[1:], reverse=True)]
+
+def negotiate(accept=None, accept_encoding=None):
+    # media type and content encoding (None: uncompressed) of Accept/Accept-Encoding headers,
+    # JSON if no supported media type is accepted
+    media_type = next(iter(FORMAT_DICT))
+    for value, _ in parse_header_values(accept):
+        if value in FORMAT_DICT:
+            media_type = value
+            break
+        if value in ("*/*", "application/*"):
+            break
+    encoding = None
+    for value, _ in parse_header_values(accept_encoding):
+        if value in ENCODING_DICT:
+            encoding = value
+            break
+    return media_type, encoding
+
+def render(data, accept=None, accept_encoding=None):
+    # serialize response dict once
+    # Return: body (bytes), headers (dict with Content-Type, Content-Encoding, Vary)
+    media_type, encoding = negotiate(accept, accept_encoding)
+    body = FORMAT_DICT[media_type](data)
+    headers = {"Content-Type": media_type, "Vary": "Accept, Accept-Encoding"}
+    if encoding is not None and len(body) >= COMPRESS_MIN_SIZE:
+        body = ENCODING_DICT[encoding](body)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+def measure_formats(data, repeat=100):
+    # payload bytes and serialization time (ms per call) of every format/encoding
+    result = {}
+    for media_type, dumps in FORMAT_DICT.items():
+        for encoding in [None] + list(ENCODING_DICT):
+            t_start = time.perf_counter()
+            for _ in range(repeat):
+                body = dumps(data)
+                if encoding is not None:
+                    body = ENCODING_DICT[encoding](body)
+            result[media_type + ("+" + encoding if encoding else "")] = {
+                "bytes": len(body),
+                "ms": round(1000*(time.perf_counter() - t_start)/repeat, 4),
+            }
+    return result
@@ -0,0 +1,252 @@
+"""
+offline gazetteer: place names and coordinates from a GeoNames style dump
+    name index:  normalized names (name, ascii name, alternate names) -> entries,
+                 fuzzy matching of misspelled names (difflib)
+    qualifiers:  "name, region, country" parts after the name are matched against
+                 the country (name or code) and the admin1 region (code or name)
+    k-d tree:    nearest entry of coordinates (reverse geocoding)
+
+    GeoNames dumps (e.g. cities15000.txt, countryInfo.txt, admin1CodesASCII.txt) are available at
+    https://download.geonames.org/export/dump/
+"""
+import csv
+import difflib
+import sys
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+#min. similarity of fuzzy name matches (difflib ratio)
+FUZZY_CUTOFF = 0.8
+#max. length difference of fuzzy match candidates
+FUZZY_LENGTH_DIFF = 2
+#GeoNames columns (tab separated, see readme of the dump)
+GEONAMES_COLUMNS = {"name": 1, "asciiname": 2, "alternatenames": 3, "latitude": 4,
+                    "longitude": 5, "country_code": 8, "admin1": 10, "population": 14}
+
+@dataclass
+class Place:
+    name: str
+    latitude: float
+    longitude: float
+    country_code: str = ""
+    country: str = ""
+    admin1: str = ""
+    admin1_name: str = ""
+    population: int = 0
+    alternate_names: Tuple[str, ...] = ()
+
+    @property
+    def address(self) -> str:
+        region = self.admin1_name if self.admin1_name != self.name else ""
+        return ", ".join(part for part in (self.name, region, self.country) if part)
+
+    @property
+    def region_names(self) -> Tuple[str, ...]:
+        """Normalized admin1 code and name (region qualifiers of lookup)."""
+        return tuple(name for name in (normalize_name(self.admin1), normalize_name(self.admin1_name)) if name)
+
+def normalize_name(name: str) -> str:
+    """Case folded name without accents and punctuation, whitespace collapsed."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = "".join(char if char.isalnum() else " " for char in name.casefold())
+    return " ".join(name.split())
+
+def to_unit_vectors(latitude, longitude) -> np.ndarray:
+    """Points on the unit sphere, euclidean nearest = great circle nearest."""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)], axis=-1)
+
+def chord_to_km(chord: float) -> float:
+    """Great circle distance (km) of chord length on the unit sphere."""
+    return 2*EARTH_RADIUS_KM*np.arcsin(min(chord/2, 1.0))
+
+class KDTree:
+    """
+    k-d tree with leaf buckets
+    Args:
+        points(np.array): shape (N,dim)
+        leaf_size(int): max. points per leaf (distances of a leaf in one numpy call)
+    """
+    def __init__(self, points: np.ndarray, leaf_size: int = 32):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        #node: (lo,hi,axis,split,left,right), leaf: axis -1
+        self.nodes: List[Tuple[int, int, int, float, int, int]] = []
+        if len(self.points):
+            self._build(0, len(self.points))
+
+    def _build(self, lo: int, hi: int) -> int:
+        node_idx = len(self.nodes)
+        self.nodes.append((lo, hi, -1, 0.0, -1, -1))
+        if hi - lo <= self.leaf_size:
+            return node_idx
+        idx = self.order[lo:hi]
+        axis = int(np.argmax(np.ptp(self.points[idx], axis=0)))
+        mid = (hi - lo)//2
+        self.order[lo:hi] = idx[np.argpartition(self.points[idx, axis], mid)]
+        split = self.points[self.order[lo + mid], axis]
+        left = self._build(lo, lo + mid)
+        right = self._build(lo + mid, hi)
+        self.nodes[node_idx] = (lo, hi, axis, split, left, right)
+        return node_idx
+
+    def query(self, point: np.ndarray) -> Tuple[float, int]:
+        """
+        nearest point
+        Return:
+            distance(float): euclidean distance, inf if tree is empty
+            index(int): row of nearest point, -1 if tree is empty
+        """
+        best_dist, best_idx = np.inf, -1 #squared distance, index
+        stack = [(0, 0.0)] if self.nodes else [] #node, squared distance to its region (lower bound)
+        while stack:
+            node_idx, bound = stack.pop()
+            if bound >= best_dist:
+                continue
+            lo, hi, axis, split, left, right = self.nodes[node_idx]
+            if axis < 0:
+                idx = self.order[lo:hi]
+                dist = ((self.points[idx] - point)**2).sum(axis=1)
+                pos = int(np.argmin(dist))
+                if dist[pos] < best_dist:
+                    best_dist, best_idx = dist[pos], int(idx[pos])
+                continue
+            diff = point[axis] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, diff*diff)))
+            stack.append((near, bound)) #near side first
+        return float(np.sqrt(best_dist)), best_idx
+
+class Gazetteer:
+    """
+    name index and k-d tree over a list of places
+    Args:
+        places(list of Place): entries, on equal names the largest population wins
+    """
+    def __init__(self, places: Iterable[Place]):
+        self.places: List[Place] = list(places)
+        self.name_dict: Dict[str, List[int]] = {}
+        for idx, place in enumerate(self.places):
+            for name in dict.fromkeys(normalize_name(name) for name in (place.name, *place.alternate_names)):
+                if name:
+                    self.name_dict.setdefault(name, []).append(idx)
+        for idx_list in self.name_dict.values():
+            idx_list.sort(key=lambda idx: -self.places[idx].population)
+        #fuzzy candidates by first character
+        self.initial_dict: Dict[str, List[str]] = {}
+        for name in self.name_dict:
+            self.initial_dict.setdefault(name[0], []).append(name)
+        #country names and codes -> country code
+        self.country_dict: Dict[str, str] = {}
+        for place in self.places:
+            for name in (place.country_code, place.country):
+                if name:
+                    self.country_dict[normalize_name(name)] = place.country_code
+        self.tree = KDTree(to_unit_vectors([place.latitude for place in self.places],
+                                           [place.longitude for place in self.places]).reshape(-1, 3))
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    @classmethod
+    def from_geonames(cls, path: str, country_info_path: Optional[str] = None,
+                      with_alternate_names: bool = True,
+                      admin1_codes_path: Optional[str] = None) -> "Gazetteer":
+        """
+        Load a GeoNames dump (e.g. cities15000.txt).
+        Args:
+            path(str): tab separated GeoNames file
+            country_info_path(str): countryInfo.txt (country names), optional
+            with_alternate_names(bool): index alternate names (more memory)
+            admin1_codes_path(str): admin1CodesASCII.txt (region names, e.g. "Maine"), optional
+        """
+        country_name_dict = {}
+        if country_info_path:
+            with open(country_info_path, encoding="utf-8") as file:
+                for row in csv.reader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+                    if row and not row[0].startswith("#") and len(row) > 4:
+                        country_name_dict[row[0]] = row[4]
+        admin1_name_dict = {} #"US.ME" -> "Maine"
+        if admin1_codes_path:
+            with open(admin1_codes_path, encoding="utf-8") as file:
+                for row in csv.reader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+                    if len(row) > 1:
+                        admin1_name_dict[row[0]] = row[1]
+        places = []
+        csv.field_size_limit(sys.maxsize) #alternate names of large cities
+        column = GEONAMES_COLUMNS
+        with open(path, encoding="utf-8") as file:
+            for row in csv.reader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+                if len(row) <= column["population"]:
+                    continue
+                alternate_names = [row[column["asciiname"]]]
+                if with_alternate_names and row[column["alternatenames"]]:
+                    alternate_names += row[column["alternatenames"]].split(",")
+                places.append(Place(name=row[column["name"]],
+                                    latitude=float(row[column["latitude"]]),
+                                    longitude=float(row[column["longitude"]]),
+                                    country_code=row[column["country_code"]],
+                                    country=country_name_dict.get(row[column["country_code"]], ""),
+                                    admin1=row[column["admin1"]],
+                                    admin1_name=admin1_name_dict.get(
+                                        "{}.{}".format(row[column["country_code"]], row[column["admin1"]]), ""),
+                                    population=int(row[column["population"]] or 0),
+                                    alternate_names=tuple(alternate_names)))
+        return cls(places)
+
+    def match_names(self, name: str) -> List[int]:
+        """Entries of normalized name, fuzzy matches if there is no exact match."""
+        if name in self.name_dict:
+            return self.name_dict[name]
+        if not name:
+            return []
+        candidate_list = [candidate for candidate in self.initial_dict.get(name[0], [])
+                          if abs(len(candidate) - len(name)) <= FUZZY_LENGTH_DIFF]
+        match_list = difflib.get_close_matches(name, candidate_list, n=3, cutoff=FUZZY_CUTOFF)
+        return [idx for match in match_list for idx in self.name_dict[match]]
+
+    def lookup(self, query: str, fuzzy: bool = False) -> Optional[Place]:
+        """
+        Resolve "name[, region][, country]": first part is matched by name,
+        every further part must match the country (name or code) or the
+        admin1 region (code or name) of the entry.
+        Args:
+            fuzzy(bool): fuzzy name matches if there is no exact match (misspelled names),
+                         else only exact names (a fallback geocoder resolves the rest)
+        Return:
+            place(Place): best match (largest population), None if not found
+                          or if a qualifier matches no entry of the name
+        """
+        part_list = [normalize_name(part) for part in query.split(",")]
+        part_list = [part for part in part_list if part]
+        if not part_list:
+            return None
+        if fuzzy:
+            idx_list = self.match_names(part_list[0])
+        else:
+            idx_list = self.name_dict.get(part_list[0], [])
+        for part in part_list[1:]:
+            country_code = self.country_dict.get(part)
+            idx_list = [idx for idx in idx_list
+                        if self.places[idx].country_code == country_code or part in self.places[idx].region_names]
+        if not idx_list:
+            return None
+        return max((self.places[idx] for idx in idx_list), key=lambda place: place.population)
+
+    def nearest(self, latitude: float, longitude: float) -> Tuple[Optional[Place], float]:
+        """
+        Nearest place of coordinates (k-d tree).
+        Return:
+            place(Place): None if gazetteer is empty
+            distance(float): great circle distance in km
+        """
+        chord, idx = self.tree.query(to_unit_vectors(latitude, longitude))
+        if idx < 0:
+            return None, np.inf
+        return self.places[idx], chord_to_km(chord)
@@ -1,8 +1,40 @@
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
+"""
+geocoding layer: offline gazetteer first, persistent on-disk cache,
+Nominatim as optional fallback
+
+    environment variables:
+        HD_GAZETTEER        GeoNames dump (default cities15000.txt, skipped if missing)
+        HD_COUNTRY_INFO     GeoNames countryInfo.txt (default countryInfo.txt)
+        HD_ADMIN1_CODES     GeoNames admin1CodesASCII.txt, region names (default admin1CodesASCII.txt)
+        HD_GEOCODE_CACHE    sqlite cache file (default hd_geocode.sqlite, "" disables)
+        HD_GEOCODE_FALLBACK 0 disables Nominatim (offline only)
+
+    for tests set_geocoder(Geocoder(gazetteer=..., fallback=...)) installs a
+    local stand-in (any object with geocode(place) and reverse((lat, lon))).
+
+    geopy is imported on first use of the fallback, importing this module does
+    no network I/O.
+"""
+import os
+import sqlite3
+import threading
+import time
 from typing import Optional, Tuple, List, Dict
 from dataclasses import dataclass
 
+import gazetteer as gz
+import hd_metrics
+
+GAZETTEER_PATH = os.getenv("HD_GAZETTEER", "cities15000.txt")
+COUNTRY_INFO_PATH = os.getenv("HD_COUNTRY_INFO", "countryInfo.txt")
+ADMIN1_CODES_PATH = os.getenv("HD_ADMIN1_CODES", "admin1CodesASCII.txt")
+GEOCODE_CACHE_PATH = os.getenv("HD_GEOCODE_CACHE", "hd_geocode.sqlite")
+FALLBACK_ENABLED = os.getenv("HD_GEOCODE_FALLBACK", "1") != "0"
+#reverse geocoding: nearest gazetteer place must be closer (km), else fallback
+MAX_ADDRESS_DISTANCE_KM = 50.0
+#reverse geocoding cache key: rounded coordinates (~10 m)
+REVERSE_KEY_DIGITS = 4
+
 @dataclass
 class Location:
     place: str
@@ -10,55 +42,179 @@ class Location:
     longitude: Optional[float]
     address: Optional[str] = None
 
+class GeocodeCache:
+    """
+    Persistent geocoding results (sqlite, shared by processes).
+    Args:
+        path(str): database file
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """sqlite connection of this thread and process (reopened after fork)"""
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS places (
+                                      query TEXT PRIMARY KEY,
+                                      latitude REAL,
+                                      longitude REAL,
+                                      address TEXT,
+                                      created REAL NOT NULL)""")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def get(self, query: str) -> Optional[Location]:
+        row = self.connection.execute("SELECT latitude, longitude, address FROM places WHERE query=?",
+                                      [query]).fetchone()
+        return Location(query, *row) if row else None
+
+    def set(self, query: str, location: Location):
+        self.connection.execute("INSERT OR REPLACE INTO places VALUES (?,?,?,?,?)",
+                                [query, location.latitude, location.longitude, location.address, time.time()])
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+class Geocoder:
+    """
+    Resolve places: gazetteer (exact names) -> cache -> fallback (results of the fallback
+    are cached) -> gazetteer (fuzzy names, only if nothing else was found).
+    Args:
+        gazetteer(gazetteer.Gazetteer): offline name index and k-d tree, optional
+        cache(GeocodeCache): persistent cache, optional
+        fallback: geopy style geocoder (geocode(place), reverse((lat, lon))), optional
+    """
+    def __init__(self, gazetteer: Optional[gz.Gazetteer] = None,
+                 cache: Optional[GeocodeCache] = None, fallback=None):
+        self.gazetteer = gazetteer
+        self.cache = cache
+        self.fallback = fallback
+        self.stats: Dict[str, int] = {"gazetteer": 0, "cache": 0, "fallback": 0, "not_found": 0}
+
+    def geocode(self, place: str) -> Location:
+        """Coordinates and address of place name (None values if not found)."""
+        if self.gazetteer is not None:
+            entry = self.gazetteer.lookup(place)
+            if entry is not None:
+                self.stats["gazetteer"] += 1
+                return Location(place, entry.latitude, entry.longitude, entry.address)
+        key = ", ".join(filter(None, (gz.normalize_name(part) for part in place.split(","))))
+        location = self._cached(key, place, self._fallback_geocode)
+        if location.latitude is None and self.gazetteer is not None:
+            #misspelled names, a fuzzy match must not win over the fallback
+            entry = self.gazetteer.lookup(place, fuzzy=True)
+            if entry is not None:
+                self.stats["not_found"] -= 1
+                self.stats["gazetteer"] += 1
+                return Location(place, entry.latitude, entry.longitude, entry.address)
+        return location
+
+    def reverse(self, latitude: float, longitude: float) -> Optional[str]:
+        """Address of coordinates: nearest gazetteer place or fallback."""
+        if self.gazetteer is not None:
+            entry, distance = self.gazetteer.nearest(latitude, longitude)
+            if entry is not None and distance <= MAX_ADDRESS_DISTANCE_KM:
+                self.stats["gazetteer"] += 1
+                return entry.address
+        key = "reverse:{:.{digits}f},{:.{digits}f}".format(latitude, longitude, digits=REVERSE_KEY_DIGITS)
+        return self._cached(key, (latitude, longitude), self._fallback_reverse).address
+
+    def _cached(self, key: str, query, func) -> Location:
+        location = self.cache.get(key) if self.cache is not None else None
+        if location is not None:
+            self.stats["cache"] += 1
+            return location
+        location = func(query)
+        if location.latitude is None:
+            self.stats["not_found"] += 1
+            return location #not found/offline: not cached, retried next time
+        self.stats["fallback"] += 1
+        if self.cache is not None:
+            self.cache.set(key, location)
+        return location
+
+    def _fallback_geocode(self, place: str) -> Location:
+        location = None
+        if self.fallback is not None:
+            from geopy.exc import GeopyError
+            try:
+                location = self.fallback.geocode(place)
+            except GeopyError:
+                location = None
+        if location:
+            return Location(place, location.latitude, location.longitude, location.address)
+        return Location(place, None, None)
+
+    def _fallback_reverse(self, coordinates: Tuple[float, float]) -> Location:
+        location = None
+        if self.fallback is not None:
+            from geopy.exc import GeopyError
+            try:
+                location = self.fallback.reverse(coordinates)
+            except GeopyError:
+                location = None
+        if location:
+            return Location(str(coordinates), *coordinates, location.address)
+        return Location(str(coordinates), None, None)
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def get_geocoder() -> Geocoder:
+    """Default geocoder of the process, built on first call from the environment settings."""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            gazetteer = None
+            if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH):
+                gazetteer = gz.Gazetteer.from_geonames(
+                    GAZETTEER_PATH, COUNTRY_INFO_PATH if os.path.exists(COUNTRY_INFO_PATH) else None,
+                    admin1_codes_path=ADMIN1_CODES_PATH if os.path.exists(ADMIN1_CODES_PATH) else None)
+            fallback = None
+            if FALLBACK_ENABLED:
+                from geopy.geocoders import Nominatim
+                fallback = Nominatim(user_agent="geocoding_api")
+            _geocoder = Geocoder(gazetteer=gazetteer,
+                                 cache=GeocodeCache(GEOCODE_CACHE_PATH) if GEOCODE_CACHE_PATH else None,
+                                 fallback=fallback)
+        return _geocoder
+
+def set_geocoder(geocoder: Optional[Geocoder]):
+    """Install geocoder (e.g. local stand-in for tests), None rebuilds the default on next use."""
+    global _geocoder
+    with _geocoder_lock:
+        _geocoder = geocoder
+
+@hd_metrics.timed("geocode")
 def get_latitude_longitude(place: str) -> Tuple[Optional[float], Optional[float]]:
-    geolocator = Nominatim(user_agent="geocoding_api")
-    location = geolocator.geocode(place)
-    if location:
-        return location.latitude, location.longitude
-    return None, None
+    location = get_geocoder().geocode(place)
+    return location.latitude, location.longitude
 
 def get_address(latitude: float, longitude: float) -> Optional[str]:
     """Reverse geocode coordinates to get an address."""
-    geolocator = Nominatim(user_agent="geocoding_api")
-    try:
-        location = geolocator.reverse((latitude, longitude))
-        return location.address if location else None
-    except:
-        return None
+    return get_geocoder().reverse(latitude, longitude)
 
 def batch_geocode(places: List[str]) -> List[Location]:
     """Geocode multiple places at once."""
-    geolocator = Nominatim(user_agent="geocoding_api")
-    results = []
-    
-    for place in places:
-        location = geolocator.geocode(place)
-        if location:
-            results.append(Location(
-                place=place,
-                latitude=location.latitude,
-                longitude=location.longitude,
-                address=location.address
-            ))
-        else:
-            results.append(Location(
-                place=place,
-                latitude=None,
-                longitude=None,
-                address=None
-            ))
-    return results
+    geocoder = get_geocoder()
+    return [geocoder.geocode(place) for place in places]
 
 def calculate_distance(place1: str, place2: str) -> Optional[float]:
     """Calculate distance between two places in kilometers."""
+    from geopy.distance import geodesic
     coords1 = get_latitude_longitude(place1)
     coords2 = get_latitude_longitude(place2)
-    
+
     if None in coords1 or None in coords2:
         return None
-        
+
     return geodesic(coords1, coords2).kilometers
 
-place = "Istanbul, Turkey"
-latitude, longitude = get_latitude_longitude(place)
-print(f"Latitude: {latitude}, Longitude: {longitude}")
+if __name__ == "__main__":
+    place = "Istanbul, Turkey"
+    latitude, longitude = get_latitude_longitude(place)
+    print(f"Latitude: {latitude}, Longitude: {longitude}")
@@ -0,0 +1,434 @@
+"""
+benchmark suite of the calculation core
+    groups:
+        micro:          hot functions on their own (ephemeris, design date, gate mapping,
+                        channels/chakras, classification, kernels, utc offsets)
+        chart:          full single charts and batches
+        scan:           range scans (calc_mult_hd_features at 1/2/4/N workers, dicts and
+                        shared memory columns, event scan)
+        composite:      composite combinations and day chart composites
+        api:            /calculate and /calculate/batch round trips through the ASGI app
+                        with a stub geocoder (no network)
+        serialization:  response building and encoding, payload bytes of every format
+        import:         cold import of core modules in a new interpreter (cold start of
+                        workers), loaded optional heavy modules are listed per case
+
+    every case reports time per call (median/min/mean ms), python allocations of one
+    call (tracemalloc peak/net KB) and peak RSS of the process (and of child processes)
+
+    python hd_benchmark.py run [--group micro chart] [--match gate] [--quick] [--out bench.json]
+    python hd_benchmark.py compare baseline.json bench.json [--threshold 0.1]
+        exit code 1 if a case is slower (median) or allocates more than threshold
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+#min. measured seconds per case, calls are repeated until reached (quick: 1/10)
+MIN_TIME = 0.5
+MAX_CALLS = 10000
+#relative change of median time/allocation peak flagged by compare
+REGRESSION_THRESHOLD = 0.10
+#allocation changes below this (KB) are not flagged
+ALLOC_TOLERANCE_KB = 64
+GROUP_LIST = ["micro","chart","scan","composite","api","serialization","import"]
+#modules of import cases, "" measures the interpreter start alone
+IMPORT_MODULE_LIST = ["","hd_ephemeris","hd_chart","hd_features","hd_workers","geocode","convertJSON","api"]
+#modules that are only imported on use (reporting, progress bars, pools, fallback geocoder)
+LAZY_MODULE_LIST = ["pandas","IPython","tqdm","dateutil","geopy","multiprocessing"]
+WORKER_COUNT_LIST = sorted({1,2,4,os.cpu_count() or 1})
+BIRTH_TIMESTAMP = (1990,5,17,13,45,0,2)
+PERSONS_DICT = {"person1":(1990,5,17,13,45,0,2),
+                "person2":(1985,11,2,7,10,0,1),
+                "person3":(2001,2,28,22,5,0,-5),
+               }
+STUB_COORDINATES = (52.52,13.405) #Berlin
+API_TOKEN = "benchmark"
+
+def case(name,func,min_time=MIN_TIME,max_calls=MAX_CALLS,warm_up=True,allocations=True,extra=None):
+    '''
+    benchmark case
+    Args:
+        func: callable without arguments, one call is measured
+        warm_up(bool): one unmeasured call before timing (imports, caches, tables)
+        allocations(bool): measure one extra call with tracemalloc
+        extra(dict): additional result values (e.g. payload bytes)
+    '''
+    return {"name":name,"func":func,"min_time":min_time,"max_calls":max_calls,
+            "warm_up":warm_up,"allocations":allocations,"extra":extra or {}}
+
+def shifted_timestamps(start,count,step_minutes=1):
+    ''' callable returning count new timestamps on every call (avoids design date cache hits) '''
+    counter = itertools.count()
+    def next_timestamps():
+        offset = next(counter)*count*step_minutes
+        base = np.datetime64(datetime(*start[:5])) + np.timedelta64(offset,"m")
+        times = (base + np.arange(count)*np.timedelta64(step_minutes,"m")).astype("datetime64[s]").tolist()
+        return [(t.year,t.month,t.day,t.hour,t.minute,0,start[6]) for t in times]
+    return next_timestamps
+
+def micro_cases(quick):
+    import hd_ephemeris
+    import hd_features as hd
+    import hd_kernels
+    import hd_chart
+    import hd_runtime
+    import hd_tz
+    jd = float(hd_ephemeris.timestamps_to_jd([BIRTH_TIMESTAMP])[0])
+    jd_array = jd + np.arange(1000)/1440
+    lon = hd_ephemeris.calc_longitudes(jd_array)
+    create_lon = hd_ephemeris.calc_longitudes(hd_ephemeris.calc_create_dates(jd_array))
+    activations = hd_kernels.decompose_longitudes(np.concatenate([lon,create_lon],axis=1))
+    instance = hd.hd_features(*BIRTH_TIMESTAMP)
+    gate_dict = instance.birth_creat_date_to_gate(instance.time_stamp)
+    channels,chakras = hd.get_channels_and_active_chakras(gate_dict)
+    chart_blob = hd.encode_chart(gate_dict)
+    timestamps = np.array(shifted_timestamps(BIRTH_TIMESTAMP,1000,60)())
+
+    return [case("calc_longitudes_1",lambda: hd_ephemeris.calc_longitudes([jd])),
+            case("calc_longitudes_1000",lambda: hd_ephemeris.calc_longitudes(jd_array)),
+            case("calc_create_date",lambda: hd_ephemeris.calc_create_date(jd)),
+            case("calc_create_dates_1000",lambda: hd_ephemeris.calc_create_dates(jd_array,use_cache=False)),
+            case("decompose_longitudes_1000",lambda: hd_kernels.decompose_longitudes(lon)),
+            case("lon_to_gate_dict",lambda: hd.lon_to_gate_dict(lon[0],"prs")),
+            case("date_to_gate",lambda: instance.date_to_gate(jd,"prs")),
+            case("birth_creat_date_to_gate",lambda: instance.birth_creat_date_to_gate(instance.time_stamp)),
+            case("get_channels_and_active_chakras",lambda: hd.get_channels_and_active_chakras(gate_dict)),
+            case("get_channels_and_active_chakras_meaning",
+                 lambda: hd.get_channels_and_active_chakras(gate_dict,meaning=True)),
+            case("get_typ",lambda: hd.get_typ(channels,chakras)),
+            case("get_auth",lambda: hd.get_auth(chakras,channels)),
+            case("get_split",lambda: hd.get_split(channels,chakras)),
+            case("get_inc_cross",lambda: hd.get_inc_cross(gate_dict)),
+            case("get_profile",lambda: hd.get_profile(gate_dict)),
+            case("get_variables",lambda: hd.get_variables(gate_dict)),
+            case("get_hd_features",lambda: hd.get_hd_features(gate_dict,"bdate","cdate")),
+            case("classify_batch_1000",lambda: hd_kernels.classify_batch(activations)),
+            case("chart_batch_from_longitudes_1000",lambda: hd_chart.ChartBatch.from_longitudes(lon,create_lon)),
+            case("encode_chart",lambda: hd.encode_chart(gate_dict)),
+            case("decode_chart",lambda: hd.decode_chart(chart_blob)),
+            case("get_utc_offset",lambda: hd_tz.get_utc_offset(BIRTH_TIMESTAMP,"Europe/Berlin")),
+            case("resolve_offsets_1000",lambda: hd_tz.resolve_offsets(timestamps,"Europe/Berlin")),
+            case("calc_timezone",lambda: hd_runtime.calc_timezone(*STUB_COORDINATES)),
+           ]
+
+def chart_cases(quick):
+    import hd_features as hd
+    import hd_workers
+    next_single = shifted_timestamps(BIRTH_TIMESTAMP,1)
+    next_batch = shifted_timestamps(BIRTH_TIMESTAMP,1000)
+    return [case("calc_single_hd_features",lambda: hd.calc_single_hd_features(BIRTH_TIMESTAMP)),
+            case("calc_hd_features_batch_1",lambda: hd.calc_hd_features_batch(next_single())),
+            case("calc_hd_features_batch_1000",lambda: hd.calc_hd_features_batch(next_batch())),
+            case("calc_response",lambda: hd_workers.calc_response(next_single()[0])),
+           ]
+
+def scan_cases(quick):
+    import hd_features as hd
+    end_date = (2000,1,15,0,0,0,0) if quick else (2000,4,1,0,0,0,0)
+    case_list = [case("calc_mult_hd_features_hours_{}w".format(workers),
+                      lambda workers=workers: hd.calc_mult_hd_features((2000,1,1,0,0,0,0),end_date,1,"hours",1,
+                                                                        workers,batch_size=100),
+                      min_time=0,max_calls=1 if quick else 3,warm_up=False,allocations=False,
+                      extra={"workers":workers})
+                 for workers in WORKER_COUNT_LIST]
+    case_list += [case("calc_mult_hd_features_columnar_{}w".format(workers),
+                       lambda workers=workers: hd.calc_mult_hd_features((2000,1,1,0,0,0,0),end_date,1,"hours",1,
+                                                                         workers,batch_size=100,mode="columnar"),
+                       min_time=0,max_calls=1 if quick else 3,warm_up=False,allocations=False,
+                       extra={"workers":workers})
+                  for workers in WORKER_COUNT_LIST]
+    case_list.append(case("calc_scan_hd_features_line",
+                          lambda: hd.calc_scan_hd_features((2000,1,1,0,0,0,0),end_date),
+                          min_time=0,max_calls=1 if quick else 3))
+    return case_list
+
+def composite_cases(quick):
+    import hd_features as hd
+    composite = hd.hd_composite(BIRTH_TIMESTAMP,None,None,1,"hours",1,1)
+    composite.date_to_gate_hd_chart()
+    day_list = shifted_timestamps((2024,1,1,12,0,0,0),100,24*60)()
+    return [case("get_composite_combinations_3",lambda: hd.get_composite_combinations(PERSONS_DICT)),
+            case("get_composite_hd_day_chart",lambda: composite.get_composite_hd_day_chart(day_list[0])),
+            case("get_composite_hd_day_chart_batch_100",lambda: composite.get_composite_hd_day_chart_batch(day_list)),
+           ]
+
+class StubGeocoder:
+    ''' local stand-in of geocode.Geocoder: fixed coordinates for every place, no network '''
+    def __init__(self,latitude,longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.stats = {"stub":0}
+
+    def geocode(self,place):
+        import geocode
+        self.stats["stub"] += 1
+        return geocode.Location(place,self.latitude,self.longitude,place)
+
+    def reverse(self,latitude,longitude):
+        return "stub"
+
+async def asgi_request(app,method,path,query=b"",body=b"",headers=()):
+    '''
+    call an ASGI app without server
+    Return:
+        status(int), body(bytes)
+    '''
+    message_list = [{"type":"http.request","body":body,"more_body":False}]
+    response = {"status":None,"body":[]}
+    async def receive():
+        if message_list:
+            return message_list.pop(0)
+        await asyncio.sleep(3600) #no disconnect while the response is streamed
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body",b""))
+    scope = {"type":"http","asgi":{"version":"3.0","spec_version":"2.3"},"http_version":"1.1",
+             "method":method,"scheme":"http","path":path,"raw_path":path.encode(),"root_path":"",
+             "query_string":query,"server":("benchmark",80),"client":("127.0.0.1",1),
+             "headers":[(b"authorization",b"Bearer " + API_TOKEN.encode())]
+                       + [(key.lower().encode(),value.encode()) for key,value in headers]}
+    await app(scope,receive,send)
+    return response["status"],b"".join(response["body"])
+
+def api_cases(quick):
+    global API_TOKEN
+    #offline and calculation in threads of this process, before api/geocode are imported
+    os.environ.setdefault("HD_API_TOKEN",API_TOKEN)
+    os.environ.setdefault("HD_GEOCODE_FALLBACK","0")
+    os.environ.setdefault("HD_WORKERS","0")
+    API_TOKEN = os.environ["HD_API_TOKEN"]
+    import api
+    import geocode
+    import hd_cache
+    geocode.set_geocoder(StubGeocoder(*STUB_COORDINATES))
+    loop = asyncio.new_event_loop()
+    minute = itertools.count()
+    def calculate(cached):
+        def call():
+            if cached:
+                query = b"year=1990&month=5&day=17&hour=13&minute=45&place=Berlin"
+            else:
+                count = next(minute)
+                query = "year=1990&month=5&day={}&hour={}&minute={}&place=Berlin".format(
+                    1 + count//1440 % 28,count//60 % 24,count % 60).encode()
+            status,body = loop.run_until_complete(asgi_request(api.app,"GET","/calculate",query))
+            if status != 200:
+                raise RuntimeError("/calculate returned {}: {}".format(status,body[:200]))
+        return call
+    def batch():
+        status,body = loop.run_until_complete(asgi_request(api.app,"POST","/calculate/batch",body=batch_body))
+        if status != 200:
+            raise RuntimeError("/calculate/batch returned {}".format(status))
+    batch_body = b"".join(json.dumps({"year":1990,"month":5,"day":17,"hour":idx//60,"minute":idx % 60,
+                                      "place":"Berlin","id":idx}).encode() + b"\n" for idx in range(100))
+    def uncached(func):
+        def call():
+            hd_cache.clear_caches()
+            func()
+        return call
+    return [case("api_calculate",uncached(calculate(False))),
+            case("api_calculate_cached",calculate(True)),
+            case("api_batch_100",uncached(batch),min_time=MIN_TIME/2),
+           ]
+
+def serialization_cases(quick):
+    import convertJSON as cj
+    import hd_features as hd
+    import hd_workers
+    single_result = hd.calc_hd_features_batch([BIRTH_TIMESTAMP])[0]
+    response = hd_workers.build_response(single_result)
+    case_list = [case("build_response",lambda: hd_workers.build_response(single_result)),
+                 case("gates_json_indent",lambda: cj.gatesJSON(single_result[6])),
+                ]
+    for media_type in cj.FORMAT_DICT:
+        for encoding in [None] + list(cj.ENCODING_DICT):
+            body,_ = cj.render(response,media_type,encoding)
+            case_list.append(case("render_{}{}".format(media_type.split("/")[-1],"_" + encoding if encoding else ""),
+                                  lambda media_type=media_type,encoding=encoding: cj.render(response,media_type,encoding),
+                                  extra={"bytes":len(body)}))
+    return case_list
+
+def import_cases(quick):
+    import subprocess
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ,HD_API_TOKEN=os.getenv("HD_API_TOKEN",API_TOKEN))
+    probe = ("import sys,time,json;t=time.perf_counter();{}"
+             "print(json.dumps([time.perf_counter()-t,sorted(sys.modules)]))")
+    case_list = []
+    for module in IMPORT_MODULE_LIST:
+        statement = "import {};".format(module) if module else ""
+        output = subprocess.run([sys.executable,"-c",probe.format(statement)],cwd=cwd,env=env,check=True,
+                                capture_output=True,text=True).stdout
+        import_seconds,module_list = json.loads(output.splitlines()[-1])
+        lazy_list = [name for name in LAZY_MODULE_LIST if name in module_list]
+        case_list.append(case("import_{}".format(module or "interpreter"),
+                              lambda statement=statement: subprocess.run([sys.executable,"-c",statement],cwd=cwd,
+                                                                         env=env,check=True,capture_output=True),
+                              min_time=2*MIN_TIME,allocations=False,
+                              extra={"import_ms":round(1000*import_seconds,1),"modules":len(module_list),
+                                     "lazy_modules_loaded":lazy_list}))
+    return case_list
+
+CASE_FUNC_DICT = {"micro":micro_cases,
+                  "chart":chart_cases,
+                  "scan":scan_cases,
+                  "composite":composite_cases,
+                  "api":api_cases,
+                  "serialization":serialization_cases,
+                  "import":import_cases,
+                 }
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    ''' peak resident set size since process start (MB) '''
+    maxrss = resource.getrusage(who).ru_maxrss
+    return round(maxrss/(1024*1024 if sys.platform == "darwin" else 1024),1)
+
+def measure(bench_case,quick=False):
+    '''
+    time, allocations and peak RSS of one case
+    Return:
+        result(dict): calls, median_ms, min_ms, mean_ms, stdev_ms, alloc_peak_kb, alloc_net_kb,
+                      rss_peak_mb, children_rss_peak_mb and extra values of the case
+    '''
+    func = bench_case["func"]
+    if bench_case["warm_up"]:
+        func()
+    min_time = bench_case["min_time"]/10 if quick else bench_case["min_time"]
+    time_list = []
+    t_end = time.perf_counter() + min_time
+    while not time_list or (len(time_list) < bench_case["max_calls"] and time.perf_counter() < t_end):
+        t_start = time.perf_counter()
+        func()
+        time_list.append(time.perf_counter() - t_start)
+    result = {"calls":len(time_list),
+              "median_ms":round(1000*statistics.median(time_list),4),
+              "min_ms":round(1000*min(time_list),4),
+              "mean_ms":round(1000*statistics.fmean(time_list),4),
+              "stdev_ms":round(1000*statistics.stdev(time_list),4) if len(time_list) > 1 else 0.0,
+              "alloc_peak_kb":None,
+              "alloc_net_kb":None,
+             }
+    if bench_case["allocations"]:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        current,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result.update(alloc_peak_kb=round((peak - before)/1024,1),alloc_net_kb=round((current - before)/1024,1))
+    result.update(rss_peak_mb=peak_rss_mb(),children_rss_peak_mb=peak_rss_mb(resource.RUSAGE_CHILDREN),
+                  **bench_case["extra"])
+    return result
+
+def environment_info():
+    import swisseph as swe
+    import hd_store
+    return {"time":datetime.now().isoformat(timespec="seconds"),
+            "python":platform.python_version(),
+            "platform":platform.platform(),
+            "cpu_count":os.cpu_count(),
+            "numpy":np.__version__,
+            "swisseph":swe.version,
+            "chart_store":hd_store.get_default_store() is not None,
+           }
+
+def run(group_list=None,match=None,quick=False,verbose=True):
+    '''
+    run benchmark cases
+    Args:
+        group_list(list of str): groups of GROUP_LIST, None: all
+        match(str): only cases whose name contains match
+        quick(bool): short ranges and 1/10 of MIN_TIME (smoke run, noisy)
+    Return:
+        report(dict): "environment" and "results" (case name -> result, see measure)
+    '''
+    report = {"environment":environment_info(),"quick":quick,"results":{}}
+    for group in group_list or GROUP_LIST:
+        for bench_case in CASE_FUNC_DICT[group](quick):
+            if match and match not in bench_case["name"]:
+                continue
+            result = dict(group=group,**measure(bench_case,quick))
+            report["results"][bench_case["name"]] = result
+            if verbose:
+                print("{:14s} {:45s} {:>12.4f} ms  {:>10} KB  {:>8} MB".format(
+                      group,bench_case["name"],result["median_ms"],str(result["alloc_peak_kb"]),result["rss_peak_mb"]),
+                      flush=True)
+    return report
+
+def compare(baseline,current,threshold=REGRESSION_THRESHOLD):
+    '''
+    compare two reports of run
+    Return:
+        row_list(list of dict): name, baseline_ms, current_ms, ratio, status
+                                (ok, faster, slower, more_alloc, new, missing)
+    '''
+    row_list = []
+    base_results,current_results = baseline["results"],current["results"]
+    for name in list(base_results) + [name for name in current_results if name not in base_results]:
+        base,cur = base_results.get(name),current_results.get(name)
+        row = {"name":name,
+               "baseline_ms":base and base["median_ms"],
+               "current_ms":cur and cur["median_ms"],
+               "ratio":None,
+               "status":"missing" if cur is None else "new" if base is None else "ok"}
+        if base and cur:
+            row["ratio"] = round(cur["median_ms"]/base["median_ms"],3) if base["median_ms"] else None
+            if row["ratio"] is not None and row["ratio"] > 1 + threshold:
+                row["status"] = "slower"
+            elif row["ratio"] is not None and row["ratio"] < 1 - threshold:
+                row["status"] = "faster"
+            if (row["status"] != "slower" and base["alloc_peak_kb"] is not None and cur["alloc_peak_kb"] is not None
+                    and cur["alloc_peak_kb"] > base["alloc_peak_kb"]*(1 + threshold) + ALLOC_TOLERANCE_KB):
+                row["status"] = "more_alloc"
+        row_list.append(row)
+    return row_list
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark suite of the calculation core")
+    subparsers = parser.add_subparsers(dest="command",required=True)
+    run_parser = subparsers.add_parser("run",help="run benchmark cases")
+    run_parser.add_argument("--group",nargs="+",choices=GROUP_LIST,help="groups (default all)")
+    run_parser.add_argument("--match",help="only cases containing this text")
+    run_parser.add_argument("--quick",action="store_true",help="short smoke run")
+    run_parser.add_argument("--out",default="hd_benchmark.json",help="result file")
+    compare_parser = subparsers.add_parser("compare",help="flag regressions against a baseline")
+    compare_parser.add_argument("baseline",help="baseline result file")
+    compare_parser.add_argument("current",help="current result file")
+    compare_parser.add_argument("--threshold",type=float,default=REGRESSION_THRESHOLD,
+                                help="relative change flagged (0.1: 10%%)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.group,args.match,args.quick)
+        with open(args.out,"w") as f:
+            json.dump(report,f,indent=2)
+        print("results written to {}".format(args.out))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    row_list = compare(baseline,current,args.threshold)
+    for row in row_list:
+        print("{:45s} {:>12} {:>12} {:>8} {}".format(row["name"],str(row["baseline_ms"]),str(row["current_ms"]),
+                                                     str(row["ratio"]),row["status"]))
+    regression_list = [row["name"] for row in row_list if row["status"] in ("slower","more_alloc")]
+    print("{} regressions (threshold {:.0%})".format(len(regression_list),args.threshold))
+    return 1 if regression_list else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
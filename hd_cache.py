@@ -0,0 +1,156 @@
+"""
+bounded in-process result caches (LRU + TTL) of the api pipeline
+    place_cache:    normalized place -> (latitude,longitude)
+    offset_cache:   (zone,local time) -> utc offset (hours)
+    zone_cache:     quantized (latitude,longitude) -> timezone name
+    response_cache: utc instant -> final response
+
+    sizes and ttl (seconds) can be set by environment variables, e.g.
+    HD_CACHE_RESPONSE_SIZE=50000, HD_CACHE=0 disables all caches
+"""
+import os
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+class TTLCache:
+    '''
+    thread safe LRU cache with time to live
+    Args:
+        maxsize(int): max. entries, least recently used entry is dropped
+        ttl(float): seconds until an entry expires
+    '''
+    def __init__(self,maxsize,ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict() #key -> (expire time,value)
+        self._lock = threading.Lock()
+
+    def get(self,key,default=None):
+        ''' value of key (marked as recently used) or default if missing/expired '''
+        if not cache_enabled:
+            return default
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self,key,value):
+        if not cache_enabled:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl,value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self,key,func,*args):
+        '''
+        cached value of key, on miss func(*args) is called and stored
+        (None results are not stored)
+        '''
+        value = self.get(key)
+        if value is None:
+            value = func(*args)
+            if value is not None:
+                self.set(key,value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {"size":len(self._data),
+                "maxsize":self.maxsize,
+                "ttl":self.ttl,
+                "hits":self.hits,
+                "misses":self.misses,
+               }
+
+def env_number(name,default):
+    ''' number from environment variable or default '''
+    return type(default)(os.getenv(name,default))
+
+cache_enabled = os.getenv("HD_CACHE","1") != "0"
+#grid of zone_cache keys in degrees (0.001° ~ 100 m)
+zone_grid = env_number("HD_ZONE_GRID",0.001)
+
+place_cache = TTLCache(env_number("HD_CACHE_PLACE_SIZE",10000),
+                       env_number("HD_CACHE_PLACE_TTL",30*24*3600.0))
+offset_cache = TTLCache(env_number("HD_CACHE_OFFSET_SIZE",100000),
+                        env_number("HD_CACHE_OFFSET_TTL",24*3600.0))
+zone_cache = TTLCache(env_number("HD_CACHE_ZONE_SIZE",100000),
+                      env_number("HD_CACHE_ZONE_TTL",30*24*3600.0))
+response_cache = TTLCache(env_number("HD_CACHE_RESPONSE_SIZE",10000),
+                          env_number("HD_CACHE_RESPONSE_TTL",24*3600.0))
+CACHE_DICT = {"place":place_cache,
+              "offset":offset_cache,
+              "zone":zone_cache,
+              "response":response_cache,
+             }
+
+def set_cache_enabled(enabled):
+    ''' switch all caches on/off, entries are kept '''
+    global cache_enabled
+    cache_enabled = bool(enabled)
+
+def cache_stats():
+    ''' hit/miss counters and sizes of all caches '''
+    return {"enabled":cache_enabled,
+            **{name:cache.stats() for name,cache in CACHE_DICT.items()}}
+
+def clear_caches():
+    for cache in CACHE_DICT.values():
+        cache.clear()
+
+def normalize_place(place):
+    '''
+    cache key of place string: unicode normalized, case folded,
+    whitespace collapsed, comma separated parts stripped
+    e.g. "  berlin ,Germany " -> "berlin, germany"
+    '''
+    place = unicodedata.normalize("NFKC",place).casefold()
+    return ", ".join(" ".join(part.split()) for part in place.split(",") if part.strip())
+
+def normalize_time(birth_time):
+    '''
+    cache key of local time (year,month,day,hour,minute[,second]),
+    missing seconds are 0, overflowing seconds (e.g. 60) roll over to the next minute
+    Return:
+        tuple: (year,month,day,hour,minute,second)
+    '''
+    second = birth_time[5] if len(birth_time) > 5 else 0
+    local_time = datetime(*birth_time[:5]) + timedelta(seconds=second)
+    return local_time.timetuple()[:6]
+
+def utc_instant(birth_time,offset_hours):
+    '''
+    cache key of utc instant from local time and utc offset
+    Return:
+        tuple: (year,month,day,hour,minute,second) UTC
+    '''
+    local_time = datetime(*normalize_time(birth_time))
+    return (local_time - timedelta(hours=offset_hours)).timetuple()[:6]
+
+def quantize_coordinates(latitude,longitude):
+    '''
+    cache key of coordinates: rounded to zone_grid,
+    nearby coordinates share one timezone lookup
+    Return:
+        tuple: (latitude,longitude)
+    '''
+    return (round(round(latitude/zone_grid)*zone_grid,6),
+            round(round(longitude/zone_grid)*zone_grid,6))
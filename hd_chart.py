@@ -0,0 +1,158 @@
+"""
+compact columnar chart records
+    a chart is one record of CHART_DTYPE: 26 activations (personality first,
+    then design, planets in order of SWE_PLANET_DICT) with fixed int8/float64
+    fields. label and planet are derived from the activation index, no strings
+    are stored. ChartBatch holds N charts in one contiguous array.
+
+    as_dict() builds the date_to_gate_dict format (dict of lists) on demand,
+    for convertJSON, reports and the feature functions of hd_features.
+"""
+import hd_constants
+import hd_ephemeris
+import hd_kernels
+import numpy as np
+
+PLANET_LIST = hd_ephemeris.PLANET_LIST
+LABEL_LIST = ["prs","des"]
+N_ACTIVATIONS = len(LABEL_LIST)*len(PLANET_LIST)
+
+CHART_DTYPE = np.dtype([("activation",hd_kernels.ACTIVATION_DTYPE,(N_ACTIVATIONS,)),
+                        ("ch_gate","i1",(N_ACTIVATIONS,)), #0: no channel (see get_channels_and_active_chakras)
+                       ])
+
+def activation_label(idx):
+    ''' label (prs,des) of activation index '''
+    return LABEL_LIST[idx//len(PLANET_LIST)]
+
+def activation_planet(idx):
+    ''' planet name of activation index '''
+    return PLANET_LIST[idx%len(PLANET_LIST)]
+
+def activations_as_dict(activations,label_list):
+    '''
+    convert activations to date_to_gate_dict format (dict of lists, python types)
+    Args:
+        activations(np.array): hd_kernels.ACTIVATION_DTYPE, planets in order of SWE_PLANET_DICT
+        label_list(list of str): label of each activation
+    Return:
+        value_dict (dict): keys->[label,planets,lon,gate,line,color,tone,base]
+    '''
+    result_dict = {"label":list(label_list),
+                   "planets":[activation_planet(idx) for idx in range(len(activations))],
+                  }
+    for key in ["lon","gate","line","color","tone","base"]:
+        result_dict[key] = activations[key].tolist() #python int/float for json
+
+    return result_dict
+
+class Chart:
+    '''
+    one chart (view of a CHART_DTYPE record)
+    Args:
+        record(np.void or np.array): CHART_DTYPE record, e.g. element of ChartBatch.data
+    '''
+    __slots__ = ("record",)
+
+    def __init__(self,record):
+        self.record = record
+
+    @classmethod
+    def from_gate_dict(cls,date_to_gate_dict):
+        ''' chart from date_to_gate_dict (personality and design, 26 activations) '''
+        record = np.zeros((),dtype=CHART_DTYPE)
+        for key in hd_kernels.ACTIVATION_DTYPE.names:
+            record["activation"][key] = date_to_gate_dict[key]
+        if "ch_gate" in date_to_gate_dict:
+            record["ch_gate"] = date_to_gate_dict["ch_gate"]
+        return cls(record)
+
+    def __getitem__(self,key):
+        ''' field of all activations, e.g. chart["gate"] '''
+        if key == "ch_gate":
+            return self.record["ch_gate"]
+        return self.record["activation"][key]
+
+    def set_ch_gate(self,ch_gate_list):
+        ''' store channel gates (output of get_channels_and_active_chakras) '''
+        self.record["ch_gate"] = ch_gate_list
+
+    def as_dict(self,with_ch_gate=False):
+        '''
+        date_to_gate_dict view of the chart, built on demand
+        Args:
+            with_ch_gate(bool): add key "ch_gate"
+        Return:
+            date_to_gate_dict(dict): keys->[label,planets,lon,gate,line,color,tone,base]
+        '''
+        result_dict = activations_as_dict(self.record["activation"],
+                                          [activation_label(idx) for idx in range(N_ACTIVATIONS)])
+        if with_ch_gate:
+            result_dict["ch_gate"] = self.record["ch_gate"].tolist()
+        return result_dict
+
+class ChartBatch:
+    '''
+    N charts in one contiguous CHART_DTYPE array
+    Args:
+        data(np.array): CHART_DTYPE, shape (N,)
+    '''
+    __slots__ = ("data",)
+
+    def __init__(self,data):
+        self.data = data
+
+    @classmethod
+    def from_longitudes(cls,birth_lon,create_lon):
+        '''
+        charts from longitudes of birth and create dates
+        Args:
+            birth_lon(np.array): shape (N,len(SWE_PLANET_DICT)), see hd_ephemeris.calc_longitudes
+            create_lon(np.array): same shape, longitudes of create (design) dates
+        '''
+        data = np.zeros(len(birth_lon),dtype=CHART_DTYPE)
+        data["activation"] = hd_kernels.decompose_longitudes(np.hstack([birth_lon,create_lon]))
+        return cls(data)
+
+    @classmethod
+    def from_jd(cls,birth_jd):
+        '''
+        charts from birth julian days (UT), create dates by hd_ephemeris.calc_create_dates
+        '''
+        birth_jd = np.atleast_1d(np.asarray(birth_jd,dtype=np.float64))
+        create_jd = hd_ephemeris.calc_create_dates(birth_jd)
+        lon = hd_ephemeris.calc_longitudes(np.concatenate([birth_jd,create_jd]))
+        return cls.from_longitudes(lon[:len(birth_jd)],lon[len(birth_jd):])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self,idx):
+        ''' Chart view (int index) or ChartBatch view (slice, mask) '''
+        if isinstance(idx,(int,np.integer)):
+            return Chart(self.data[idx:idx+1].reshape(()))
+        return ChartBatch(self.data[idx])
+
+    def __iter__(self):
+        for idx in range(len(self.data)):
+            yield self[idx]
+
+    def __getattr__(self,key):
+        ''' field of all charts, e.g. batch.gate -> shape (N,26) '''
+        if key in hd_kernels.ACTIVATION_DTYPE.names:
+            return self.data["activation"][key]
+        if key == "ch_gate":
+            return self.data["ch_gate"]
+        raise AttributeError(key)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def classify(self):
+        ''' features of all charts with array operations (see hd_kernels.classify_batch) '''
+        return hd_kernels.classify_batch(self.data["activation"])
+
+    def as_dict_list(self,with_ch_gate=False):
+        ''' date_to_gate_dict of every chart (see Chart.as_dict) '''
+        return [chart.as_dict(with_ch_gate) for chart in self]
@@ -0,0 +1,294 @@
+"""
+Chebyshev compressed planetary position tables
+    build step: per body (see hd_ephemeris.BODY_CODE_LIST) the longitude is fitted
+    by Chebyshev segments over a configurable date span and written to a compact
+    binary file.
+    reader: the file is memory-mapped (shared pages for every worker process),
+    positions are evaluated for scalar or array inputs. Swiss Ephemeris is used
+    as fallback outside of the covered span or if a position is inside the guard
+    band of a gate/line(/color/tone/base) boundary.
+
+    build table from command line:
+        python hd_chebyshev.py build --start 1800 --end 2200 --out hd_positions.bin
+"""
+import hd_constants
+import hd_ephemeris
+import swisseph as swe
+import numpy as np
+import argparse
+import mmap
+import sys
+import zlib
+
+FILE_MAGIC = b"HDCHEB01"
+FILE_VERSION = 1
+
+#(segment length in days, chebyshev degree) per swe code, max. fit error ~0.01 arcsec
+SEGMENT_DICT = {0:(16,12),  #Sun
+                1:(4,14),   #Moon
+                11:(4,14),  #true Node
+                2:(8,12),   #Mercury
+                3:(16,12),  #Venus
+                4:(16,12),  #Mars
+                5:(32,14),  #Jupiter
+                6:(32,14),  #Saturn
+                7:(32,14),  #Uranus
+                8:(32,14),  #Neptune
+                9:(32,14),  #Pluto
+               }
+
+#number of divisions of the IGING circle for each activation level
+BOUNDARY_DIVISION_DICT = {"gate":64,
+                          "line":64*6,
+                          "color":64*6*6,
+                          "tone":64*6*6*6,
+                          "base":64*6*6*6*5,
+                         }
+
+HEADER_DTYPE = np.dtype([("magic","S8"),
+                         ("version","<u4"),
+                         ("n_bodies","<u4"),
+                         ("jd_start","<f8"),
+                         ("jd_end","<f8"),
+                        ])
+BODY_DTYPE = np.dtype([("code","<i4"),
+                       ("degree","<i4"),
+                       ("n_segments","<i8"),
+                       ("segment_days","<f8"),
+                       ("max_error","<f8"), #arcsec, measured at check points during build
+                       ("offset","<i8"),    #byte offset of coefficients (n_segments,degree+1)
+                      ])
+
+def fit_body(args):
+    '''
+    fit chebyshev segments of one body,
+    nodes are the chebyshev points of each segment (interpolation)
+    Args:
+        args(tuple): code(int),jd_start(float),jd_end(float)
+    Return:
+        coeffs(np.array): shape (n_segments,degree+1), longitudes unwrapped within segment
+        max_error(float): max. deviation (arcsec) from swe at one check point per segment
+    '''
+    code,jd_start,jd_end = args
+    segment_days,degree = SEGMENT_DICT[code]
+    n_segments = int(np.ceil((jd_end-jd_start)/segment_days))
+    n_nodes = degree+1
+    theta = np.pi*(np.arange(n_nodes)+0.5)/n_nodes
+    seg_start = jd_start + np.arange(n_segments)*segment_days
+    node_jd = seg_start[:,None] + (np.cos(theta)[None,:]+1)*segment_days/2
+
+    calc_ut = swe.calc_ut
+    lon = np.array([calc_ut(jdut,code)[0][0] for jdut in node_jd.ravel().tolist()])
+    lon = np.unwrap(lon.reshape(node_jd.shape),period=360,axis=1)
+    #discrete chebyshev transform of values at chebyshev points
+    coeffs = 2/n_nodes * lon @ np.cos(np.outer(np.arange(n_nodes),theta)).T
+    coeffs[:,0] /= 2
+
+    #check point inside of each segment (deterministic position, not on a node)
+    x_check = np.random.default_rng(code).uniform(-1,1,n_segments)
+    check_jd = seg_start + (x_check+1)*segment_days/2
+    check_lon = np.array([calc_ut(jdut,code)[0][0] for jdut in check_jd.tolist()])
+    diff = (clenshaw(coeffs,x_check) - check_lon + 180) % 360 - 180
+    max_error = float(np.abs(diff).max()*3600)
+
+    return coeffs,max_error
+
+def clenshaw(coeffs,x):
+    '''
+    evaluate chebyshev series row wise (vectorized clenshaw recurrence)
+    Args:
+        coeffs(np.array): shape (n,degree+1)
+        x(np.array): shape (n,), values in [-1,1]
+    Return:
+        value(np.array): shape (n,)
+    '''
+    b1 = np.zeros(len(x))
+    b2 = np.zeros(len(x))
+    for k in range(coeffs.shape[1]-1,0,-1):
+        b1,b2 = 2*x*b1 - b2 + coeffs[:,k], b1
+    return x*b1 - b2 + coeffs[:,0]
+
+def build_table(path,start_year=1800,end_year=2200,num_cpu=1):
+    '''
+    fit all bodies and write table file
+    Args:
+        path(str): output file
+        start_year(int): first covered year (jan 1st)
+        end_year(int): last covered year (jan 1st, exclusive)
+        num_cpu(int): bodies are fitted in parallel
+    Return:
+        body_table(np.array): BODY_DTYPE records of written file
+    '''
+    jd_start = swe.julday(start_year,1,1,0)
+    jd_end = swe.julday(end_year,1,1,0)
+    code_list = hd_ephemeris.BODY_CODE_LIST
+    args = [(code,jd_start,jd_end) for code in code_list]
+    if num_cpu > 1:
+        from multiprocessing import Pool
+        with Pool(num_cpu) as p:
+            fit_list = p.map(fit_body,args)
+    else:
+        fit_list = [fit_body(arg) for arg in args]
+
+    header = np.zeros(1,dtype=HEADER_DTYPE)
+    header[0] = (FILE_MAGIC,FILE_VERSION,len(code_list),jd_start,jd_end)
+    body_table = np.zeros(len(code_list),dtype=BODY_DTYPE)
+    offset = HEADER_DTYPE.itemsize + BODY_DTYPE.itemsize*len(code_list)
+    offset += -offset % 8 #align coefficients
+    data_offset = offset
+    for idx,(code,(coeffs,max_error)) in enumerate(zip(code_list,fit_list)):
+        segment_days,degree = SEGMENT_DICT[code]
+        body_table[idx] = (code,degree,len(coeffs),segment_days,max_error,offset)
+        offset += coeffs.nbytes
+
+    with open(path,"wb") as f:
+        f.write(header.tobytes())
+        f.write(body_table.tobytes())
+        f.write(b"\0"*(data_offset-f.tell()))
+        for coeffs,_ in fit_list:
+            f.write(np.ascontiguousarray(coeffs,dtype="<f8").tobytes())
+
+    return body_table
+
+class ChebyshevTable:
+    '''
+    memory-mapped reader of a chebyshev position table (see build_table)
+    positions are returned in the same format as hd_ephemeris.calc_body_positions,
+    therefore an instance can be used as position source of hd_ephemeris:
+        hd_ephemeris.use_position_table(ChebyshevTable("hd_positions.bin"))
+    Args:
+        path(str): table file
+        guard_arcsec(float): positions closer than guard band to a boundary are
+                             calculated by swe (at least 4x max. fit error of body,
+                             swe itself has small kinks, which are not fitted)
+        boundary(str): boundary level of guard band, key of BOUNDARY_DIVISION_DICT
+    '''
+    def __init__(self,path,guard_arcsec=10.0,boundary="line"):
+        self.path = path
+        with open(path,"rb") as f:
+            self._mmap = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mmap,dtype=HEADER_DTYPE,count=1)[0]
+        if (header["magic"] != FILE_MAGIC) | (header["version"] != FILE_VERSION):
+            raise ValueError("{} is no chebyshev table (version {})".format(path,FILE_VERSION))
+        self.jd_start = float(header["jd_start"])
+        self.jd_end = float(header["jd_end"])
+        self.body_table = np.frombuffer(self._mmap,dtype=BODY_DTYPE,
+                                        count=int(header["n_bodies"]),
+                                        offset=HEADER_DTYPE.itemsize).copy()
+        if list(self.body_table["code"]) != hd_ephemeris.BODY_CODE_LIST:
+            raise ValueError("bodies of {} do not match SWE_PLANET_DICT, rebuild table".format(path))
+        #zero copy views of coefficients
+        self.coeffs = [np.frombuffer(self._mmap,dtype="<f8",
+                                     count=int(body["n_segments"]*(body["degree"]+1)),
+                                     offset=int(body["offset"])).reshape(int(body["n_segments"]),-1)
+                       for body in self.body_table]
+        self.division = BOUNDARY_DIVISION_DICT[boundary]
+        self.guard = np.maximum(guard_arcsec,4*self.body_table["max_error"])/3600 #degree
+        self.guard_arcsec = guard_arcsec
+        self.boundary = boundary
+        self._source_key = None
+
+    @property
+    def source_key(self):
+        ''' checksum of table file, guard band and boundary level (see hd_ephemeris.position_source_key) '''
+        if self._source_key is None:
+            self._source_key = "chebyshev:{:08x}:{}:{}".format(zlib.crc32(self._mmap),self.guard_arcsec,self.boundary)
+        return self._source_key
+
+    def covers(self,jd_array):
+        ''' bool mask, which julian days are inside of table span '''
+        jd_array = np.asarray(jd_array,dtype=np.float64)
+        return (jd_array >= self.jd_start) & (jd_array < self.jd_end)
+
+    def eval_body(self,idx,jd_array,with_speed=False):
+        '''
+        evaluate chebyshev segments of one body (no fallback, jd must be covered)
+        Args:
+            idx(int): index of body in hd_ephemeris.BODY_CODE_LIST
+            jd_array(np.array): julian days (UT)
+            with_speed(bool): additionally return longitude speed (°/day)
+        Return:
+            lon(np.array): longitudes in [0,360)
+            speed(np.array): only if with_speed
+        '''
+        segment_days = self.body_table["segment_days"][idx]
+        rel = (jd_array - self.jd_start)/segment_days
+        seg = np.minimum(rel.astype(np.int64),len(self.coeffs[idx])-1)
+        x = 2*(rel-seg) - 1
+        coeffs = self.coeffs[idx][seg]
+        lon = clenshaw(coeffs,x) % 360
+        if with_speed:
+            speed = clenshaw(np.polynomial.chebyshev.chebder(coeffs,axis=1),x)*2/segment_days
+            return lon,speed
+        return lon
+
+    def calc_body_positions(self,jd_array,with_speed=False):
+        '''
+        longitudes (and speeds) of all distinct bodies,
+        same format as hd_ephemeris.calc_body_positions
+        swe is used outside of the table span and inside of the guard band of boundaries
+        '''
+        jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+        n_bodies = len(self.coeffs)
+        lon = np.empty((len(jd_array),n_bodies))
+        speed = np.empty_like(lon)
+        covered = self.covers(jd_array)
+        if not covered.all():
+            lon[~covered],speed[~covered] = hd_ephemeris.calc_body_positions_swe(
+                jd_array[~covered],with_speed=True)
+        jd_covered = jd_array[covered]
+        covered_rows = np.flatnonzero(covered)
+        offset = hd_constants.IGING_offset
+        calc_ut = swe.calc_ut
+        for idx,code in enumerate(hd_ephemeris.BODY_CODE_LIST):
+            if with_speed:
+                body_lon,body_speed = self.eval_body(idx,jd_covered,with_speed=True)
+                speed[covered,idx] = body_speed
+            else:
+                body_lon = self.eval_body(idx,jd_covered)
+            #distance to next boundary (opposite points are shifted by a multiple of a base)
+            pos = ((body_lon + offset) % 360)*self.division/360
+            dist = np.abs(pos - np.round(pos))*360/self.division
+            for row in np.flatnonzero(dist < self.guard[idx]).tolist():
+                xx = calc_ut(float(jd_covered[row]),code)[0]
+                body_lon[row] = xx[0]
+                if with_speed:
+                    speed[covered_rows[row],idx] = xx[3]
+            lon[covered,idx] = body_lon
+
+        if with_speed:
+            return lon,speed
+        return lon
+
+    def close(self):
+        self.coeffs = []
+        self._mmap.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="chebyshev planetary position tables")
+    subparsers = parser.add_subparsers(dest="command",required=True)
+    build_parser = subparsers.add_parser("build",help="fit and write table file")
+    build_parser.add_argument("--start",type=int,default=1800,help="first year")
+    build_parser.add_argument("--end",type=int,default=2200,help="last year (exclusive)")
+    build_parser.add_argument("--out",default="hd_positions.bin",help="output file")
+    build_parser.add_argument("--num-cpu",type=int,default=1,help="bodies fitted in parallel")
+    info_parser = subparsers.add_parser("info",help="print table summary")
+    info_parser.add_argument("path",help="table file")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_table(args.out,args.start,args.end,args.num_cpu)
+        path = args.out
+    else:
+        path = args.path
+    table = ChebyshevTable(path)
+    print("span: {} - {} (jd {} - {})".format(swe.revjul(table.jd_start)[:3],
+                                              swe.revjul(table.jd_end)[:3],
+                                              table.jd_start,table.jd_end))
+    for body in table.body_table:
+        print("code {:2d}: {:7d} segments of {:4.0f} days, degree {:2d}, max. error {:.4f} arcsec".format(
+            body["code"],body["n_segments"],body["segment_days"],body["degree"],body["max_error"]))
+    table.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
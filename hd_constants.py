@@ -2,6 +2,8 @@
 synchronize IGING and zodiac circle ->58°
     Human design systems start at gate 41, Aries, (source :Ra Uru BlackBook)
 """
+import zlib
+
 IGING_offset = 58  
 
 # codes from swe-> dict([[i,swe.get_planet_name(i)] for i in range(0,23)])
@@ -210,4 +212,12 @@ awareness_stream_group_dict = {
 								"Knowledge":"Anja",
 								"Understand":"Anja"
 								}
-                        
\ No newline at end of file
+
+"""
+version of the chart constants (crc32), changes if gates, channels, planets or offset change
+    used to invalidate encoded/stored charts (hd_features.encode_chart, hd_store)
+"""
+CONSTANTS_VERSION = zlib.crc32(repr((IGING_offset,
+                                     SWE_PLANET_DICT,
+                                     IGING_CIRCLE_LIST,
+                                     GATES_CHAKRA_DICT)).encode())
@@ -0,0 +1,304 @@
+"""
+batch ephemeris engine for human design calculations
+    planetary longitudes are calculated for arrays of julian days (UT).
+    Earth and South_Node share their swe code with Sun and North_Node
+    (see hd_constants.SWE_PLANET_DICT), so every distinct body is calculated
+    only once and the opposite points are derived (+180°).
+"""
+import hd_constants
+import hd_metrics
+import swisseph as swe
+import numpy as np
+
+#planet names in the order of SWE_PLANET_DICT (columns of the longitude arrays)
+PLANET_LIST = list(hd_constants.SWE_PLANET_DICT.keys())
+
+#planets that are derived from the opposite position of another planet
+OPPOSITE_PLANET_DICT = {"Earth":"Sun",
+                        "South_Node":"North_Node",
+                       }
+
+#distinct swe codes, each body is calculated once
+BODY_CODE_LIST = list(dict.fromkeys(hd_constants.SWE_PLANET_DICT.values()))
+
+#optional position source instead of swe (e.g. hd_chebyshev.ChebyshevTable)
+_position_table = None
+
+def calc_body_positions_swe(jd_array,with_speed=False):
+    '''
+    calculate longitude (and speed) of every distinct swe body
+        uses swiss_ephemeris lib www.astro.com #astrodienst for calculation
+    Args:
+        jd_array(array like): timestamps in julian day format (UT)
+        with_speed(bool): additionally return longitude speed (°/day)
+    Return:
+        lon(np.array): shape (len(jd_array),len(BODY_CODE_LIST)), longitudes
+        speed(np.array): same shape, only if with_speed
+    '''
+    jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+    lon = np.empty((len(jd_array),len(BODY_CODE_LIST)),dtype=np.float64)
+    speed = np.empty_like(lon)
+    calc_ut = swe.calc_ut
+    jd_list = jd_array.tolist() #python floats are faster to pass to swe
+
+    #jd in outer loop: swe reuses earth position/nutation of the same jd for all bodies
+    for row,jdut in enumerate(jd_list):
+        xx_list = [calc_ut(jdut,code)[0] for code in BODY_CODE_LIST] #default flags
+        lon[row] = [xx[0] for xx in xx_list]
+        speed[row] = [xx[3] for xx in xx_list]
+
+    if with_speed:
+        return lon,speed
+    return lon
+
+def use_position_table(table):
+    '''
+    set position source of calc_body_positions
+    Args:
+        table: object with method calc_body_positions(jd_array,with_speed) 
+               (e.g. hd_chebyshev.ChebyshevTable) or None for swiss ephemeris only
+    '''
+    global _position_table
+    _position_table = table
+    _design_cache.clear() #design dates of the previous source
+
+def position_source_key():
+    '''
+    key of the current position source, results stored across processes
+    (e.g. hd_store) must not be mixed between sources
+    Return:
+        key(str): "swe" or source_key of the position table (e.g. checksum of a ChebyshevTable)
+    '''
+    if _position_table is None:
+        return "swe"
+    return getattr(_position_table,"source_key",type(_position_table).__name__)
+
+def calc_body_positions(jd_array,with_speed=False):
+    '''
+    calculate longitude (and speed) of every distinct swe body,
+        source is the position table if set (see use_position_table), 
+        else swiss_ephemeris lib (calc_body_positions_swe)
+    Args:
+        jd_array(array like): timestamps in julian day format (UT)
+        with_speed(bool): additionally return longitude speed (°/day)
+    Return:
+        lon(np.array): shape (len(jd_array),len(BODY_CODE_LIST)), longitudes
+        speed(np.array): same shape, only if with_speed
+    '''
+    if _position_table is not None:
+        return _position_table.calc_body_positions(jd_array,with_speed)
+    return calc_body_positions_swe(jd_array,with_speed)
+
+def calc_longitudes(jd_array,with_speed=False):
+    '''
+    calculate longitudes of all planets of SWE_PLANET_DICT for given julian days
+        Earth and South_Node are derived from Sun and North_Node (opp. pos.)
+    Args:
+        jd_array(array like): timestamps in julian day format (UT)
+        with_speed(bool): additionally return longitude speed (°/day)
+    Return:
+        lon(np.array): shape (len(jd_array),len(PLANET_LIST)),
+                       columns in order of PLANET_LIST
+        speed(np.array): same shape, only if with_speed
+    '''
+    if with_speed:
+        body_lon,body_speed = calc_body_positions(jd_array,with_speed=True)
+    else:
+        body_lon = calc_body_positions(jd_array)
+    cols = [BODY_CODE_LIST.index(code) for code in hd_constants.SWE_PLANET_DICT.values()]
+    lon = body_lon[:,cols]
+    for planet in OPPOSITE_PLANET_DICT.keys():
+        idx = PLANET_LIST.index(planet)
+        lon[:,idx] = (lon[:,idx]+180) % 360 #opp. pos., angles max 360°
+
+    if with_speed:
+        return lon,body_speed[:,cols]
+    return lon
+
+def timestamps_to_jd(timestamp_list):
+    '''
+    calculate julian days (UT) from list of timestamps
+        same conversion as hd_features.timestamp_to_juldate
+    Args:
+        timestamp_list(list of tuple): format: year,month,day,hour,minute,second,tz_offset
+    Return:
+        jd_array(np.array): julian days (UT)
+    '''
+    utc_time_zone = swe.utc_time_zone
+    utc_to_jd = swe.utc_to_jd
+    return np.array([utc_to_jd(*utc_time_zone(*time_stamp))[1] 
+                     for time_stamp in timestamp_list],dtype=np.float64)
+
+@hd_metrics.timed("create_date")
+def calc_create_date(jdut):
+    ''' 
+    calculate creation date from birth data:
+        #->sun position -88° long, aprox. 3 months before (#source -> Ra Uru BlackBook)
+    For calculation swiss_ephemeris lib is used 
+    Args: 
+       julian date(float): timestamp in julian day format
+    Return: 
+        creation date (float): timestamp in julian day format
+    '''
+    design_pos = 88 
+    sun_long =  swe.calc_ut(jdut, swe.SUN)[0][0]
+    long = swe.degnorm(sun_long - design_pos) 
+    tstart = jdut - 100 #aproximation is start -100°
+    res = swe.solcross_ut(long, tstart)
+    create_date = swe.revjul(res)
+    create_julday = swe.julday(*create_date)
+    
+    return create_julday
+
+#design (create) date: sun position -88° long.
+DESIGN_POS = 88
+#max. deviation of calc_create_dates from calc_create_date (solcross_ut) in days (~1ms)
+CREATE_DATE_TOLERANCE = 1e-8
+#newton error after step <= factor*step**2 + speed_error*step 
+#   (sun accel. < 0.0005°/day², speed > 0.95°/day, rel. error of swe speed < 1e-5)
+NEWTON_ERROR_FACTOR = 0.0005/(2*0.95)
+NEWTON_SPEED_ERROR = 1e-5
+#max. newton steps (3-4 needed), not converged elements are solved by calc_create_date
+NEWTON_MAX_STEPS = 12
+#max. entries of design date cache, cache is cleared if full
+DESIGN_CACHE_SIZE = 2**20
+
+#birth UT minute -> (birth julian day,create julian day), see calc_create_dates
+_design_cache = {}
+#inverse solar longitude table: sun longitude -> days sun needs for the last 88°
+_design_elapsed_table = None
+
+def calc_sun_positions(jd_array):
+    '''
+    longitude and speed of the sun for given julian days,
+    position table is used if set (see use_position_table)
+    Args:
+        jd_array(array like): timestamps in julian day format (UT)
+    Return:
+        lon(np.array): longitudes
+        speed(np.array): longitude speed (°/day)
+    '''
+    jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+    lon = np.empty(len(jd_array))
+    speed = np.empty(len(jd_array))
+    swe_mask = np.ones(len(jd_array),dtype=bool)
+    if hasattr(_position_table,"eval_body"):
+        covered = _position_table.covers(jd_array)
+        if covered.any():
+            lon[covered],speed[covered] = _position_table.eval_body(
+                BODY_CODE_LIST.index(swe.SUN),jd_array[covered],with_speed=True)
+        swe_mask = ~covered
+    for idx in np.flatnonzero(swe_mask).tolist():
+        xx = swe.calc_ut(float(jd_array[idx]),swe.SUN)[0]
+        lon[idx] = xx[0]
+        speed[idx] = xx[3]
+
+    return lon,speed
+
+def get_design_elapsed_table():
+    '''
+    inverse solar longitude table (calculated once):
+        days the sun needs for the last DESIGN_POS degrees before reaching a longitude,
+        tabulated for every degree (reference year J2000)
+    Return:
+        lon_grid(np.array): longitudes 0..359
+        elapsed(np.array): days
+    '''
+    global _design_elapsed_table
+    if _design_elapsed_table is None:
+        jd_ref = 2451545.0 #J2000
+        t = jd_ref + np.arange(500.0) #one year + DESIGN_POS
+        lon = np.unwrap([swe.calc_ut(float(jdut),swe.SUN)[0][0] for jdut in t],period=360)
+        lon_grid = np.ceil(lon[0]) + DESIGN_POS + np.arange(360.0)
+        elapsed = np.interp(lon_grid,lon,t) - np.interp(lon_grid-DESIGN_POS,lon,t)
+        order = np.argsort(lon_grid % 360)
+        _design_elapsed_table = (lon_grid[order] % 360),elapsed[order]
+    return _design_elapsed_table
+
+@hd_metrics.timed("create_date")
+def calc_create_dates(jd_array,use_cache=True):
+    ''' 
+    vectorized calculation of creation dates (sun position -88° long.)
+        start value from inverse solar longitude table (get_design_elapsed_table)
+        or from cached result of the same/neighbouring birth UT minute,
+        refined by newton steps until deviation < CREATE_DATE_TOLERANCE
+        (with position table the deviation is limited by the sun accuracy of the table),
+        elements not converged after NEWTON_MAX_STEPS are solved by calc_create_date
+    Args: 
+       jd_array(array like): birth timestamps in julian day format (UT)
+       use_cache(bool): read and update design date cache
+    Return: 
+        create_jd(np.array): creation dates in julian day format
+    '''
+    jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+    create_jd = np.empty(len(jd_array))
+    guess = np.full(len(jd_array),np.nan)
+    solve = np.ones(len(jd_array),dtype=bool)
+    minute_list = np.floor(jd_array*1440).astype(np.int64).tolist()
+
+    if use_cache:
+        for idx,(jdut,minute) in enumerate(zip(jd_array.tolist(),minute_list)):
+            for key in (minute,minute-1,minute+1):
+                cached = _design_cache.get(key)
+                if cached is not None:
+                    break
+            else:
+                continue
+            birth_jd,design_jd = cached
+            if birth_jd == jdut:
+                create_jd[idx] = design_jd
+                solve[idx] = False
+            else:
+                guess[idx] = design_jd + (jdut-birth_jd) #sun speed ratio ~1
+
+    idx_solve = np.flatnonzero(solve)
+    if len(idx_solve):
+        jd = jd_array[idx_solve]
+        sun_lon,_ = calc_sun_positions(jd)
+        target = (sun_lon - DESIGN_POS) % 360
+        t = guess[idx_solve]
+        no_guess = np.isnan(t)
+        lon_grid,elapsed = get_design_elapsed_table()
+        t[no_guess] = jd[no_guess] - np.interp(sun_lon[no_guess],lon_grid,elapsed,period=360)
+        active = np.arange(len(t))
+        failed_list = []
+        for _ in range(NEWTON_MAX_STEPS):
+            if not len(active):
+                break
+            lon,speed = calc_sun_positions(t[active])
+            step = ((target[active] - lon + 180) % 360 - 180)/speed
+            t[active] += step
+            error_bound = NEWTON_ERROR_FACTOR*step**2 + NEWTON_SPEED_ERROR*np.abs(step)
+            finite = np.isfinite(error_bound)
+            failed_list.append(active[~finite])
+            active = active[finite & (error_bound >= CREATE_DATE_TOLERANCE)]
+        #not converged (e.g. bad table values, position table noise), raises for invalid birth dates
+        for idx in np.concatenate(failed_list + [active]).tolist():
+            t[idx] = calc_create_date(float(jd[idx]))
+        create_jd[idx_solve] = t
+
+        if use_cache:
+            if len(_design_cache) + len(idx_solve) > DESIGN_CACHE_SIZE:
+                _design_cache.clear()
+            for idx,jdut,design_jd in zip(idx_solve.tolist(),jd.tolist(),t.tolist()):
+                _design_cache[minute_list[idx]] = (jdut,design_jd)
+
+    return create_jd
+
+def verify_create_dates(jd_array,tolerance=CREATE_DATE_TOLERANCE):
+    '''
+    check calc_create_dates against calc_create_date (swe.solcross_ut)
+    Args:
+        jd_array(array like): birth timestamps in julian day format (UT)
+        tolerance(float): max. allowed deviation in days
+    Return:
+        max_deviation(float): days
+    Raise:
+        ValueError: if deviation is bigger than tolerance
+    '''
+    jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+    reference = np.array([calc_create_date(jdut) for jdut in jd_array.tolist()])
+    max_deviation = float(np.abs(calc_create_dates(jd_array,use_cache=False) - reference).max())
+    if max_deviation > tolerance:
+        raise ValueError("create date deviation {} days > tolerance {} days".format(max_deviation,tolerance))
+    return max_deviation
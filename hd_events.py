@@ -0,0 +1,422 @@
+"""
+gate/line boundary crossing event index
+    for every distinct body of SWE_PLANET_DICT the exact UT instants of all
+    crossings of gate/line boundaries of the IGING circle are precalculated
+    (retrograde re-crossings included) and stored in a compact binary file.
+    Earth and South_Node are derived (opposite point = +192 lines).
+
+    activations (gate,line) of any instant inside the covered span are then a
+    binary search in the memory-mapped event arrays, design activations are the
+    same search at the design instant.
+    crossing instants are exact to CROSSING_TOLERANCE (true node: ~1s, the
+    osculating node position of swe jitters close to a boundary).
+
+    build index from command line:
+        python hd_events.py build --start 1900 --end 2100 --out hd_events.bin
+        python hd_events.py at hd_events.bin 2024 5 17 12 30
+"""
+import hd_constants
+import hd_ephemeris
+import swisseph as swe
+import numpy as np
+import argparse
+import mmap
+import sys
+
+FILE_MAGIC = b"HDEVNT01"
+FILE_VERSION = 1
+
+#lines of the IGING circle, boundary index k is the start of line index k
+LINE_DIVISION = 64*6
+#opposite point (Earth,South_Node) in lines
+OPPOSITE_LINES = LINE_DIVISION//2
+#precision of crossing instants in days (~1ms)
+CROSSING_TOLERANCE = 1e-8
+#max. days between design and birth date (sun -88°), first births of an index with a design date inside
+DESIGN_MAX_DAYS = 93
+#days of index build per task (multiprocessing)
+BUILD_CHUNK_DAYS = 3650
+
+#sample step (days) per swe code, a station between two samples is found by speed sign
+STEP_DICT = {0:0.5,   #Sun
+             1:0.05,  #Moon
+             11:0.25, #true Node (wobbles, short periods)
+             2:0.25,  #Mercury
+             3:0.5,   #Venus
+             4:1.0,   #Mars
+             5:2.0,   #Jupiter
+             6:2.0,   #Saturn
+             7:2.0,   #Uranus
+             8:2.0,   #Neptune
+             9:2.0,   #Pluto
+            }
+
+HEADER_DTYPE = np.dtype([("magic","S8"),
+                         ("version","<u4"),
+                         ("n_bodies","<u4"),
+                         ("division","<u4"),
+                         ("pad","<u4"),
+                         ("jd_start","<f8"),
+                         ("jd_end","<f8"),
+                        ])
+BODY_DTYPE = np.dtype([("code","<i4"),
+                       ("start_index","<i4"), #line index at jd_start
+                       ("n_events","<i8"),
+                       ("time_offset","<i8"), #float64 crossing instants (UT)
+                       ("index_offset","<i8"),#uint16 line index after crossing
+                      ])
+
+def lon_to_line_pos(lon):
+    ''' longitude -> position on IGING circle in lines (float, [0,384)) '''
+    return ((np.asarray(lon) + hd_constants.IGING_offset) % 360)*LINE_DIVISION/360
+
+def body_positions(code,jd_array):
+    ''' longitude and speed of one body (swe, default flags) '''
+    lon = np.empty(len(jd_array))
+    speed = np.empty(len(jd_array))
+    calc_ut = swe.calc_ut
+    for idx,jdut in enumerate(np.asarray(jd_array,dtype=np.float64).tolist()):
+        xx = calc_ut(jdut,code)[0]
+        lon[idx] = xx[0]
+        speed[idx] = xx[3]
+    return lon,speed
+
+def find_stations(code,lo,hi,speed_lo):
+    ''' bisection of speed sign change (vectorized), returns station instants '''
+    lo = np.array(lo,dtype=np.float64)
+    hi = np.array(hi,dtype=np.float64)
+    sign_lo = np.sign(speed_lo)
+    while len(lo) and (hi-lo).max() > CROSSING_TOLERANCE:
+        mid = (lo+hi)/2
+        _,speed = body_positions(code,mid)
+        same = np.sign(speed) == sign_lo
+        lo = np.where(same,mid,lo)
+        hi = np.where(same,hi,mid)
+    return (lo+hi)/2
+
+def find_crossings(code,lo,hi,boundary,direction):
+    '''
+    safeguarded newton search (vectorized) of boundary crossing instants
+    Args:
+        code(int): swe code
+        lo,hi(np.array): bracket of each crossing (motion is monotonic inside)
+        boundary(np.array): boundary in lines
+        direction(np.array): +1 direct, -1 retrograde motion
+    Return:
+        crossing instants(np.array)
+    '''
+    lo = np.array(lo,dtype=np.float64)
+    hi = np.array(hi,dtype=np.float64)
+    t = (lo+hi)/2
+    active = np.arange(len(t))
+    while len(active):
+        lon,speed = body_positions(code,t[active])
+        #signed distance to boundary in motion direction, negative before crossing
+        dist = ((lon_to_line_pos(lon) - boundary[active] + OPPOSITE_LINES) % LINE_DIVISION
+                - OPPOSITE_LINES)*direction[active]
+        before = dist < 0
+        lo[active] = np.where(before,t[active],lo[active])
+        hi[active] = np.where(before,hi[active],t[active])
+        with np.errstate(divide="ignore",invalid="ignore"):
+            t_new = t[active] - dist/(np.abs(speed)*LINE_DIVISION/360)
+        outside = ~((t_new > lo[active]) & (t_new < hi[active]))
+        t_new[outside] = (lo[active][outside] + hi[active][outside])/2
+        step = np.abs(t_new - t[active])
+        t[active] = t_new
+        active = active[(step > CROSSING_TOLERANCE) & (hi[active]-lo[active] > CROSSING_TOLERANCE)]
+    return t
+
+def scan_body(args):
+    '''
+    find all line boundary crossings of one body in given span
+    Args:
+        args(tuple): code(int),jd_start(float),jd_end(float)
+    Return:
+        times(np.array): crossing instants, sorted
+        index(np.array): line index after each crossing
+    '''
+    code,jd_start,jd_end = args
+    step = STEP_DICT[code]
+    t = np.append(np.arange(jd_start,jd_end,step),jd_end)
+    lon,speed = body_positions(code,t)
+    pos = lon_to_line_pos(lon)
+
+    #monotonic pieces: sample intervals, split at stations
+    piece_start = [t[:-1]]
+    piece_end = [t[1:]]
+    station_mask = np.sign(speed[:-1]) != np.sign(speed[1:])
+    if station_mask.any():
+        stations = find_stations(code,t[:-1][station_mask],t[1:][station_mask],speed[:-1][station_mask])
+        piece_end[0] = np.where(station_mask,np.nan,piece_end[0])
+        piece_start += [t[:-1][station_mask],stations]
+        piece_end += [stations,t[1:][station_mask]]
+    piece_start = np.concatenate(piece_start)
+    piece_end = np.concatenate(piece_end)
+    valid = ~np.isnan(piece_end)
+    piece_start = piece_start[valid]
+    piece_end = piece_end[valid]
+
+    #line positions at piece ends, only pieces with boundary crossings are solved
+    pos_start = np.interp(piece_start,t,pos) #exact for sample points
+    pos_end = np.interp(piece_end,t,pos)
+    new_points = ~np.isin(piece_start,t) | ~np.isin(piece_end,t)
+    if new_points.any():
+        points = np.unique(np.concatenate([piece_start[new_points],piece_end[new_points]]))
+        points = points[~np.isin(points,t)]
+        point_pos = lon_to_line_pos(body_positions(code,points)[0])
+        lookup = dict(zip(points.tolist(),point_pos.tolist()))
+        pos_start = np.array([lookup.get(x,p) for x,p in zip(piece_start.tolist(),pos_start.tolist())])
+        pos_end = np.array([lookup.get(x,p) for x,p in zip(piece_end.tolist(),pos_end.tolist())])
+    delta = (pos_end - pos_start + OPPOSITE_LINES) % LINE_DIVISION - OPPOSITE_LINES
+    pos_end_unwrapped = pos_start + delta
+    first = np.where(delta > 0,np.floor(pos_start)+1,np.floor(pos_end_unwrapped)+1)
+    last = np.where(delta > 0,np.floor(pos_end_unwrapped),np.floor(pos_start))
+    n_cross = np.maximum(last-first+1,0).astype(np.int64)
+
+    piece_idx = np.repeat(np.arange(len(n_cross)),n_cross)
+    boundary = np.repeat(first,n_cross) + (np.arange(n_cross.sum())
+                                           - np.repeat(np.cumsum(n_cross)-n_cross,n_cross))
+    direction = np.sign(delta[piece_idx])
+    times = find_crossings(code,piece_start[piece_idx],piece_end[piece_idx],
+                           boundary % LINE_DIVISION,direction)
+    #line index after crossing: boundary line (direct) or line before (retrograde)
+    index = np.where(direction > 0,boundary,boundary-1) % LINE_DIVISION
+    order = np.argsort(times,kind="stable")
+
+    return times[order],index[order].astype(np.uint16)
+
+def build_index(path,start_year=1900,end_year=2100,num_cpu=1):
+    '''
+    scan all bodies and write event index file
+    Args:
+        path(str): output file
+        start_year(int): first covered year (jan 1st)
+        end_year(int): last covered year (jan 1st, exclusive)
+        num_cpu(int): time chunks are scanned in parallel
+    Return:
+        body_table(np.array): BODY_DTYPE records of written file
+    '''
+    jd_start = swe.julday(start_year,1,1,0)
+    jd_end = swe.julday(end_year,1,1,0)
+    code_list = hd_ephemeris.BODY_CODE_LIST
+    chunk_edges = np.append(np.arange(jd_start,jd_end,BUILD_CHUNK_DAYS),jd_end)
+    args = [(code,a,b) for code in code_list for a,b in zip(chunk_edges[:-1],chunk_edges[1:])]
+    if num_cpu > 1:
+        from multiprocessing import Pool
+        with Pool(num_cpu) as p:
+            chunk_list = p.map(scan_body,args,chunksize=1)
+    else:
+        chunk_list = [scan_body(arg) for arg in args]
+
+    n_chunks = len(chunk_edges)-1
+    event_list = []
+    for idx,code in enumerate(code_list):
+        chunks = chunk_list[idx*n_chunks:(idx+1)*n_chunks]
+        times = np.concatenate([chunk[0] for chunk in chunks])
+        index = np.concatenate([chunk[1] for chunk in chunks])
+        start_index = int(lon_to_line_pos(body_positions(code,[jd_start])[0])[0])
+        event_list.append((code,start_index,times,index))
+
+    header = np.zeros(1,dtype=HEADER_DTYPE)
+    header[0] = (FILE_MAGIC,FILE_VERSION,len(code_list),LINE_DIVISION,0,jd_start,jd_end)
+    body_table = np.zeros(len(code_list),dtype=BODY_DTYPE)
+    offset = HEADER_DTYPE.itemsize + BODY_DTYPE.itemsize*len(code_list)
+    offset += -offset % 8
+    data_offset = offset
+    for idx,(code,start_index,times,index) in enumerate(event_list):
+        time_offset = offset
+        index_offset = time_offset + times.nbytes
+        offset = index_offset + index.nbytes
+        offset += -offset % 8
+        body_table[idx] = (code,start_index,len(times),time_offset,index_offset)
+
+    with open(path,"wb") as f:
+        f.write(header.tobytes())
+        f.write(body_table.tobytes())
+        for (_,_,times,index),body in zip(event_list,body_table):
+            f.write(b"\0"*(int(body["time_offset"])-f.tell()))
+            f.write(times.astype("<f8").tobytes())
+            f.write(index.astype("<u2").tobytes())
+
+    return body_table
+
+class EventIndex:
+    '''
+    memory-mapped reader of a boundary crossing event index (see build_index)
+    Args:
+        path(str): index file
+    '''
+    def __init__(self,path):
+        self.path = path
+        with open(path,"rb") as f:
+            self._mmap = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mmap,dtype=HEADER_DTYPE,count=1).copy()[0]
+        if (header["magic"] != FILE_MAGIC) | (header["version"] != FILE_VERSION):
+            raise ValueError("{} is no event index (version {})".format(path,FILE_VERSION))
+        self.jd_start = float(header["jd_start"])
+        self.jd_end = float(header["jd_end"])
+        self.body_table = np.frombuffer(self._mmap,dtype=BODY_DTYPE,
+                                        count=int(header["n_bodies"]),
+                                        offset=HEADER_DTYPE.itemsize).copy()
+        if list(self.body_table["code"]) != hd_ephemeris.BODY_CODE_LIST:
+            raise ValueError("bodies of {} do not match SWE_PLANET_DICT, rebuild index".format(path))
+        #zero copy views of event arrays
+        self.times = [np.frombuffer(self._mmap,dtype="<f8",count=int(body["n_events"]),
+                                    offset=int(body["time_offset"]))
+                      for body in self.body_table]
+        self.index = [np.frombuffer(self._mmap,dtype="<u2",count=int(body["n_events"]),
+                                    offset=int(body["index_offset"]))
+                      for body in self.body_table]
+        #column of distinct body and line shift for every planet of SWE_PLANET_DICT
+        self.planet_body = [hd_ephemeris.BODY_CODE_LIST.index(code)
+                            for code in hd_constants.SWE_PLANET_DICT.values()]
+        self.planet_shift = [OPPOSITE_LINES if planet in hd_ephemeris.OPPOSITE_PLANET_DICT else 0
+                             for planet in hd_constants.SWE_PLANET_DICT.keys()]
+        self.iging_array = np.array(hd_constants.IGING_CIRCLE_LIST)
+
+    def covers(self,jd_array):
+        ''' bool mask, which julian days are inside of index span '''
+        jd_array = np.asarray(jd_array,dtype=np.float64)
+        return (jd_array >= self.jd_start) & (jd_array < self.jd_end)
+
+    def body_line_index(self,idx,jd_array):
+        ''' line index [0,384) of one distinct body (binary search) '''
+        pos = np.searchsorted(self.times[idx],jd_array,side="right") - 1
+        start_index = int(self.body_table["start_index"][idx])
+        if not len(self.index[idx]):
+            return np.full(len(jd_array),start_index,dtype=np.int64)
+        return np.where(pos >= 0,self.index[idx][np.maximum(pos,0)],start_index).astype(np.int64)
+
+    def line_index_at(self,jd_array):
+        '''
+        line index of all planets of SWE_PLANET_DICT
+        Args:
+            jd_array(array like): julian days (UT), inside of index span
+        Return:
+            line_index(np.array): shape (len(jd_array),len(SWE_PLANET_DICT))
+        '''
+        jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+        if not self.covers(jd_array).all():
+            raise ValueError("julian day outside of event index span {} - {}".format(
+                self.jd_start,self.jd_end))
+        body_index = np.column_stack([self.body_line_index(idx,jd_array)
+                                      for idx in range(len(self.body_table))])
+        return (body_index[:,self.planet_body] + self.planet_shift) % LINE_DIVISION
+
+    def activations_at(self,jd_array):
+        '''
+        gate and line of all planets of SWE_PLANET_DICT
+        Args:
+            jd_array(array like): julian days (UT), inside of index span
+        Return:
+            gate(np.array): shape (len(jd_array),len(SWE_PLANET_DICT))
+            line(np.array): same shape
+        '''
+        line_index = self.line_index_at(jd_array)
+        return self.iging_array[line_index//6],line_index%6+1
+
+    def chart_covers(self,jd_array):
+        '''
+        bool mask, which birth julian days have birth and design date inside of index span
+            (design date up to DESIGN_MAX_DAYS before birth, early births of the span are not covered)
+        '''
+        jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+        covered = self.covers(jd_array)
+        if covered.any():
+            covered[covered] = self.covers(hd_ephemeris.calc_create_dates(jd_array[covered]))
+        return covered
+
+    def chart_at(self,jd_array):
+        '''
+        personality and design activations (gate,line), design at sun -88°
+        Args:
+            jd_array(array like): birth julian days (UT), birth and design date must be
+                                  inside of index span (see chart_covers)
+        Return:
+            gate(np.array): shape (len(jd_array),2*len(SWE_PLANET_DICT)), personality first
+            line(np.array): same shape
+        Raise:
+            ValueError: if a birth or design date is outside of index span
+        '''
+        jd_array = np.atleast_1d(np.asarray(jd_array,dtype=np.float64))
+        create_jd = hd_ephemeris.calc_create_dates(jd_array)
+        if not self.covers(create_jd).all():
+            raise ValueError("design date outside of event index span {} - {} (births from ~{} on, see chart_covers)"
+                             .format(self.jd_start,self.jd_end,self.jd_start+DESIGN_MAX_DAYS))
+        prs_gate,prs_line = self.activations_at(jd_array)
+        des_gate,des_line = self.activations_at(create_jd)
+        return np.hstack([prs_gate,des_gate]),np.hstack([prs_line,des_line])
+
+    def next_change(self,jdut,planet):
+        '''
+        when does planet change its gate/line next time?
+        Args:
+            jdut(float): julian day (UT)
+            planet(str): key of SWE_PLANET_DICT
+        Return:
+            jd of change(float),gate(int),line(int) after change (None if outside span)
+        '''
+        col = list(hd_constants.SWE_PLANET_DICT.keys()).index(planet)
+        idx = self.planet_body[col]
+        pos = int(np.searchsorted(self.times[idx],jdut,side="right"))
+        if pos >= len(self.times[idx]):
+            return None
+        line_index = (int(self.index[idx][pos]) + self.planet_shift[col]) % LINE_DIVISION
+        return float(self.times[idx][pos]),int(self.iging_array[line_index//6]),line_index%6+1
+
+    def changes_between(self,jd_begin,jd_end,planet):
+        '''
+        all gate/line changes of planet in time range
+        Args:
+            jd_begin,jd_end(float): julian days (UT)
+            planet(str): key of SWE_PLANET_DICT
+        Return:
+            times(np.array),gate(np.array),line(np.array) after each change
+        '''
+        col = list(hd_constants.SWE_PLANET_DICT.keys()).index(planet)
+        idx = self.planet_body[col]
+        a,b = np.searchsorted(self.times[idx],[jd_begin,jd_end],side="right")
+        line_index = (self.index[idx][a:b].astype(np.int64) + self.planet_shift[col]) % LINE_DIVISION
+        return np.array(self.times[idx][a:b]),self.iging_array[line_index//6],line_index%6+1
+
+    def close(self):
+        self.times = []
+        self.index = []
+        self._mmap.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="gate/line boundary crossing event index")
+    subparsers = parser.add_subparsers(dest="command",required=True)
+    build_parser = subparsers.add_parser("build",help="scan bodies and write index file")
+    build_parser.add_argument("--start",type=int,default=1900,help="first year")
+    build_parser.add_argument("--end",type=int,default=2100,help="last year (exclusive)")
+    build_parser.add_argument("--out",default="hd_events.bin",help="output file")
+    build_parser.add_argument("--num-cpu",type=int,default=1,help="chunks scanned in parallel")
+    info_parser = subparsers.add_parser("info",help="print index summary")
+    info_parser.add_argument("path",help="index file")
+    at_parser = subparsers.add_parser("at",help="activations at UT timestamp")
+    at_parser.add_argument("path",help="index file")
+    at_parser.add_argument("timestamp",type=int,nargs="+",help="year month day [hour minute second]")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build_index(args.out,args.start,args.end,args.num_cpu)
+        args.path = args.out
+    index = EventIndex(args.path)
+    if args.command == "at":
+        timestamp = list(args.timestamp) + [0]*(6-len(args.timestamp))
+        jdut = swe.utc_to_jd(*timestamp)[1]
+        gate,line = index.chart_at(jdut)
+        for label,offset in [("prs",0),("des",len(hd_constants.SWE_PLANET_DICT))]:
+            for col,planet in enumerate(hd_constants.SWE_PLANET_DICT.keys()):
+                print("{} {:10s} {:2d}.{}".format(label,planet,gate[0,offset+col],line[0,offset+col]))
+    else:
+        print("span: {} - {} (jd {} - {})".format(swe.revjul(index.jd_start)[:3],
+                                                  swe.revjul(index.jd_end)[:3],
+                                                  index.jd_start,index.jd_end))
+        for body in index.body_table: #no views of the mmap left at close
+            print("code {:2d}: {:8d} crossings".format(body["code"],body["n_events"]))
+    index.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
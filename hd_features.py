@@ -1,17 +1,20 @@
 import hd_constants
+import hd_ephemeris
+import hd_scan
+import hd_kernels
+import hd_chart
+import hd_store
+import hd_metrics
 import swisseph  as swe  
-from IPython.display import display
-import pandas as pd
 import numpy as np
 import itertools
 from datetime import timedelta
-from dateutil.relativedelta import relativedelta
 from datetime import datetime
 from pytz import timezone
-from multiprocessing import Pool
-from tqdm.contrib.concurrent import process_map
-from tqdm import tqdm
 import sys
+import hashlib
+#reporting (IPython, pandas), worker pools (hd_parallel) and dateutil are
+#imported where used: chart calculation imports swisseph and numpy only
 
 def get_utc_offset_from_tz(timestamp,zone):
     """
@@ -28,6 +31,67 @@ def get_utc_offset_from_tz(timestamp,zone):
     hours = tz_offset/3600
     return hours
 
+def lon_to_gate_dict(lon,label):
+    '''
+    from planetary positions (longitude) basic hd_features are calculated:
+        features: 
+            planets,longitude,gates lines, colors, tone base
+    Args:
+        lon(array like): longitudes in order of SWE_PLANET_DICT 
+                         (see hd_ephemeris.calc_longitudes)
+        label(str): indexing for create and birth values
+    Return:
+        value_dict (dict)
+    '''
+    """synchronize zodiac and gate-circle (IGING circle) = 58°""" 
+    offset= hd_constants.IGING_offset
+
+    result_dict = {k: [] 
+                   for k in ["label",
+                             "planets",
+                             "lon",
+                             "gate",
+                             "line",
+                             "color",
+                             "tone",
+                             "base"]
+                  }
+
+    for planet,long in zip(hd_constants.SWE_PLANET_DICT.keys(),list(lon)):
+        long = float(long)
+        angle = (long + offset) % 360 #angles max 360°
+        angle_percentage =angle/360 
+        
+        #convert angle to gate,line,color,tone,base
+        gate = hd_constants.IGING_CIRCLE_LIST[int(angle_percentage*64)] 
+        line = int((angle_percentage*64*6)%6+1)
+        color =int((angle_percentage*64*6*6)%6+1)
+        tone =int((angle_percentage*64*6*6*6)%6+1)
+        base =int((angle_percentage*64*6*6*6*5)%5+1)
+
+        result_dict["label"].append(label)
+        result_dict["planets"].append(planet)
+        result_dict["lon"].append(long)
+        result_dict["gate"].append(gate)
+        result_dict["line"].append(line)
+        result_dict["color"].append(color)
+        result_dict["tone"].append(tone)
+        result_dict["base"].append(base)
+        
+    return result_dict
+
+def activations_to_gate_dict(activations,label):
+    '''
+    convert activations of one chart (output of hd_kernels.decompose_longitudes)
+    to dict format of lon_to_gate_dict
+    Args:
+        activations(np.array): ACTIVATION_DTYPE in order of SWE_PLANET_DICT
+        label(str): indexing for create and birth values
+    Return:
+        value_dict (dict)
+    '''
+    return hd_chart.activations_as_dict(activations,[label]*len(activations))
+
 class hd_features:
     ''' 
     class for calculation of basic human design features based on 
@@ -113,16 +177,9 @@ class hd_features:
         Return: 
             creation date (float): timestamp in julian day format
         '''
-        design_pos = 88 
-        sun_long =  swe.calc_ut(jdut, swe.SUN)[0][0]
-        long = swe.degnorm(sun_long - design_pos) 
-        tstart = jdut - 100 #aproximation is start -100°
-        res = swe.solcross_ut(long, tstart)
-        create_date = swe.revjul(res)
-        create_julday = swe.julday(*create_date)
-        
-        return create_julday
+        return hd_ephemeris.calc_create_date(jdut)
     
+    @hd_metrics.timed("date_to_gate")
     def date_to_gate(self,jdut,label):
         '''
         from planetary position (longitude) basic hd_features are calculated:
@@ -136,53 +193,9 @@ class hd_features:
         Return:
             value_dict (dict)
         '''   
-        
-        """synchronize zodiac and gate-circle (IGING circle) = 58°""" 
-        offset= hd_constants.IGING_offset
-
-        result_dict = {k: [] 
-                       for k in ["label",
-                                 "planets",
-                                 "lon",
-                                 "gate",
-                                 "line",
-                                 "color",
-                                 "tone",
-                                 "base"]
-                      }
-
-        for idx,(planet,planet_code) in enumerate(self.SWE_PLANET_DICT.items()):
-            xx = swe.calc_ut(jdut,planet_code)
-            long = xx[0][0]
-            
-            #sun position is base of earth position
-            if planet =="Earth": 
-                long = (long+180) % 360 #Earth is in opp. pos., angles max 360°
-
-            #north node is base for south node position
-            elif planet == "South_Node":
-                long = (long+180) % 360 #North Node is in opp. pos.,angles max 360°
-                
-            angle = (long + offset) % 360 #angles max 360°
-            angle_percentage =angle/360 
-            
-            #convert angle to gate,line,color,tone,base
-            gate = self.IGING_CIRCLE_LIST[int(angle_percentage*64)] 
-            line = int((angle_percentage*64*6)%6+1)
-            color =int((angle_percentage*64*6*6)%6+1)
-            tone =int((angle_percentage*64*6*6*6)%6+1)
-            base =int((angle_percentage*64*6*6*6*5)%5+1)
-
-            result_dict["label"].append(label)
-            result_dict["planets"].append(planet)
-            result_dict["lon"].append(long)
-            result_dict["gate"].append(gate)
-            result_dict["line"].append(line)
-            result_dict["color"].append(color)
-            result_dict["tone"].append(tone)
-            result_dict["base"].append(base)
-            
-        return result_dict
+        lon = hd_ephemeris.calc_longitudes(jdut)[0] #all planets in one batch call
+
+        return lon_to_gate_dict(lon,label)
 
     def birth_creat_date_to_gate(self,*time_stamp):
         '''
@@ -194,8 +207,9 @@ class hd_features:
         '''
         birth_julday = self.timestamp_to_juldate(time_stamp)
         create_julday = self.calc_create_date(birth_julday)
-        birth_planets = self.date_to_gate(birth_julday,"prs")
-        create_planets = self.date_to_gate(create_julday,"des")
+        lon = hd_ephemeris.calc_longitudes([birth_julday,create_julday]) #one batch call
+        birth_planets = lon_to_gate_dict(lon[0],"prs")
+        create_planets = lon_to_gate_dict(lon[1],"des")
         date_to_gate_dict = {
             key: birth_planets[key] + create_planets[key] 
             for key in birth_planets.keys()
@@ -285,6 +299,21 @@ def get_variables(date_to_gate_dict):
 
     return variables 
 
+def get_edge_mask(active_channels_dict):
+    '''
+    mask of connected center pairs (bit k: hd_kernels.CENTER_EDGE_LIST[k]),
+    key of the definition table (hd_kernels.get_definition_table)
+    Params: 
+        active_channels_dict(dict): all active channels, keys: ["gate_chakra","ch_gate_chakra"]
+    Return:
+        edge_mask(int)
+    '''
+    edge_mask = 0
+    for gate_chakra,ch_gate_chakra in zip(active_channels_dict["gate_chakra"],
+                                         active_channels_dict["ch_gate_chakra"]):
+        edge_mask |= 1 << center_edge_dict[(gate_chakra,ch_gate_chakra)]
+    return edge_mask
+
 def is_connected(active_channels_dict,*args):
     ''' 
     get bool answer wheater chakras are connected through channel or not
@@ -293,33 +322,17 @@ def is_connected(active_channels_dict,*args):
            active_channels_dict(dict): all active channels, keys: ["label","planets","gate","ch_gate"]
            given_chakras(str): Chakras that will be checked                                    
     Return:
-        bool: returns True if is connected, and false if not
+        bool: returns True if all chakras are in the same connected component
     '''
-    #if gate list is emtpy ->Reflector-Typ (no channels at all), return false
-    if not len(active_channels_dict["gate"]):
-        return False
-    else:
-        gate_chakra_mask = np.array(
-            [gate_chakra in args 
-             for gate_chakra in active_channels_dict["gate_chakra"]]
-        ) 
-        ch_gate_chakra_mask = np.array(
-            [ch_gate_chakra in args for 
-             ch_gate_chakra in active_channels_dict["ch_gate_chakra"]]
-        )
-        
-        #if gate and channel gate in same line -> is connected
-        mask = gate_chakra_mask & ch_gate_chakra_mask 
-        
-        #for 2 elements 1 connection, for 3 elements 2 connection, ...
-        if sum(mask)>=len(args)-1: 
-            return True
-        else: return False
+    component_list = [get_component(active_channels_dict,chakra) for chakra in args]
+    return (component_list[0] is not None) & (len(set(component_list)) == 1)
 
 def get_auth(active_chakras,active_channels_dict): 
     ''' 
         get authority from active chakras, 
         selection rules see #https://www.mondsteinsee.de/autoritaeten-des-human-design/
+        connections (direct and indirect) are looked up in definition table 
+        (see hd_kernels.get_definition_table)
         Args:
             Chakras(set): active chakras
             active_channels_dict(dict): all active channels, keys: ["label","planets","gate","ch_gate"]
@@ -327,28 +340,8 @@ def get_auth(active_chakras,active_channels_dict):
             authority(str): return inner authority (SP,SL,SN,HT,GC,HT_GC,outher auth)
                 HT_GC is reffered to ego projected
     '''
-    outher_auth_mask = (("HD" in active_chakras) 
-                        | ("AA" in active_chakras) 
-                        | ("TT" in active_chakras)
-                        | (len(active_chakras)==0)
-                       )
-    if "SP" in active_chakras:
-        auth = "SP"
-    elif "SL" in active_chakras:
-        auth = "SL"
-    elif "SN" in active_chakras:
-        auth = "SN"
-    elif (is_connected(active_channels_dict,"HT","TT")): #("HT" in active_chakras) &
-        auth= "HT"
-    elif (is_connected(active_channels_dict,"GC","TT")): #("GC" in active_chakras) &
-        auth = "GC"
-    elif ("GC" in active_chakras) & ("HT" in active_chakras):
-        auth = "HT_GC"
-    elif outher_auth_mask:
-        auth = "outher_auth"
-    else: auth = "unknown?" #sanity check;-)
-    
-    return auth
+    auth = hd_kernels.get_definition_table()["auth"][get_edge_mask(active_channels_dict)]
+    return hd_kernels.AUTH_LIST[auth]
 
 def get_typ_old(active_channels_dict,active_chakras): 
     ''' 
@@ -396,51 +389,17 @@ def get_typ_old(active_channels_dict,active_chakras):
 def get_typ(active_channels_dict, active_chakras):
     ''' 
     Get Energy-Type from active channels.
+        Motor centers (SL, HT, SP, RT) connected to the throat (direct or indirect)
+        make Manifestor/Manifesting Generator, lookup in definition table 
+        (see hd_kernels.get_definition_table)
     Args:
         active_channels_dict (dict): all active channels, keys: ["label", "planets", "gate", "ch_gate"]
         active_chakras (list): all active centers (chakras)
     Return: 
         typ (str): Type (GENERATOR, MANIFESTING GENERATOR, PROJECTOR, MANIFESTOR, REFLECTOR)
     '''
-    
-    # No active centers => Reflector
-    if len(active_chakras) == 0:
-        return "REFLECTOR"
-    
-    # Case: Sacral is undefined (can be Manifestor or Projector)
-    if "SL" not in active_chakras:
-        # If Throat is undefined, it must be a Projector
-        if "TT" not in active_chakras:
-            return "PROJECTOR"
-
-        # Check connections from motor centers (HT, EM, RT) to throat (=> Manifestor)
-        component = get_component(active_channels_dict, "TT")  # Throat component
-        if "HT" in active_chakras and get_component(active_channels_dict, "HT") == component:
-            return "MANIFESTOR"
-        if "EM" in active_chakras and get_component(active_channels_dict, "EM") == component:
-            return "MANIFESTOR"
-        if "RT" in active_chakras and get_component(active_channels_dict, "RT") == component:
-            return "MANIFESTOR"
-        
-        # If no motor center is connected to the throat, it is a Projector by definition
-        return "PROJECTOR"
-    
-    # Case: Sacral is defined (can be Generator or Manifesting Generator)
-    if "TT" not in active_chakras:
-        return "GENERATOR"
-
-    # Check connections from motor centers (HT, EM, RT) to throat (=> Manifesting Generator)
-    if "HT" in active_chakras and get_component(active_channels_dict, "HT") == get_component(active_channels_dict, "TT"):
-        return "MANIFESTING GENERATOR"
-    if "EM" in active_chakras and get_component(active_channels_dict, "EM") == get_component(active_channels_dict, "TT"):
-        return "MANIFESTING GENERATOR"
-    if "RT" in active_chakras and get_component(active_channels_dict, "RT") == get_component(active_channels_dict, "TT"):
-        return "MANIFESTING GENERATOR"
-    if get_component(active_channels_dict, "SL") == get_component(active_channels_dict, "TT"):
-        return "MANIFESTING GENERATOR"
-
-    # No connection to throat => Generator
-    return "GENERATOR"
+    typ = hd_kernels.get_definition_table()["typ"][get_edge_mask(active_channels_dict)]
+    return hd_kernels.TYP_LIST[typ]
 
 def get_component(active_channels_dict, chakra):
     """
@@ -449,18 +408,23 @@ def get_component(active_channels_dict, chakra):
         active_channels_dict (dict): dictionary containing channel connections.
         chakra (str): the chakra label to check.
     Return:
-        str: component identifier.
+        int: component identifier (smallest CHAKRA_LIST index of the component), 
+             None if chakra is not defined
     """
-    return active_channels_dict.get(chakra, None)
-
-
+    component = hd_kernels.get_definition_table()["component"][
+        get_edge_mask(active_channels_dict),hd_constants.CHAKRA_LIST.index(chakra)]
+    if component < 0:
+        return None
+    return int(component)
 
 def get_channels_and_active_chakras(date_to_gate_dict,meaning=False):    
     ''' 
     calc active channels:
     take output of hd_features class (date_to_gate_dict) map each gate in col "gate" 
-    to an existing channel gate in col "ch_gate" if channel exists, else value=0     
-        dict for mapping: full_dict (all possible channels compinations)
+    to an existing channel gate in col "ch_gate" if channel exists, else value=0
+    (first active partner in order of full_dict)
+        channels are tested by 64 bit gate mask (see hd_kernels), defined centers
+        are the centers of all active channels
     Args:
         date_to_gate_dict(dict):output of hd_feature class 
                                 keys->[planets,label,longitude,gate,line,color,tone,base]
@@ -469,76 +433,44 @@ def get_channels_and_active_chakras(date_to_gate_dict,meaning=False):
         active_chakras(set): active chakras
     '''
     df = date_to_gate_dict
-    #init lists
-    gate_list =  df["gate"]
-    ch_gate_list=[0]*len(df["gate"])
-    active_chakras = []
-    active_channels_dict={}
-    gate_label_list=[]
-    ch_gate_label_list=[]
-    
-    #map channel gates to gates, if channel exists and make list of it
+    gate_list = [int(gate) for gate in df["gate"]]
+    gate_mask = int(hd_kernels.gates_to_mask(gate_list))
+    channel_mask = int(hd_kernels.gate_mask_to_channel_mask(gate_mask))
+    active_chakras = hd_kernels.center_mask_to_chakras(
+        hd_kernels.channel_mask_to_center_mask(channel_mask))
+
+    #map channel gates to gates (first active partner)
+    df["ch_gate"] = [next((ch_gate for ch_gate in gate_partner_dict.get(gate,[]) 
+                           if gate_mask >> (ch_gate-1) & 1),0)
+                     for gate in gate_list]
+
+    #every active channel once, oriented by its first gate in order of date_to_gate_dict
+    channel_rows = []
+    found_mask = 0
     for idx,gate in enumerate(gate_list):
-
-        ch_gate_a = full_dict["full_gate_1_list"]
-        ch_gate_b = full_dict["full_gate_2_list"]
-        gate_index=np.where(
-            np.array(ch_gate_a)==gate
-        )
-        ch_gate = [ch_gate_b[index] 
-                   for index in gate_index[0] 
-                   if ch_gate_b[index] in gate_list
-                  ]      
-        if ch_gate:
-            ch_gate_list[idx] = ch_gate[0] 
-            active_chakras.append(
-                full_dict["full_chakra_1_list"]
-                [full_dict["full_gate_1_list"].index(gate)]
-            )
-            active_chakras.append(
-                full_dict["full_chakra_2_list"]
-                [full_dict["full_gate_2_list"].index(gate)]
-            ) 
-    df["ch_gate"]=ch_gate_list
-
-    #filter dict for active channels (ch_gate is not 0)
-    mask=np.array(df["ch_gate"])!=0
-    
-    #duplicate mask remove duplicates (e.g. (1,2) = (2,1))
-    sorted_channels = [sorted((df["gate"][i],df["ch_gate"][i])) 
-                       for i in range(len(df["gate"]))]
-    unique_mask = np.unique(sorted_channels,axis=0,return_index=True)[1]
-    dupl_mask = np.zeros(len(sorted_channels),dtype=bool)
-    dupl_mask[unique_mask]=True
-           
-    #filter usefull keys to result dict
-    for key in ["label","planets","gate","ch_gate"]: 
-        active_channels_dict[key] = np.array(df[key])[dupl_mask&mask]   
+        for ch_gate in gate_partner_dict.get(gate,[]):
+            channel_bit = 1 << channel_index_dict[(gate,ch_gate)]
+            if (channel_mask & channel_bit) and not (found_mask & channel_bit):
+                found_mask |= channel_bit
+                channel_rows.append((idx,gate,ch_gate))
+
+    active_channels_dict = {}
+    for key in ["label","planets"]:
+        active_channels_dict[key] = np.array([df[key][idx] for idx,_,_ in channel_rows])
+    active_channels_dict["gate"] = np.array([gate for _,gate,_ in channel_rows],dtype=int)
+    active_channels_dict["ch_gate"] = np.array([ch_gate for _,_,ch_gate in channel_rows],dtype=int)
     #map chakras to gates in new col["XXX_chakra"]
     active_channels_dict["gate_chakra"] =  [full_dict["full_gate_chakra_dict"][key] 
                                             for key in active_channels_dict["gate"]]
     active_channels_dict["ch_gate_chakra"] =  [full_dict["full_gate_chakra_dict"][key] 
                                                for key in active_channels_dict["ch_gate"]]
     #map labels to open gates and ch_gates
-    gate=active_channels_dict["gate"]
-    ch_gate=active_channels_dict["ch_gate"]
-    
-    # convert gates and channel gates to tuple format (1,2)
-    for gate,ch_gate in zip(gate,ch_gate):
-        idx_gate = np.where(
-            np.array(df['gate'])==gate
-        )
-        idx_ch_gate = np.where(
-            np.array(df['gate'])==ch_gate
-        )
-        gate_label_list.append(
-            [df["label"][int(i)] for i in np.nditer(idx_gate)]
-        )
-        ch_gate_label_list.append(
-            [df["label"][int(i)] for i in np.nditer(idx_ch_gate)]
-        )
-    active_channels_dict["ch_gate_label"] = ch_gate_label_list
-    active_channels_dict["gate_label"] = gate_label_list
+    active_channels_dict["ch_gate_label"] = [[df["label"][idx] 
+                                              for idx,gate in enumerate(gate_list) if gate == ch_gate]
+                                             for _,_,ch_gate in channel_rows]
+    active_channels_dict["gate_label"] = [[df["label"][idx] 
+                                           for idx,gate in enumerate(gate_list) if gate == ch_gate]
+                                          for _,ch_gate,_ in channel_rows]
     
     #if meaning shall be mapped to active channels and returned
     if meaning:      
@@ -546,23 +478,18 @@ def get_channels_and_active_chakras(date_to_gate_dict,meaning=False):
         meaning_dict = hd_constants.CHANNEL_MEANING_DICT
         full_meaning_dict = {**meaning_dict,**{key[::-1]:value
                                                for key,value in meaning_dict.items()}}
-        #get channels in tuple  format
-        channels =np.column_stack(
-            (active_channels_dict["gate"],active_channels_dict["ch_gate"])
-        ) 
-        active_channels_dict["meaning"] = [full_meaning_dict[tuple(channel)] 
-                                           for channel in channels] 
+        active_channels_dict["meaning"] = [full_meaning_dict[(gate,ch_gate)] 
+                                           for _,gate,ch_gate in channel_rows] 
 
-    return active_channels_dict,set(active_chakras)
+    return active_channels_dict,active_chakras
 
 def get_split(active_channels_dict,active_chakras):
     """
-    calculate split from active channels and chakras
-    if 
-        connection is circular -> no split -> return:0
-        connection is bicircular-> no split -> return:-1
-        all chakras are linear connected-> no split ->return:1
-        two connected groups-> split -> return:2,
+    calculate split from active channels and chakras:
+    number of connected groups of defined centers (graph components) 
+        no definition -> 0
+        all defined centers are connected -> no split -> 1
+        two connected groups -> split -> 2,
         three connect groups ....
     Args:
         active_channels_dict(dict): all active channels, keys: ["label","planets","gate","ch_gate"]
@@ -570,18 +497,7 @@ def get_split(active_channels_dict,active_chakras):
     Return:
         split(int): meaning see above
     """
-    #split, remove duplicate tuples (gate,ch_gate chakras) in channels 
-    gate_chakra = active_channels_dict["gate_chakra"]
-    ch_gate_chakra = active_channels_dict["ch_gate_chakra"]
-    sorted_chakras = [sorted((gate_chakra[i],ch_gate_chakra[i])) 
-                      for i in range(len(active_channels_dict["gate_chakra"]))]
-    unique_mask = np.unique(sorted_chakras,axis=0,return_index=True)[1]
-    dupl_mask = np.zeros(len(sorted_chakras),dtype=bool)
-    dupl_mask[unique_mask]=True
-    len_no_dupl_channel = sum(dupl_mask)
-    split = len(active_chakras) - len_no_dupl_channel
-    
-    return  split
+    return int(hd_kernels.get_definition_table()["split"][get_edge_mask(active_channels_dict)])
     
 def calc_full_gates_chakra_dict(gates_chakra_dict):
     ''' 
@@ -638,6 +554,16 @@ def calc_full_gates_chakra_dict(gates_chakra_dict):
 
 #from chakra dict create full_dict (add keys in reversed order) 
 full_dict = calc_full_gates_chakra_dict(hd_constants.GATES_CHAKRA_DICT)
+#gate -> channel partners in order of full_dict
+gate_partner_dict = {}
+for gate_1,gate_2 in full_dict["full_ch_list"]:
+    gate_partner_dict.setdefault(gate_1,[]).append(gate_2)
+#center pair (both orders) -> bit of edge mask (see get_edge_mask)
+center_edge_dict = {**{edge:idx for idx,edge in enumerate(hd_kernels.CENTER_EDGE_LIST)},
+                    **{edge[::-1]:idx for idx,edge in enumerate(hd_kernels.CENTER_EDGE_LIST)}}
+#channel (both orders) -> bit of channel mask (index of GATES_CHAKRA_DICT)
+channel_index_dict = {channel:idx%len(hd_constants.GATES_CHAKRA_DICT) 
+                      for idx,channel in enumerate(full_dict["full_ch_list"])}
 
 def calc_full_channel_meaning_dict():
     """from meaning dict create full dict (add keys in reversed ordere.g. (1,2)/(2,1))"""
@@ -700,7 +626,143 @@ def calc_single_hd_features(timestamp,report=False,channel_meaning=False,day_cha
             profile(tuple): format (1,2)
             active_channels(dict):  keys [planets,labels,gates and channel gates]
     '''
-    ####santity check for input format and values
+    check_timestamp_format(timestamp)
+    instance = hd_features(*timestamp) #create instance of hd_features class
+
+    if day_chart_only:
+        date_to_gate_dict = instance.day_chart(instance.time_stamp)
+    else:
+        date_to_gate_dict = instance.birth_creat_date_to_gate(instance.time_stamp) 
+        bdate="{}".format(timestamp[:-2])
+        cdate="{}".format(instance.create_date)
+        single_result = get_hd_features(date_to_gate_dict,bdate,cdate,channel_meaning)
+        typ,auth,inc_cross,_,profile,split,_,active_chakras,active_channels_dict,_,_ = single_result
+        if report == True:
+            variables = get_variables(date_to_gate_dict)
+#            print("birth date: {}".format(timestamp[:-2]))
+            print("birth date: "+ bdate)
+#            print("create date: {}".format(instance.create_date))
+            print("create date: " + cdate)
+            print("energie-type: {}".format(typ))
+            print("inner authority: {}".format(auth))
+            print("inc. cross: {}".format(inc_cross))
+            #print("profile: {}".format(profile))
+            print("profile: {}/{}".format( *profile, sep='/'))
+            print("active chakras: {}".format(active_chakras))
+            print("split: {}".format(split))
+            print("variables: {}".format(variables))
+            import pandas as pd
+            from IPython.display import display
+            display(pd.DataFrame(date_to_gate_dict))
+            display(pd.DataFrame(active_channels_dict))
+         
+    if day_chart_only==False:
+        return single_result
+    else:
+        return date_to_gate_dict
+
+#chart encoding (encode_chart): format byte + constants version (crc32) + packed activations
+CHART_ENCODING_FORMAT = 1
+CONSTANTS_VERSION = hd_constants.CONSTANTS_VERSION
+ACTIVATION_BITS = 18 #gate 6, line 3, color 3, tone 3, base 3
+N_ACTIVATIONS = 2*len(hd_constants.SWE_PLANET_DICT)
+ACTIVATION_BYTES = (N_ACTIVATIONS*ACTIVATION_BITS+7)//8
+CHANNEL_BYTES = (len(hd_constants.GATES_CHAKRA_DICT)+7)//8
+
+def get_gate_channel_mask(gate_list):
+    '''
+    bitmasks of active gates and channels
+    Args:
+        gate_list(list): active gates
+    Return:
+        gate_mask(int): bit gate-1 is set for every active gate (64 bit)
+        channel_mask(int): bit i is set if channel i of GATES_CHAKRA_DICT is active (36 bit)
+    '''
+    gate_mask = int(hd_kernels.gates_to_mask([int(gate) for gate in gate_list]))
+    channel_mask = int(hd_kernels.gate_mask_to_channel_mask(gate_mask))
+    return gate_mask,channel_mask
+
+def encode_chart(date_to_gate_dict):
+    '''
+    bit-packed binary encoding of a chart (26 activations, personality first)
+        gate,line,color,tone,base of each activation (18 bit), 
+        gate bitmask (64 bit) and channel bitmask (36 bit), 
+        version header: blobs of other constants can not be decoded
+    Args:
+        date_to_gate_dict(dict): keys gate,line,color,tone,base (or hd_chart.Chart)
+    Return:
+        blob(bytes): 5+59+8+5 = 77 bytes
+    '''
+    packed = 0
+    for idx,(gate,line,color,tone,base) in enumerate(zip(
+        *[list(date_to_gate_dict[key]) for key in ["gate","line","color","tone","base"]])):
+        value = ((((int(gate)-1)*8 + int(line)-1)*8 + int(color)-1)*8 + int(tone)-1)*8 + int(base)-1
+        packed |= value << (idx*ACTIVATION_BITS)
+    gate_mask,channel_mask = get_gate_channel_mask(date_to_gate_dict["gate"])
+
+    return (CHART_ENCODING_FORMAT.to_bytes(1,"little")
+            + CONSTANTS_VERSION.to_bytes(4,"little")
+            + packed.to_bytes(ACTIVATION_BYTES,"little")
+            + gate_mask.to_bytes(8,"little")
+            + channel_mask.to_bytes(CHANNEL_BYTES,"little"))
+
+def decode_chart(blob):
+    '''
+    decode output of encode_chart
+    Args:
+        blob(bytes): encoded chart
+    Return:
+        date_to_gate_dict(dict): keys label,planets,gate,line,color,tone,base (no lon)
+        gate_mask(int): bitmask of active gates
+        channel_mask(int): bitmask of active channels (order of GATES_CHAKRA_DICT)
+    Raise:
+        ValueError: if blob was encoded with other format or constants
+    '''
+    if ((blob[0] != CHART_ENCODING_FORMAT) 
+        | (int.from_bytes(blob[1:5],"little") != CONSTANTS_VERSION)):
+        raise ValueError("chart blob was encoded with other format/constants, recalculate chart")
+    offset = 5
+    packed = int.from_bytes(blob[offset:offset+ACTIVATION_BYTES],"little")
+    offset += ACTIVATION_BYTES
+    gate_mask = int.from_bytes(blob[offset:offset+8],"little")
+    channel_mask = int.from_bytes(blob[offset+8:offset+8+CHANNEL_BYTES],"little")
+
+    date_to_gate_dict = {"label":["prs"]*(N_ACTIVATIONS//2) + ["des"]*(N_ACTIVATIONS//2),
+                         "planets":list(hd_constants.SWE_PLANET_DICT.keys())*2,
+                        }
+    for key in ["gate","line","color","tone","base"]:
+        date_to_gate_dict[key] = []
+    for idx in range(N_ACTIVATIONS):
+        value = (packed >> (idx*ACTIVATION_BITS)) & ((1 << ACTIVATION_BITS)-1)
+        date_to_gate_dict["base"].append((value & 7)+1)
+        date_to_gate_dict["tone"].append(((value >> 3) & 7)+1)
+        date_to_gate_dict["color"].append(((value >> 6) & 7)+1)
+        date_to_gate_dict["line"].append(((value >> 9) & 7)+1)
+        date_to_gate_dict["gate"].append((value >> 12)+1)
+
+    return date_to_gate_dict,gate_mask,channel_mask
+
+def chart_fingerprint(date_to_gate_dict):
+    '''
+    stable fingerprint of a chart (hash of encode_chart), 
+    e.g. for cache keys and dedup of identical charts
+    Args:
+        date_to_gate_dict(dict): chart (see encode_chart) or encoded blob(bytes)
+    Return:
+        fingerprint(str): 16 hex digits
+    '''
+    if not isinstance(date_to_gate_dict,bytes):
+        date_to_gate_dict = encode_chart(date_to_gate_dict)
+    return hashlib.blake2b(date_to_gate_dict,digest_size=8).hexdigest()
+
+def check_timestamp_format(timestamp):
+    '''
+    santity check for input format and values
+    Params: 
+        timestamp (tuple): (year,month,day,hour,minute,second,tz_offset)
+    Raise:
+        ValueError: if format or values are not valid
+    '''
     if ((len(timestamp)!=7)
     | (len([elem for elem in timestamp[1:6] if elem <0]))
     | (timestamp[1]>12) 
@@ -712,44 +774,88 @@ def calc_single_hd_features(timestamp,report=False,channel_meaning=False,day_cha
         sys.stdout.write("Format should be:\
         Year,Month,day,hour,min,sec,timezone_offset,\nIs date correct?")
         raise ValueError('check timestamp Format') 
-    else:
-        instance = hd_features(*timestamp) #create instance of hd_features class
 
-        if day_chart_only:
-            date_to_gate_dict = instance.day_chart(instance.time_stamp)
-        else:
-            date_to_gate_dict = instance.birth_creat_date_to_gate(instance.time_stamp) 
-            active_channels_dict,active_chakras = get_channels_and_active_chakras(
-                date_to_gate_dict,meaning=channel_meaning)
-            typ = get_typ(active_channels_dict,active_chakras)
-            auth = get_auth(active_chakras,active_channels_dict)
-            inc_cross = get_inc_cross(date_to_gate_dict)
-            inc_cross_typ = inc_cross[-3:]
-            profile = get_profile(date_to_gate_dict)
-            split = get_split(active_channels_dict,active_chakras)
-            variables = get_variables(date_to_gate_dict)
-            bdate="{}".format(timestamp[:-2])
-            cdate="{}".format(instance.create_date)
-            if report == True:
-#                print("birth date: {}".format(timestamp[:-2]))
-                print("birth date: "+ bdate)
-#                print("create date: {}".format(instance.create_date))
-                print("create date: " + cdate)
-                print("energie-type: {}".format(typ))
-                print("inner authority: {}".format(auth))
-                print("inc. cross: {}".format(inc_cross))
-                #print("profile: {}".format(profile))
-                print("profile: {}/{}".format( *profile, sep='/'))
-                print("active chakras: {}".format(active_chakras))
-                print("split: {}".format(split))
-                print("variables: {}".format(variables))
-                display(pd.DataFrame(date_to_gate_dict))
-                display(pd.DataFrame(active_channels_dict))
-         
-    if day_chart_only==False:
-        return  typ,auth,inc_cross,inc_cross_typ,profile,split,date_to_gate_dict,active_chakras,active_channels_dict, bdate, cdate
-    else:
-        return date_to_gate_dict
+@hd_metrics.timed("classification")
+def get_hd_features(date_to_gate_dict,bdate,cdate,channel_meaning=False):
+    '''
+    calc hd_features from date_to_gate_dict of birth and create date
+    Params: 
+        date_to_gate_dict(dict): output of hd_feature class 
+                                 keys->[planets,label,longitude,gate,line,color,tone,base]
+        bdate(str): birth date
+        cdate(str): create date
+        channel_meaning: add meaning to channels
+    Return: 
+        same format as calc_single_hd_features
+    '''
+    active_channels_dict,active_chakras = get_channels_and_active_chakras(
+        date_to_gate_dict,meaning=channel_meaning)
+    typ = get_typ(active_channels_dict,active_chakras)
+    auth = get_auth(active_chakras,active_channels_dict)
+    inc_cross = get_inc_cross(date_to_gate_dict)
+    inc_cross_typ = inc_cross[-3:]
+    profile = get_profile(date_to_gate_dict)
+    split = get_split(active_channels_dict,active_chakras)
+
+    return  typ,auth,inc_cross,inc_cross_typ,profile,split,date_to_gate_dict,active_chakras,active_channels_dict, bdate, cdate
+
+def calc_hd_features_batch(timestamp_list,channel_meaning=False):
+    '''
+    from given timestamps calc hd_features, 
+    planetary positions of all birth and create dates are calculated 
+    in one batch call (see hd_ephemeris)
+    Params: 
+        timestamp_list(list of tuple): (year,month,day,hour,minute,second,tz_offset)
+        channel_meaning: add meaning to channels
+    Return: 
+        result(list): for each timestamp same format as calc_single_hd_features
+    '''
+    for timestamp in timestamp_list:
+        check_timestamp_format(timestamp)
+    birth_jd = hd_ephemeris.timestamps_to_jd(timestamp_list)
+    bdate_list = ["{}".format(timestamp[:-2]) for timestamp in timestamp_list]
+    store = hd_store.get_default_store()
+    if store is None:
+        return calc_hd_features_jd(birth_jd,bdate_list,channel_meaning)
+    charts,create_jd = store.get_or_calc(timestamp_list,birth_jd) #persistent chart store
+
+    return calc_hd_features_charts(charts,create_jd,bdate_list,channel_meaning)
+
+def calc_hd_features_jd(birth_jd,bdate_list,channel_meaning=False):
+    '''
+    calc hd_features from birth julian days (UT) in one batch ephemeris call
+    Params: 
+        birth_jd(np.array): birth julian days (UT)
+        bdate_list(list of str): birth date of each julian day (output only)
+        channel_meaning: add meaning to channels
+    Return: 
+        result(list): for each julian day same format as calc_single_hd_features
+    '''
+    create_jd = hd_ephemeris.calc_create_dates(birth_jd) #vectorized design date solver
+    with hd_metrics.stage("date_to_gate"):
+        lon = hd_ephemeris.calc_longitudes(np.concatenate([birth_jd,create_jd]))
+        charts = hd_chart.ChartBatch.from_longitudes(lon[:len(bdate_list)],lon[len(bdate_list):])
+
+    return calc_hd_features_charts(charts,create_jd,bdate_list,channel_meaning)
+
+def calc_hd_features_charts(charts,create_jd,bdate_list,channel_meaning=False):
+    '''
+    calc hd_features of already calculated charts
+    Params: 
+        charts(hd_chart.ChartBatch): charts of birth dates
+        create_jd(np.array): create (design) julian days (UT) of charts
+        bdate_list(list of str): birth date of each chart (output only)
+        channel_meaning: add meaning to channels
+    Return: 
+        result(list): for each chart same format as calc_single_hd_features
+    '''
+    result = []
+    for idx,bdate in enumerate(bdate_list):
+        date_to_gate_dict = charts[idx].as_dict()
+        cdate="{}".format(swe.jdut1_to_utc(create_jd[idx])[:-1])
+        result.append(get_hd_features(date_to_gate_dict,bdate,cdate,channel_meaning))
+
+    return result
 
 def unpack_single_features(single_result):
     '''
@@ -820,6 +926,7 @@ def get_timestamp_list(start_date,end_date,percentage,time_unit,intervall):
     for idx,i in enumerate(range(int(time_diff_range*percentage/intervall))):
         #relativdelta native supports year,month
         if (time_unit == "years") | (time_unit == "months"):
+            from dateutil.relativedelta import relativedelta
             new_date = end_date-i*relativedelta(**{time_unit: intervall})
         #timedelta is faster
         else:
@@ -833,7 +940,7 @@ def get_timestamp_list(start_date,end_date,percentage,time_unit,intervall):
         raise ValueError('check startdate < enddate & (enddate-intervall) >= startdate')  
     return timestamp_list
     
-def calc_mult_hd_features(start_date,end_date,percentage,time_unit,intervall,num_cpu):
+def calc_mult_hd_features(start_date,end_date,percentage,time_unit,intervall,num_cpu,batch_size=1000,mode="fixed"):
     """
     calculate multiple hd_features from given timerange
     Args:
@@ -842,19 +949,85 @@ def calc_mult_hd_features(start_date,end_date,percentage,time_unit,intervall,num
         percentage(float): percentage of given time range
         unit(str): years,months,days,hours,minutes
         intervall(int): stepwith, every X unit
-        num_cpu(int): for multiprocessing
+        num_cpu(int): worker processes (warm, see hd_parallel)
+        batch_size(int): timestamps per batch ephemeris call (calc_hd_features_batch)
+        mode(str): "fixed": fixed steps (get_timestamp_list), 
+                   "columnar": fixed steps, charts and features as columns in shared
+                               memory (see hd_parallel.calc_range_features), no dicts
+                   "scan": one result per distinct chart (calc_scan_hd_features),
+                           percentage, unit and intervall are not used
     Return: 
         result(list): hd_features(typ,auth,inc,profile,gate_dict,chakra,channel)
-        timestamp_list(list): list of datetime timestamps
+                      (mode "columnar": dict of np.array)
+        timestamp_list(list): list of datetime timestamps (mode "scan": interval_list)
     """
-    p = Pool(num_cpu)
+    import hd_parallel
+    if mode == "scan":
+        return calc_scan_hd_features(start_date,end_date)
     timestamp_list=get_timestamp_list(start_date,end_date,percentage,time_unit,intervall) #line change every 22 hour
-    result = process_map(calc_single_hd_features,timestamp_list,chunksize=num_cpu)
-    p.close()
-    p.join()
+    if mode == "columnar":
+        birth_jd = hd_ephemeris.timestamps_to_jd(timestamp_list)
+        result = hd_parallel.calc_range_features(birth_jd,num_cpu,batch_size,hd_parallel.print_progress)
+        return result,timestamp_list
+    batch_list = [timestamp_list[idx:idx+batch_size] 
+                  for idx in range(0,len(timestamp_list),batch_size)]
+    batch_result = hd_parallel.map_batches(calc_hd_features_batch,batch_list,num_cpu,hd_parallel.print_progress)
+    result = [single_result for batch in batch_result for single_result in batch]
     
     return result,timestamp_list
 
+def stream_mult_hd_features(start_date,end_date,time_unit,intervall,sink,num_cpu=None,batch_size=50000,memory_budget_mb=None):
+    """
+    streaming variant of calc_mult_hd_features: uniform steps from start_date,
+    every batch is written through sink (see hd_sink), nothing is kept in memory
+    Args:
+        start_date(tuple): year,month,day,hour,minute,second,tz_offset
+        end_date(tuple): year,month,day,hour,minute,second,tz_offset (end>start)
+        time_unit(str): days,hours,minutes
+        intervall(int): stepwith, every X unit
+        sink: e.g. hd_sink.ParquetSink(path), hd_sink.get_sink(path)
+        num_cpu(int): worker processes (see hd_parallel)
+        batch_size(int): charts per write (row group)
+        memory_budget_mb(float): refuse scans above this estimate (see hd_sink.estimate_stream_memory)
+    Return: 
+        n_rows(int): written charts
+    """
+    import hd_sink
+    import hd_parallel
+    jd_start,step_days,n_charts = hd_sink.timestamp_grid(start_date,end_date,time_unit,intervall)
+    return hd_sink.stream_range_features(jd_start,step_days,n_charts,sink,num_cpu,batch_size,
+                                         memory_budget_mb=memory_budget_mb,progress=hd_parallel.print_progress)
+
+def calc_scan_hd_features(start_date,end_date,resolution="line",channel_meaning=False):
+    """
+    event driven scan of time range (see hd_scan): one hd_features result 
+    per distinct chart, change instants are exact (no minute grid)
+    Args:
+        start_date(tuple): year,month,day,hour,minute,second,tz_offset
+        end_date(tuple): year,month,day,hour,minute,second,tz_offset (end>start)
+        resolution(str): gate,line,color,tone,base - chart changes if any activation
+                         crosses this boundary
+        channel_meaning: add meaning to channels
+    Return: 
+        result(list): hd_features of each interval (positions of interval mid)
+        interval_list(list of dict): keys "start","end" (UTC timestamps),
+                                     "start_jd","end_jd","index" (see hd_scan)
+    """
+    check_timestamp_format(start_date)
+    check_timestamp_format(end_date)
+    jd_start,jd_end = hd_ephemeris.timestamps_to_jd([start_date,end_date])
+    if jd_end <= jd_start:
+        raise ValueError('check startdate < enddate')
+    interval_list = hd_scan.scan_chart_intervals(jd_start,jd_end,resolution)
+    for interval in interval_list:
+        interval["start"] = swe.jdut1_to_utc(interval["start_jd"])
+        interval["end"] = swe.jdut1_to_utc(interval["end_jd"])
+    mid_jd = np.array([(interval["start_jd"]+interval["end_jd"])/2 for interval in interval_list])
+    bdate_list = ["{}".format(interval["start"][:-1]) for interval in interval_list]
+    result = calc_hd_features_jd(mid_jd,bdate_list,channel_meaning)
+
+    return result,interval_list
+
 def unpack_mult_features(result,full=True):
     '''
     convert nested lists into dict
@@ -935,6 +1108,7 @@ def composite_chakras_channels(persons_dict,identity,other_person):
     id_channels_dict,id_chakras = get_channels_and_active_chakras(identity_gate_dict,meaning=True)
     other_channels_dict,other_chakras = get_channels_and_active_chakras(other_gate_dict,meaning=True)
     #convert to pd.dataframe
+    import pandas as pd
     composite_channels = pd.DataFrame(composite_channels_dict)
     id_channels = pd.DataFrame(id_channels_dict)
     other_channels = pd.DataFrame(other_channels_dict)
@@ -958,6 +1132,7 @@ def get_composite_combinations(persons_dict):
     Return:
         pd.Dataframe of composite features of every pair combination in persons dict
     '''
+    import pandas as pd
     result_dict = {"id":[],"other_person":[],"new_chakra":[],"chakra_count":[],"new_channels":[],"new_ch_meaning":[]}
     
     for idx,combination in enumerate(list(itertools.combinations(persons_dict.keys(),2))):
@@ -989,6 +1164,7 @@ def get_penta(persons_dict,report=False):
                           if identity combination has penta gate:x, else:0 
         persentage(float): how much percent of penta is matched
     """
+    import pandas as pd
     penta_dict = hd_constants.penta_dict
     
     for person in persons_dict.keys():
@@ -1046,6 +1222,26 @@ class hd_composite:
                                 day_date,
                                 day_chart_only=True)
 
+        return self.get_composite_features(date_to_gate_day)
+
+    def get_composite_hd_day_chart_batch(self,day_date_list):
+        '''
+        composite features of birth chart and day charts of given timestamps,
+        planetary positions of all days are calculated in one batch call (see hd_ephemeris)
+        Args:
+            day_date_list(list of tuple): (year,month,day,hour,minute,second,tz_offset)
+        Return:
+            result(list): for each day same format as get_composite_hd_day_chart
+        '''
+        for day_date in day_date_list:
+            check_timestamp_format(day_date)
+        lon = hd_ephemeris.calc_longitudes(hd_ephemeris.timestamps_to_jd(day_date_list))
+        activations = hd_kernels.decompose_longitudes(lon)
+
+        return [self.get_composite_features(activations_to_gate_dict(day_activations,"prs")) 
+                for day_activations in activations]
+
+    def get_composite_features(self,date_to_gate_day):
         #concat day chart and birth chart to new identity
         date_to_gate_dict = {
                     key: self.date_to_gate_birth [key] + date_to_gate_day[key] 
@@ -1061,7 +1257,7 @@ class hd_composite:
         planets = date_to_gate_dict
         return active_channels_dict,active_chakras,typ,auth,split,planets
 
-    def calc_multi_comp_charts(self):
+    def calc_multi_comp_charts(self,batch_size=1000):
     
         timestamp_list=get_timestamp_list(
                                 self.start_date,
@@ -1069,10 +1265,12 @@ class hd_composite:
                                 self.percentage,
                                 self.time_unit,
                                 self.intervall) #line change every 22 hour
-        p = Pool(self.num_cpu)
-        result = process_map(self.get_composite_hd_day_chart,timestamp_list,chunksize=self.num_cpu)
-        p.close()
-        p.join()
+        batch_list = [timestamp_list[idx:idx+batch_size] 
+                      for idx in range(0,len(timestamp_list),batch_size)]
+        import hd_parallel
+        batch_result = hd_parallel.map_batches(self.get_composite_hd_day_chart_batch,batch_list,
+                                               self.num_cpu,hd_parallel.print_progress)
+        result = [day_result for batch in batch_result for day_result in batch]
 
         self.result = result
         self.timestamp_list = timestamp_list
@@ -0,0 +1,527 @@
+"""
+golden corpus and differential harness: fast engines against the reference path
+    corpus:     reproducible (seeded) timestamps with the results of the reference path
+                (calc_single_hd_features, one timestamp at a time) stored field by field:
+                    random      uniform UTC instants 1900-2100, random utc offsets
+                    birth       instants right at (+-1 s) a gate/line boundary of a birth planet
+                    design      birth instants whose design planet is at a gate/line boundary
+                    calendar    midnight, new year and leap days with extreme utc offsets
+    verify:     run an engine (see ENGINE_DICT) on the corpus, every field level difference
+                is reported (index, timestamp, field, column, expected, actual)
+    classifier: type, authority, split and defined centers of channel subsets against an
+                independent graph search (reference_definition): all 2**17 center connection
+                masks (type/authority/split only depend on the connected center pairs) and a
+                stratified sample of the 2**36 channel subsets (every subset size)
+
+    python hd_golden.py build golden.npz [--random 200000] [--boundary 50000] [--num-cpu 4]
+    python hd_golden.py verify golden.npz batch [--table hd_positions.bin] [--out diff.ndjson]
+    python hd_golden.py classifier [--per-size 5000]
+"""
+import hd_constants
+import hd_ephemeris
+import hd_events
+import hd_features as hd
+import hd_kernels
+import hd_chart
+import argparse
+import itertools
+import json
+import math
+import sys
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import numpy as np
+import swisseph as swe
+
+KIND_LIST = ["random","birth","design","calendar"]
+#utc offsets (hours) of corpus timestamps, incl. fractional and extreme zones
+TZ_OFFSET_LIST = [0,0,1,2,-5,5.5,5.75,-3.5,8,9.5,12.75,14,-10,-12]
+#corpus span (UTC)
+START_JD = swe.julday(1900,1,1,0.0)
+END_JD = swe.julday(2100,1,1,0.0)
+#boundary instants: newton steps and max. remaining step (days, ~10 ms)
+BOUNDARY_STEPS = 8
+BOUNDARY_TOLERANCE = 1e-7
+#lines per gate (gate boundaries are every 6th line boundary)
+GATE_LINES = 6
+#default max. deviation of longitudes (degrees), larger deviations are reported,
+#design dates of the batch solver differ by < 0.1 s from the reference (moon ~1e-5°)
+LON_TOLERANCE = 1e-4
+#timestamps per engine call
+CHUNK_SIZE = 10000
+N_ACTIVATIONS = 2*len(hd_constants.SWE_PLANET_DICT)
+ACTIVATION_FIELD_LIST = ["gate","line","color","tone","base","ch_gate","lon"]
+FIELD_LIST = ["typ","auth","inc_cross","inc_cross_typ","profile","split","active_chakras",
+              "active_channels","create_date"] + ACTIVATION_FIELD_LIST
+
+def utc_to_timestamp(utc_seconds,tz_offset):
+    ''' local timestamp (year,month,day,hour,minute,second,tz_offset) of whole UTC seconds since 1970 '''
+    local = datetime(1970,1,1) + timedelta(seconds=int(utc_seconds) + round(tz_offset*3600))
+    return (local.year,local.month,local.day,local.hour,local.minute,local.second,tz_offset)
+
+def jd_to_utc_seconds(jdut):
+    ''' UTC seconds since 1970 (float) of julian day UT1 (leap seconds as swe.jdut1_to_utc) '''
+    year,month,day,hour,minute,second = swe.jdut1_to_utc(float(jdut))
+    return (datetime(year,month,day,hour,minute) - datetime(1970,1,1)).total_seconds() + second
+
+def solve_boundary(jd_array,planet_idx,division_lines):
+    '''
+    instants next to jd_array where planet crosses the nearest boundary (newton steps)
+    Args:
+        jd_array(np.array): start julian days (UT)
+        planet_idx(np.array): column of PLANET_LIST of every start
+        division_lines(np.array): 1: line boundaries, GATE_LINES: gate boundaries
+    Return:
+        jd(np.array): boundary instants, nan if not converged (e.g. planet station)
+    '''
+    rows = np.arange(len(jd_array))
+    jd = np.asarray(jd_array,dtype=np.float64).copy()
+    lines_per_degree = hd_events.LINE_DIVISION/360
+    pos = hd_events.lon_to_line_pos(hd_ephemeris.calc_longitudes(jd)[rows,planet_idx])
+    target = np.round(pos/division_lines)*division_lines
+    step = np.full(len(jd),np.inf)
+    for _ in range(BOUNDARY_STEPS):
+        lon,speed = hd_ephemeris.calc_longitudes(jd,with_speed=True)
+        pos = hd_events.lon_to_line_pos(lon[rows,planet_idx])
+        diff = (target - pos + hd_events.LINE_DIVISION/2) % hd_events.LINE_DIVISION - hd_events.LINE_DIVISION/2
+        with np.errstate(divide="ignore",invalid="ignore"):
+            step = diff/(speed[rows,planet_idx]*lines_per_degree)
+        step = np.clip(np.nan_to_num(step,nan=np.inf),-30,30)
+        jd = jd + step
+    return np.where(np.abs(step) < BOUNDARY_TOLERANCE,jd,np.nan)
+
+def solve_birth_for_design(design_jd):
+    '''
+    birth julian days whose design date (sun -88°) is design_jd (newton steps on the sun)
+    '''
+    sun_idx = hd_ephemeris.PLANET_LIST.index("Sun")
+    target = (hd_ephemeris.calc_longitudes(design_jd)[:,sun_idx] + 88) % 360
+    jd = design_jd + 88/0.9856 #mean sun motion
+    for _ in range(BOUNDARY_STEPS):
+        lon,speed = hd_ephemeris.calc_longitudes(jd,with_speed=True)
+        jd = jd + ((target - lon[:,sun_idx] + 180) % 360 - 180)/speed[:,sun_idx]
+    return jd
+
+def boundary_timestamps(jd_array,rng):
+    '''
+    two timestamps (whole UTC seconds before and after) around every boundary instant
+    Return:
+        timestamp_list(list of tuple)
+    '''
+    timestamp_list = []
+    for jdut in jd_array[np.isfinite(jd_array)]:
+        if not START_JD <= jdut < END_JD:
+            continue
+        utc_seconds = jd_to_utc_seconds(jdut)
+        tz_offset = TZ_OFFSET_LIST[rng.integers(len(TZ_OFFSET_LIST))]
+        timestamp_list += [utc_to_timestamp(math.floor(utc_seconds),tz_offset),
+                           utc_to_timestamp(math.floor(utc_seconds) + 1,tz_offset)]
+    return timestamp_list
+
+def calendar_timestamps():
+    ''' local times at midnight, new year and leap days with extreme utc offsets '''
+    timestamp_list = []
+    for year in [1900,1901,1970,1999,2000,2023,2024,2099]:
+        date_list = [(1,1,0,0,0),(12,31,23,59,59),(3,1,0,0,0),(6,30,23,59,59)]
+        if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+            date_list += [(2,29,0,0,0),(2,29,23,59,59)]
+        for (month,day,hour,minute,second),tz_offset in itertools.product(date_list,[-12,-3.5,0,5.75,12.75,14]):
+            timestamp_list.append((year,month,day,hour,minute,second,tz_offset))
+    return timestamp_list
+
+def corpus_timestamps(n_random=200000,n_boundary=50000,seed=0):
+    '''
+    timestamps of the golden corpus (same seed, same timestamps)
+    Args:
+        n_random(int): random instants
+        n_boundary(int): boundary instants of birth and of design planets (2 timestamps each)
+    Return:
+        timestamp_list(list of tuple), kind(np.array): index of KIND_LIST
+    '''
+    rng = np.random.default_rng(seed)
+    n_planets = len(hd_ephemeris.PLANET_LIST)
+    random_jd = rng.uniform(START_JD,END_JD,n_random)
+    timestamp_list = [utc_to_timestamp(math.floor(jd_to_utc_seconds(jdut)),
+                                       TZ_OFFSET_LIST[rng.integers(len(TZ_OFFSET_LIST))])
+                      for jdut in random_jd]
+    kind_list = [KIND_LIST.index("random")]*len(timestamp_list)
+
+    birth_jd = solve_boundary(rng.uniform(START_JD,END_JD,n_boundary),rng.integers(n_planets,size=n_boundary),
+                              rng.choice([1,GATE_LINES],n_boundary))
+    design_jd = solve_boundary(rng.uniform(START_JD,END_JD,n_boundary),rng.integers(n_planets,size=n_boundary),
+                               rng.choice([1,GATE_LINES],n_boundary))
+    design_jd = np.where(np.isfinite(design_jd),solve_birth_for_design(np.nan_to_num(design_jd,nan=START_JD)),np.nan)
+    for kind,jd_array in [("birth",birth_jd),("design",design_jd)]:
+        kind_timestamps = boundary_timestamps(jd_array,rng)
+        timestamp_list += kind_timestamps
+        kind_list += [KIND_LIST.index(kind)]*len(kind_timestamps)
+    calendar_list = calendar_timestamps()
+    timestamp_list += calendar_list
+    kind_list += [KIND_LIST.index("calendar")]*len(calendar_list)
+
+    return timestamp_list,np.array(kind_list,dtype=np.int8)
+
+def result_fields(result_list):
+    '''
+    field arrays (see FIELD_LIST) of results in calc_single_hd_features format
+    Return:
+        fields(dict): field -> np.array, activation fields shape (N,26)
+    '''
+    fields = {"typ":[],"auth":[],"inc_cross":[],"inc_cross_typ":[],"profile":[],"split":[],
+              "active_chakras":[],"active_channels":[],"create_date":[]}
+    for key in ACTIVATION_FIELD_LIST:
+        fields[key] = []
+    for typ,auth,inc_cross,inc_cross_typ,profile,split,gate_dict,chakras,channels_dict,_,cdate in result_list:
+        fields["typ"].append(typ)
+        fields["auth"].append(auth)
+        fields["inc_cross"].append(inc_cross)
+        fields["inc_cross_typ"].append(inc_cross_typ)
+        fields["profile"].append(profile)
+        fields["split"].append(split)
+        fields["active_chakras"].append(sum(1 << hd_constants.CHAKRA_LIST.index(chakra) for chakra in chakras))
+        fields["active_channels"].append(sum(1 << hd.channel_index_dict[(int(gate),int(ch_gate))]
+                                             for gate,ch_gate in zip(channels_dict["gate"],channels_dict["ch_gate"])))
+        fields["create_date"].append(cdate)
+        for key in ACTIVATION_FIELD_LIST:
+            fields[key].append(gate_dict[key])
+    return {key:np.array(value,dtype=np.uint64 if key == "active_channels" else None)
+            for key,value in fields.items()}
+
+def engine_reference(timestamp_list):
+    ''' reference path: calc_single_hd_features, one timestamp at a time '''
+    return result_fields([hd.calc_single_hd_features(timestamp) for timestamp in timestamp_list])
+
+def engine_batch(timestamp_list):
+    ''' batch ephemeris, vectorized design date solver and kernels (calc_hd_features_jd) '''
+    bdate_list = ["{}".format(timestamp[:-2]) for timestamp in timestamp_list]
+    return result_fields(hd.calc_hd_features_jd(hd_ephemeris.timestamps_to_jd(timestamp_list),bdate_list))
+
+def engine_store(timestamp_list):
+    ''' calc_hd_features_batch: persistent chart store (HD_STORE_PATH) if configured '''
+    return result_fields(hd.calc_hd_features_batch(timestamp_list))
+
+def engine_kernels(timestamp_list):
+    ''' ChartBatch and classify_batch (table lookups), no per chart python '''
+    charts = hd_chart.ChartBatch.from_jd(hd_ephemeris.timestamps_to_jd(timestamp_list))
+    result = charts.classify()
+    cross = result["inc_cross"].astype(int)
+    fields = {"typ":np.asarray(result["typ"]).astype(str),
+              "auth":np.asarray(result["auth"]).astype(str),
+              "inc_cross_typ":np.asarray(result["inc_cross_typ"]).astype(str),
+              "profile":result["profile"],
+              "split":result["split"],
+              "active_chakras":result["center_mask"],
+              "active_channels":result["channel_mask"],
+             }
+    fields["inc_cross"] = np.array(["(({}, {}), ({}, {}))-{}".format(*row,typ)
+                                    for row,typ in zip(cross.tolist(),fields["inc_cross_typ"])])
+    for key in ["gate","line","color","tone","base","lon"]:
+        fields[key] = charts.data["activation"][key]
+    return fields
+
+class FileEngine:
+    '''
+    engine of a table/index file, picklable (run_engine with num_cpu > 1):
+    only the path is sent, the file is opened on first use in every process
+    Args:
+        path(str): table/index file
+    '''
+    def __init__(self,path):
+        self.path = path
+        self._file = None
+
+    def __getstate__(self):
+        return {"path":self.path,"_file":None}
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = self.open(self.path)
+        return self._file
+
+class PositionTableEngine(FileEngine):
+    ''' batch engine with approximate positions of a chebyshev table (see hd_chebyshev) '''
+    def open(self,path):
+        import hd_chebyshev
+        return hd_chebyshev.ChebyshevTable(path)
+
+    def __call__(self,timestamp_list):
+        previous = hd_ephemeris._position_table
+        hd_ephemeris.use_position_table(self.file)
+        try:
+            return engine_batch(timestamp_list)
+        finally:
+            hd_ephemeris.use_position_table(previous)
+
+class EventIndexEngine(FileEngine):
+    ''' gates and lines from the crossing event index (see hd_events) '''
+    def open(self,path):
+        return hd_events.EventIndex(path)
+
+    def __call__(self,timestamp_list):
+        jd_array = hd_ephemeris.timestamps_to_jd(timestamp_list)
+        covered = self.file.chart_covers(jd_array)
+        gate = np.zeros((len(jd_array),2*len(hd_constants.SWE_PLANET_DICT)),dtype=np.int64)
+        line = np.zeros_like(gate)
+        if covered.any():
+            gate[covered],line[covered] = self.file.chart_at(jd_array[covered])
+        return {"gate":gate,"line":line,"skipped":~covered} #birth or design date outside of index span
+
+#engines without arguments, position_table and event_index need a file (see main)
+ENGINE_DICT = {"reference":engine_reference,
+               "batch":engine_batch,
+               "store":engine_store,
+               "kernels":engine_kernels,
+              }
+
+def run_engine(engine,timestamp_list,num_cpu=1):
+    ''' fields of all timestamps, engine is called with chunks of CHUNK_SIZE '''
+    chunk_list = [timestamp_list[idx:idx+CHUNK_SIZE] for idx in range(0,len(timestamp_list),CHUNK_SIZE)]
+    if num_cpu > 1:
+        with Pool(num_cpu) as pool:
+            chunk_fields = pool.map(engine,chunk_list,chunksize=1)
+    else:
+        chunk_fields = [engine(chunk) for chunk in chunk_list]
+    return {key:np.concatenate([fields[key] for fields in chunk_fields]) for key in chunk_fields[0]}
+
+def build_corpus(path,n_random=200000,n_boundary=50000,seed=0,num_cpu=1):
+    '''
+    write golden corpus (np.savez_compressed): timestamps, kind, reference fields
+    Return:
+        count(int): number of timestamps
+    '''
+    timestamp_list,kind = corpus_timestamps(n_random,n_boundary,seed)
+    fields = run_engine(engine_reference,timestamp_list,num_cpu)
+    np.savez_compressed(path,
+                        timestamp=np.array([timestamp[:6] for timestamp in timestamp_list],dtype=np.int64),
+                        tz_offset=np.array([timestamp[6] for timestamp in timestamp_list],dtype=np.float64),
+                        kind=kind,
+                        meta=np.array(json.dumps({"seed":seed,"n_random":n_random,"n_boundary":n_boundary,
+                                                  "constants_version":hd_constants.CONSTANTS_VERSION,
+                                                  "swisseph":swe.version})),
+                        **{"field_" + key:value for key,value in fields.items()})
+    return len(timestamp_list)
+
+def load_corpus(path):
+    '''
+    Return:
+        timestamp_list(list of tuple), kind(np.array), fields(dict), meta(dict)
+    '''
+    with np.load(path) as data:
+        timestamp_list = [tuple(timestamp) + (float(tz_offset) if tz_offset % 1 else int(tz_offset),)
+                          for timestamp,tz_offset in zip(data["timestamp"].tolist(),data["tz_offset"].tolist())]
+        fields = {key[len("field_"):]:data[key] for key in data.files if key.startswith("field_")}
+        return timestamp_list,data["kind"],fields,json.loads(str(data["meta"]))
+
+def diff_fields(expected,actual,lon_tolerance=LON_TOLERANCE):
+    '''
+    field level differences of fields present in both
+    Return:
+        diff_list(list of tuple): (index,field,column,expected,actual), column None for scalar fields
+    '''
+    diff_list = []
+    for key in FIELD_LIST:
+        if key not in expected or key not in actual:
+            continue
+        exp,act = np.asarray(expected[key]),np.asarray(actual[key])
+        if key == "lon":
+            mismatch = ~(np.abs((act - exp + 180) % 360 - 180) <= lon_tolerance)
+        else:
+            mismatch = exp != act.astype(exp.dtype) if exp.dtype.kind != "U" else exp != act.astype(str)
+        for position in zip(*np.nonzero(mismatch)):
+            row = position[0]
+            column = int(position[1]) if len(position) > 1 else None
+            if key == "profile": #profile is one value
+                if column:
+                    continue
+                column,exp_value,act_value = None,exp[row].tolist(),act[row].tolist()
+            else:
+                exp_value,act_value = exp[position].item(),act[position].item()
+            diff_list.append((int(row),key,column,exp_value,act_value))
+    return diff_list
+
+def verify(path,engine,num_cpu=1,lon_tolerance=LON_TOLERANCE,out=None):
+    '''
+    run engine on corpus and compare with the reference fields
+    Args:
+        engine: callable timestamp_list -> fields (see ENGINE_DICT), optional field
+                "skipped": bool mask of rows the engine does not cover (not compared)
+        out(str): NDJSON file of all differences (optional)
+    Return:
+        summary(dict): timestamps, skipped rows, compared fields, differences per field and per kind
+    '''
+    timestamp_list,kind,expected,_ = load_corpus(path)
+    actual = run_engine(engine,timestamp_list,num_cpu)
+    skipped = actual.pop("skipped",np.zeros(len(timestamp_list),dtype=bool))
+    diff_list = [diff for diff in diff_fields(expected,actual,lon_tolerance) if not skipped[diff[0]]]
+    summary = {"timestamps":len(timestamp_list),
+               "skipped":int(skipped.sum()),
+               "fields":[key for key in FIELD_LIST if key in expected and key in actual],
+               "differences":len(diff_list),
+               "by_field":{},
+               "by_kind":{},
+               "charts":len({row for row,*_ in diff_list}),
+              }
+    for row,key,*_ in diff_list:
+        summary["by_field"][key] = summary["by_field"].get(key,0) + 1
+        summary["by_kind"][KIND_LIST[kind[row]]] = summary["by_kind"].get(KIND_LIST[kind[row]],0) + 1
+    if out:
+        with open(out,"w") as f:
+            for row,key,column,exp_value,act_value in diff_list:
+                f.write(json.dumps({"index":row,"timestamp":timestamp_list[row],"kind":KIND_LIST[kind[row]],
+                                    "field":key,"column":column,"expected":exp_value,"actual":act_value}) + "\n")
+    return summary
+
+def reference_definition(channel_list):
+    '''
+    defined centers, split, type and authority of channels by graph search,
+    independent of the tables of hd_kernels (same rules as hd_kernels.get_definition_table)
+    Args:
+        channel_list(list of tuple): channels, keys of GATES_CHAKRA_DICT
+    Return:
+        definition(dict): "center_mask","split","typ","auth"
+    '''
+    neighbour_dict = {}
+    for channel in channel_list:
+        chakra_1,chakra_2 = hd_constants.GATES_CHAKRA_DICT[channel]
+        neighbour_dict.setdefault(chakra_1,set()).add(chakra_2)
+        neighbour_dict.setdefault(chakra_2,set()).add(chakra_1)
+    component_dict = {}
+    for start in neighbour_dict:
+        if start in component_dict:
+            continue
+        stack = [start]
+        while stack:
+            chakra = stack.pop()
+            if chakra not in component_dict:
+                component_dict[chakra] = start
+                stack += neighbour_dict[chakra]
+    def connected(chakra_1,chakra_2):
+        return chakra_1 in component_dict and component_dict[chakra_1] == component_dict.get(chakra_2)
+    motor_to_throat = any(connected(motor,"TT") for motor in hd_kernels.MOTOR_LIST)
+    if not neighbour_dict:
+        typ = "REFLECTOR"
+    elif "SL" in neighbour_dict:
+        typ = "MANIFESTING GENERATOR" if motor_to_throat else "GENERATOR"
+    else:
+        typ = "MANIFESTOR" if motor_to_throat else "PROJECTOR"
+    if "SP" in neighbour_dict:
+        auth = "SP"
+    elif "SL" in neighbour_dict:
+        auth = "SL"
+    elif "SN" in neighbour_dict:
+        auth = "SN"
+    elif connected("HT","TT"):
+        auth = "HT"
+    elif connected("GC","TT"):
+        auth = "GC"
+    elif connected("HT","GC"):
+        auth = "HT_GC"
+    else:
+        auth = "outher_auth"
+    return {"center_mask":sum(1 << hd_constants.CHAKRA_LIST.index(chakra) for chakra in neighbour_dict),
+            "split":len(set(component_dict.values())),
+            "typ":typ,
+            "auth":auth}
+
+def channel_subsets(per_size=5000,seed=0):
+    '''
+    stratified sample of channel subsets: every size 0..36, all subsets of a size
+    if there are at most per_size, else per_size random subsets
+    Return:
+        channel_mask(np.array): uint64, bit i: hd_kernels.CHANNEL_LIST[i]
+    '''
+    rng = np.random.default_rng(seed)
+    n_channels = len(hd_kernels.CHANNEL_LIST)
+    mask_list = []
+    for size in range(n_channels + 1):
+        if math.comb(n_channels,size) <= per_size:
+            mask_list += [sum(1 << idx for idx in subset) for subset in itertools.combinations(range(n_channels),size)]
+        else:
+            for _ in range(per_size):
+                mask_list.append(sum(1 << int(idx) for idx in rng.choice(n_channels,size,replace=False)))
+    return np.array(mask_list,dtype=np.uint64)
+
+def edge_channel_subsets():
+    ''' one channel subset per center connection mask (all 2**len(CENTER_EDGE_LIST)), first channel of every edge '''
+    first_channel = [int(np.flatnonzero(hd_kernels.CHANNEL_EDGE_INDEX == edge)[0])
+                     for edge in range(len(hd_kernels.CENTER_EDGE_LIST))]
+    return np.array([sum(1 << first_channel[edge] for edge in range(len(first_channel)) if edge_mask >> edge & 1)
+                     for edge_mask in range(2**len(first_channel))],dtype=np.uint64)
+
+def check_classifier(per_size=5000,seed=0):
+    '''
+    compare the kernel classifier (masks and definition table) and the
+    single chart functions of hd_features with reference_definition
+    Return:
+        summary(dict): "subsets" checked, "differences" list of (channel mask,path,field,expected,actual)
+    '''
+    table = hd_kernels.get_definition_table()
+    channel_mask = np.concatenate([edge_channel_subsets(),channel_subsets(per_size,seed)])
+    edge_mask = hd_kernels.channel_mask_to_edge_mask(channel_mask)
+    kernel_dict = {"center_mask":hd_kernels.channel_mask_to_center_mask(channel_mask),
+                   "split":table["split"][edge_mask],
+                   "typ":np.array(hd_kernels.TYP_LIST)[table["typ"][edge_mask]],
+                   "auth":np.array(hd_kernels.AUTH_LIST)[table["auth"][edge_mask]]}
+    difference_list = []
+    for idx,mask in enumerate(channel_mask.tolist()):
+        channel_list = [channel for bit,channel in enumerate(hd_kernels.CHANNEL_LIST) if mask >> bit & 1]
+        expected = reference_definition(channel_list)
+        chakra_list = [hd_constants.GATES_CHAKRA_DICT[channel] for channel in channel_list]
+        channels_dict = {"gate_chakra":[chakras[0] for chakras in chakra_list],
+                         "ch_gate_chakra":[chakras[1] for chakras in chakra_list]}
+        active_chakras = hd_kernels.center_mask_to_chakras(expected["center_mask"])
+        single_dict = {"typ":hd.get_typ(channels_dict,active_chakras),
+                       "auth":hd.get_auth(active_chakras,channels_dict),
+                       "split":hd.get_split(channels_dict,active_chakras)}
+        for key,value in expected.items():
+            if kernel_dict[key][idx] != value:
+                difference_list.append((mask,"kernels",key,value,kernel_dict[key][idx].item()))
+            if key in single_dict and single_dict[key] != value:
+                difference_list.append((mask,"hd_features",key,value,single_dict[key]))
+    return {"subsets":len(channel_mask),"differences":difference_list}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="golden corpus differential harness")
+    subparsers = parser.add_subparsers(dest="command",required=True)
+    build_parser = subparsers.add_parser("build",help="write corpus with results of the reference path")
+    build_parser.add_argument("path",help="corpus file (.npz)")
+    build_parser.add_argument("--random",type=int,default=200000,help="random instants")
+    build_parser.add_argument("--boundary",type=int,default=50000,help="boundary instants of birth and design planets")
+    build_parser.add_argument("--seed",type=int,default=0)
+    build_parser.add_argument("--num-cpu",type=int,default=1)
+    verify_parser = subparsers.add_parser("verify",help="compare an engine with the corpus")
+    verify_parser.add_argument("path",help="corpus file (.npz)")
+    verify_parser.add_argument("engine",choices=list(ENGINE_DICT) + ["position_table","event_index"])
+    verify_parser.add_argument("--table",help="file of position_table/event_index engine")
+    verify_parser.add_argument("--lon-tolerance",type=float,default=LON_TOLERANCE,help="degrees")
+    verify_parser.add_argument("--num-cpu",type=int,default=1)
+    verify_parser.add_argument("--out",help="NDJSON file of all differences")
+    classifier_parser = subparsers.add_parser("classifier",help="check classifier on channel subsets")
+    classifier_parser.add_argument("--per-size",type=int,default=5000,help="random subsets per subset size")
+    classifier_parser.add_argument("--seed",type=int,default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print("{} timestamps".format(build_corpus(args.path,args.random,args.boundary,args.seed,args.num_cpu)))
+        return 0
+    if args.command == "classifier":
+        summary = check_classifier(args.per_size,args.seed)
+        for mask,path,key,expected,actual in summary["differences"][:100]:
+            print("channel mask {:#011x} {}: {} expected {} actual {}".format(mask,path,key,expected,actual))
+        print("{} subsets, {} differences".format(summary["subsets"],len(summary["differences"])))
+        return 1 if summary["differences"] else 0
+
+    if args.engine in ENGINE_DICT:
+        engine = ENGINE_DICT[args.engine]
+    else:
+        if not args.table:
+            parser.error("--table is required for engine {}".format(args.engine))
+        engine = (PositionTableEngine if args.engine == "position_table" else EventIndexEngine)(args.table)
+    summary = verify(args.path,engine,args.num_cpu,args.lon_tolerance,args.out)
+    print(json.dumps(summary,indent=2))
+    return 1 if summary["differences"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+vectorized numpy kernels of hd calculations
+    same arithmetic as the scalar functions of hd_features,
+    operation order is kept, so results are identical (bit for bit)
+"""
+import hd_constants
+import numpy as np
+
+#activation of one planet: longitude, gate, line, color, tone, base
+ACTIVATION_DTYPE = np.dtype([("lon","<f8"),
+                             ("gate","i1"),
+                             ("line","i1"),
+                             ("color","i1"),
+                             ("tone","i1"),
+                             ("base","i1"),
+                            ])
+
+#array form of IGING_CIRCLE_LIST for lookup with index arrays
+IGING_ARRAY = np.array(hd_constants.IGING_CIRCLE_LIST,dtype=np.int8)
+
+def decompose_longitudes(lon):
+    '''
+    map ecliptic longitudes to gate,line,color,tone,base in one pass,
+        same operations as hd_features.lon_to_gate_dict
+    Args:
+        lon(array like): longitudes (any shape), e.g. output of hd_ephemeris.calc_longitudes
+    Return:
+        activations(np.array): ACTIVATION_DTYPE, same shape as lon
+    '''
+    lon = np.asarray(lon,dtype=np.float64)
+    activations = np.empty(lon.shape,dtype=ACTIVATION_DTYPE)
+    activations["lon"] = lon
+
+    angle = (lon + hd_constants.IGING_offset) % 360 #angles max 360°
+    angle_percentage = angle/360
+    #every product once, left to right as in the scalar path (angle_percentage*64*6*6...)
+    gate_pos = angle_percentage*64
+    line_pos = gate_pos*6
+    color_pos = line_pos*6
+    tone_pos = color_pos*6
+    base_pos = tone_pos*5
+
+    #int() truncation == floor for positive values,
+    #gate index is clipped for the rounding case angle_percentage*64 == 64
+    activations["gate"] = IGING_ARRAY[np.minimum(gate_pos.astype(np.int64),63)]
+    activations["line"] = (line_pos % 6 + 1).astype(np.int8)
+    activations["color"] = (color_pos % 6 + 1).astype(np.int8)
+    activations["tone"] = (tone_pos % 6 + 1).astype(np.int8)
+    activations["base"] = (base_pos % 5 + 1).astype(np.int8)
+
+    return activations
+
+#channels of GATES_CHAKRA_DICT (bit i of channel masks), centers of CHAKRA_LIST (bit j of center masks)
+CHANNEL_LIST = list(hd_constants.GATES_CHAKRA_DICT.keys())
+#64 bit gate mask of both channel gates (bit gate-1)
+CHANNEL_GATE_MASK = np.array([(1 << (gate_1-1)) | (1 << (gate_2-1)) 
+                              for gate_1,gate_2 in CHANNEL_LIST],dtype=np.uint64)
+#center mask of both channel centers
+CHANNEL_CENTER_MASK = np.array([(1 << hd_constants.CHAKRA_LIST.index(chakra_1))
+                                 | (1 << hd_constants.CHAKRA_LIST.index(chakra_2))
+                                 for chakra_1,chakra_2 in hd_constants.GATES_CHAKRA_DICT.values()],
+                                dtype=np.uint16)
+
+def gates_to_mask(gates):
+    '''
+    64 bit masks of active gates (bit gate-1)
+    Args:
+        gates(array like): shape (N,K) gates of N charts (or (K,) for one chart)
+    Return:
+        gate_mask(np.array): uint64, shape (N,) (or scalar for one chart)
+    '''
+    gates = np.asarray(gates,dtype=np.uint64)
+    return np.bitwise_or.reduce(np.left_shift(np.uint64(1),gates-np.uint64(1)),axis=-1)
+
+def gate_mask_to_channel_mask(gate_mask):
+    '''
+    36 bit masks of active channels (bit i: both gates of CHANNEL_LIST[i] active)
+    Args:
+        gate_mask(array like): uint64 gate masks
+    Return:
+        channel_mask(np.array): uint64, same shape
+    '''
+    gate_mask = np.asarray(gate_mask,dtype=np.uint64)
+    active = (gate_mask[...,None] & CHANNEL_GATE_MASK) == CHANNEL_GATE_MASK
+    bits = np.left_shift(np.uint64(1),np.arange(len(CHANNEL_LIST),dtype=np.uint64))
+    return np.bitwise_or.reduce(np.where(active,bits,np.uint64(0)),axis=-1)
+
+def channel_mask_to_center_mask(channel_mask):
+    '''
+    9 bit masks of defined centers (bit j: CHAKRA_LIST[j] is part of an active channel)
+    Args:
+        channel_mask(array like): uint64 channel masks
+    Return:
+        center_mask(np.array): uint16, same shape
+    '''
+    channel_mask = np.asarray(channel_mask,dtype=np.uint64)
+    active = (channel_mask[...,None] >> np.arange(len(CHANNEL_LIST),dtype=np.uint64)) & np.uint64(1)
+    return np.bitwise_or.reduce(np.where(active.astype(bool),CHANNEL_CENTER_MASK,np.uint16(0)),axis=-1)
+
+def center_mask_to_chakras(center_mask):
+    ''' set of defined centers (names of CHAKRA_LIST) of one center mask '''
+    return {chakra for idx,chakra in enumerate(hd_constants.CHAKRA_LIST) if int(center_mask) >> idx & 1}
+
+#distinct center pairs connected by channels (bit k of edge masks)
+CENTER_EDGE_LIST = list(dict.fromkeys(tuple(sorted(chakras,key=hd_constants.CHAKRA_LIST.index))
+                                      for chakras in hd_constants.GATES_CHAKRA_DICT.values()))
+#edge index of every channel of CHANNEL_LIST
+CHANNEL_EDGE_INDEX = np.array([CENTER_EDGE_LIST.index(tuple(sorted(chakras,key=hd_constants.CHAKRA_LIST.index)))
+                               for chakras in hd_constants.GATES_CHAKRA_DICT.values()])
+#motor centers, type and authority categories of the definition table
+MOTOR_LIST = ["SL","HT","SP","RT"]
+TYP_LIST = ["REFLECTOR","GENERATOR","MANIFESTING GENERATOR","PROJECTOR","MANIFESTOR"]
+AUTH_LIST = ["SP","SL","SN","HT","GC","HT_GC","outher_auth"]
+
+#edge mask -> definition (see get_definition_table)
+_definition_table = None
+
+def channel_mask_to_edge_mask(channel_mask):
+    '''
+    masks of connected center pairs (bit k: CENTER_EDGE_LIST[k])
+    Args:
+        channel_mask(array like): uint64 channel masks
+    Return:
+        edge_mask(np.array): int64, same shape
+    '''
+    channel_mask = np.asarray(channel_mask,dtype=np.uint64)
+    active = ((channel_mask[...,None] >> np.arange(len(CHANNEL_LIST),dtype=np.uint64)) 
+              & np.uint64(1)).astype(bool)
+    return np.bitwise_or.reduce(np.where(active,np.left_shift(1,CHANNEL_EDGE_INDEX),0),axis=-1)
+
+def get_definition_table():
+    '''
+    definition of every possible edge mask (2**len(CENTER_EDGE_LIST) entries), built once:
+        connected components of the defined centers (label propagation),
+        split, type and authority as pure functions of the center connections
+    Return:
+        table(dict): arrays indexed by edge mask:
+            "component": (M,9) component id per center (-1: undefined)
+            "center_mask": defined centers (bit j: CHAKRA_LIST[j])
+            "split": number of components (0: no definition)
+            "typ": index of TYP_LIST
+            "auth": index of AUTH_LIST
+    '''
+    global _definition_table
+    if _definition_table is not None:
+        return _definition_table
+    chakra_idx = {chakra:idx for idx,chakra in enumerate(hd_constants.CHAKRA_LIST)}
+    edge_mask = np.arange(2**len(CENTER_EDGE_LIST))
+    edge_active = ((edge_mask[:,None] >> np.arange(len(CENTER_EDGE_LIST))) & 1).astype(bool)
+    n_centers = len(hd_constants.CHAKRA_LIST)
+
+    defined = np.zeros((len(edge_mask),n_centers),dtype=bool)
+    for k,(chakra_1,chakra_2) in enumerate(CENTER_EDGE_LIST):
+        defined[:,chakra_idx[chakra_1]] |= edge_active[:,k]
+        defined[:,chakra_idx[chakra_2]] |= edge_active[:,k]
+    #label propagation: every center gets the smallest center index of its component
+    component = np.tile(np.arange(n_centers),(len(edge_mask),1))
+    for _ in range(n_centers):
+        for k,(chakra_1,chakra_2) in enumerate(CENTER_EDGE_LIST):
+            a,b = chakra_idx[chakra_1],chakra_idx[chakra_2]
+            low = np.minimum(component[:,a],component[:,b])
+            component[:,a] = np.where(edge_active[:,k],low,component[:,a])
+            component[:,b] = np.where(edge_active[:,k],low,component[:,b])
+    component = np.where(defined,component,-1)
+    split = (component == np.arange(n_centers)).sum(axis=1) #one root center per component
+
+    def connected(chakra_1,chakra_2):
+        comp_1 = component[:,chakra_idx[chakra_1]]
+        return (comp_1 >= 0) & (comp_1 == component[:,chakra_idx[chakra_2]])
+    is_defined = {chakra:defined[:,idx] for chakra,idx in chakra_idx.items()}
+    motor_to_throat = np.zeros(len(edge_mask),dtype=bool)
+    for motor in MOTOR_LIST:
+        motor_to_throat |= connected(motor,"TT")
+
+    typ = np.select([~defined.any(axis=1),
+                     is_defined["SL"] & motor_to_throat,
+                     is_defined["SL"],
+                     motor_to_throat],
+                    [TYP_LIST.index("REFLECTOR"),
+                     TYP_LIST.index("MANIFESTING GENERATOR"),
+                     TYP_LIST.index("GENERATOR"),
+                     TYP_LIST.index("MANIFESTOR")],
+                    TYP_LIST.index("PROJECTOR"))
+    auth = np.select([is_defined["SP"],
+                      is_defined["SL"],
+                      is_defined["SN"],
+                      connected("HT","TT"),
+                      connected("GC","TT"),
+                      connected("HT","GC")],
+                     [AUTH_LIST.index(auth) for auth in ["SP","SL","SN","HT","GC","HT_GC"]],
+                     AUTH_LIST.index("outher_auth"))
+    center_mask = np.bitwise_or.reduce(np.where(defined,1 << np.arange(n_centers),0),axis=1)
+
+    _definition_table = {"component":component.astype(np.int8),
+                         "center_mask":center_mask.astype(np.uint16),
+                         "split":split.astype(np.int8),
+                         "typ":typ.astype(np.int8),
+                         "auth":auth.astype(np.int8),
+                        }
+    return _definition_table
+
+#classify_batch categories
+CROSS_TYP_LIST = list(dict.fromkeys(hd_constants.IC_CROSS_TYP.values()))
+VARIABLE_KEYS = ["right_up","right_down","left_up","left_down"]
+#tone columns of variables: sun and north node at birth and design
+VARIABLE_COLUMNS = [0,3,len(hd_constants.SWE_PLANET_DICT),len(hd_constants.SWE_PLANET_DICT)+3]
+
+def classify_batch(activations):
+    '''
+    classify N charts with array operations and table lookups,
+        same results as the single chart functions of hd_features
+        (get_typ,get_auth,get_split,get_inc_cross,get_profile,get_variables)
+    Args:
+        activations(np.array): ACTIVATION_DTYPE, shape (N,26), personality first,
+                               planets in order of SWE_PLANET_DICT (e.g. ChartBatch.data["activation"])
+    Return:
+        result(dict): 
+            "typ","auth","inc_cross_typ": pd.Categorical
+            "split": int8 (N,)
+            "profile": int8 (N,2), sorted to IC_CROSS_TYP format
+            "inc_cross": int8 (N,4), sun&earth gates at birth and design
+            "variables": str (N,4) left/right, columns VARIABLE_KEYS
+            "gate_mask","channel_mask": uint64 (N,), "center_mask": uint16 (N,)
+    '''
+    design_idx = len(hd_constants.SWE_PLANET_DICT)
+    gate = activations["gate"]
+    line = activations["line"]
+    
+    gate_mask = gates_to_mask(gate)
+    channel_mask = gate_mask_to_channel_mask(gate_mask)
+    edge_mask = channel_mask_to_edge_mask(channel_mask)
+    table = get_definition_table()
+
+    #profile and cross type: lookup tables of (birth sun line, design sun line)
+    cross_typ_table = np.full((7,7),-1,dtype=np.int8)
+    profile_table = np.zeros((7,7,2),dtype=np.int8)
+    for line_1,line_2 in hd_constants.IC_CROSS_TYP: #reversed lines sorted to known format
+        profile_table[line_2,line_1] = (line_1,line_2)
+    for (line_1,line_2),cross_typ in hd_constants.IC_CROSS_TYP.items(): #known format kept (e.g. 2/5 and 5/2)
+        cross_typ_table[line_1,line_2] = CROSS_TYP_LIST.index(cross_typ)
+        profile_table[line_1,line_2] = (line_1,line_2)
+    for line_1 in range(1,7):
+        for line_2 in range(1,7):
+            if not profile_table[line_1,line_2].any(): #unknown profile, kept as it is
+                profile_table[line_1,line_2] = (line_1,line_2)
+    sun_lines = (line[:,0].astype(np.int64),line[:,design_idx].astype(np.int64))
+    cross_typ = cross_typ_table[sun_lines]
+    if (cross_typ < 0).any():
+        raise KeyError("profile without cross type (IC_CROSS_TYP)")
+
+    tones = activations["tone"][:,VARIABLE_COLUMNS]
+    import pandas as pd #only needed for categorical results, not at import time
+
+    return {"typ":pd.Categorical.from_codes(table["typ"][edge_mask],TYP_LIST),
+            "auth":pd.Categorical.from_codes(table["auth"][edge_mask],AUTH_LIST),
+            "split":table["split"][edge_mask],
+            "profile":profile_table[sun_lines],
+            "inc_cross":gate[:,[0,1,design_idx,design_idx+1]],
+            "inc_cross_typ":pd.Categorical.from_codes(cross_typ,CROSS_TYP_LIST),
+            "variables":np.where(tones <= 3,"left","right"),
+            "gate_mask":gate_mask,
+            "channel_mask":channel_mask,
+            "center_mask":table["center_mask"][edge_mask],
+           }
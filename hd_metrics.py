@@ -0,0 +1,289 @@
+"""
+pipeline metrics in prometheus text format (no client library needed)
+    stage histograms:   duration of every pipeline stage (see STAGE_LIST), recorded by
+                        stage(name) blocks or @timed(name) functions. Stages that run
+                        in worker processes are collected per call (measured_call) and
+                        merged into the histograms of the api process.
+    request metrics:    in flight requests and request duration (RequestMetrics
+                        middleware, begin_request/end_request)
+    scrape time values: cache hits/misses/hit ratio, geocoder sources, worker pool
+                        queue depth and in flight calculations, readiness
+
+    environment variables:
+        HD_METRICS   0 disables recording: stage() returns a shared no-op context and
+                     @timed returns the undecorated function (set before import)
+"""
+import os
+import sys
+import time
+import threading
+import functools
+from bisect import bisect_left
+from contextlib import nullcontext
+
+enabled = os.getenv("HD_METRICS","1") != "0"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+#upper bounds (seconds) of histogram buckets
+BUCKET_LIST = [0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0,10.0,30.0]
+#stages of /calculate, exported from the start (also without observations)
+STAGE_LIST = ["request",          #whole http request (middleware)
+              "geocode",          #place -> coordinates (gazetteer, cache, Nominatim)
+              "timezone",         #coordinates -> zone (TimezoneFinder, cache misses only)
+              "utc_offset",       #local time + zone -> utc offset
+              "worker",           #worker pool call incl. queueing
+              "chart_store",      #lookup of stored charts
+              "create_date",      #design date solver
+              "date_to_gate",     #planetary positions -> activations
+              "classification",   #type, authority, profile, channels, ... of one chart
+              "build_response",   #response dict of a chart
+              "serialization",    #encoding of the response body
+             ]
+
+_NULL_CONTEXT = nullcontext()
+_local = threading.local()
+_lock = threading.Lock()
+_histogram_dict = {}
+_requests_in_flight = 0
+
+class Histogram:
+    '''
+    cumulative latency histogram (thread safe)
+    Args:
+        bucket_list(list of float): upper bounds in seconds
+    '''
+    __slots__ = ("bucket_list","counts","sum","count","_lock")
+
+    def __init__(self,bucket_list=BUCKET_LIST):
+        self.bucket_list = bucket_list
+        self.counts = [0]*(len(bucket_list)+1) #last: above largest bucket
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self,seconds):
+        idx = bisect_left(self.bucket_list,seconds)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        ''' cumulative bucket counts, sum and count '''
+        with self._lock:
+            counts,total,count = list(self.counts),self.sum,self.count
+        cumulative = []
+        for value in counts:
+            cumulative.append(value + (cumulative[-1] if cumulative else 0))
+        return cumulative,total,count
+
+class StageTimer:
+    ''' context manager, records the duration of its block as stage name '''
+    __slots__ = ("name","start")
+
+    def __init__(self,name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc_info):
+        observe(self.name,time.perf_counter() - self.start)
+        return False
+
+def get_histogram(name):
+    histogram = _histogram_dict.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histogram_dict.setdefault(name,Histogram())
+    return histogram
+
+def observe(name,seconds):
+    ''' record duration of stage name (collected for the caller inside measured_call) '''
+    collect = getattr(_local,"collect",None)
+    if collect is not None:
+        collect.append((name,seconds))
+    else:
+        get_histogram(name).observe(seconds)
+
+def stage(name):
+    '''
+    context manager timing a pipeline stage, e.g.
+        with hd_metrics.stage("geocode"):
+            ...
+    '''
+    if not enabled:
+        return _NULL_CONTEXT
+    return StageTimer(name)
+
+def timed(name):
+    ''' decorator: every call is recorded as stage name (function is returned unchanged if disabled) '''
+    def decorator(func):
+        if not enabled:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args,**kwargs)
+            finally:
+                observe(name,time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def measured_call(func,*args):
+    '''
+    func(*args) with the stage durations of this call (e.g. in a worker process)
+    Return:
+        result: return value of func
+        duration_list(list of tuple): (stage name,seconds), see merge
+    '''
+    _local.collect = duration_list = []
+    try:
+        result = func(*args)
+    finally:
+        _local.collect = None
+    return result,duration_list
+
+def merge(duration_list):
+    ''' record stage durations returned by measured_call '''
+    for name,seconds in duration_list:
+        observe(name,seconds)
+
+def begin_request():
+    ''' count request as in flight, Return: start time for end_request '''
+    global _requests_in_flight
+    with _lock:
+        _requests_in_flight += 1
+    return time.perf_counter()
+
+def end_request(start):
+    global _requests_in_flight
+    with _lock:
+        _requests_in_flight -= 1
+    observe("request",time.perf_counter() - start)
+
+class RequestMetrics:
+    '''
+    ASGI middleware: in flight http requests and request duration
+    (streamed responses until the last chunk), pure ASGI so request bodies
+    and streaming responses are passed through untouched
+    '''
+    def __init__(self,app):
+        self.app = app
+
+    async def __call__(self,scope,receive,send):
+        if scope["type"] != "http":
+            return await self.app(scope,receive,send)
+        start = begin_request()
+        try:
+            await self.app(scope,receive,send)
+        finally:
+            end_request(start)
+
+def format_labels(label_dict):
+    if not label_dict:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key,str(value).replace("\\","\\\\").replace('"','\\"'))
+                          for key,value in label_dict.items()) + "}"
+
+def format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value,bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value,float) else str(value)
+
+def format_metric(name,kind,help_text,sample_list):
+    '''
+    lines of one metric
+    Args:
+        sample_list(list of tuple): (label dict,value)
+    '''
+    line_list = ["# HELP {} {}".format(name,help_text),"# TYPE {} {}".format(name,kind)]
+    line_list += ["{}{} {}".format(name,format_labels(labels),format_value(value)) for labels,value in sample_list]
+    return line_list
+
+def format_histograms():
+    name = "hd_stage_duration_seconds"
+    line_list = ["# HELP {} duration of pipeline stages".format(name),"# TYPE {} histogram".format(name)]
+    with _lock:
+        histogram_list = sorted(_histogram_dict.items())
+    for stage_name,histogram in histogram_list:
+        cumulative,total,count = histogram.snapshot()
+        for bound,value in zip(histogram.bucket_list + ["+Inf"],cumulative):
+            line_list.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name,stage_name,bound,value))
+        line_list.append('{}_sum{{stage="{}"}} {}'.format(name,stage_name,repr(total)))
+        line_list.append('{}_count{{stage="{}"}} {}'.format(name,stage_name,count))
+    return line_list
+
+def collect_caches():
+    import hd_cache
+    stats = hd_cache.cache_stats()
+    cache_list = [(name,value) for name,value in stats.items() if isinstance(value,dict)]
+    line_list = format_metric("hd_cache_enabled","gauge","result caches switched on",[({},stats["enabled"])])
+    line_list += format_metric("hd_cache_hits_total","counter","cache hits",
+                               [({"cache":name},value["hits"]) for name,value in cache_list])
+    line_list += format_metric("hd_cache_misses_total","counter","cache misses",
+                               [({"cache":name},value["misses"]) for name,value in cache_list])
+    line_list += format_metric("hd_cache_hit_ratio","gauge","hits / (hits + misses) since start",
+                               [({"cache":name},value["hits"]/(value["hits"] + value["misses"])
+                                                if value["hits"] + value["misses"] else None)
+                                for name,value in cache_list])
+    line_list += format_metric("hd_cache_entries","gauge","cached entries",
+                               [({"cache":name},value["size"]) for name,value in cache_list])
+    return line_list
+
+def collect_geocoder():
+    geocode = sys.modules.get("geocode") #not imported/built by a scrape
+    geocoder = getattr(geocode,"_geocoder",None)
+    if geocoder is None or not isinstance(getattr(geocoder,"stats",None),dict):
+        return []
+    return format_metric("hd_geocode_results_total","counter","geocoding results by source",
+                         [({"source":source},value) for source,value in geocoder.stats.items()])
+
+def collect_pool(pool):
+    stats = pool.stats()
+    line_list = []
+    for key,kind,help_text in [("workers","gauge","worker processes (0: threads)"),
+                               ("max_queue","gauge","max. waiting calculations"),
+                               ("ready","gauge","all workers started and warm"),
+                               ("in_flight","gauge","calculations running or waiting"),
+                               ("queued","gauge","calculations waiting for a worker (queue depth)"),
+                               ("completed","counter","finished calculations"),
+                               ("rejected","counter","calculations rejected, queue full"),
+                               ("failed","counter","failed calculations"),
+                               ("restarts","counter","pool restarts after a worker process died"),
+                              ]:
+        name = "hd_pool_{}{}".format(key,"_total" if kind == "counter" else "")
+        line_list += format_metric(name,kind,help_text,[({},stats[key])])
+    return line_list
+
+def render(pool=None):
+    '''
+    all metrics in prometheus text exposition format
+    Args:
+        pool(hd_workers.WorkerPool): worker pool of the api, optional
+    Return:
+        text(str)
+    '''
+    import hd_runtime
+    line_list = format_metric("hd_metrics_enabled","gauge","stage recording switched on",[({},enabled)])
+    line_list += format_metric("hd_ready","gauge","runtime resources warm",[({},hd_runtime.is_ready())])
+    line_list += format_metric("hd_requests_in_flight","gauge","http requests in progress",[({},_requests_in_flight)])
+    line_list += format_histograms()
+    line_list += collect_caches()
+    line_list += collect_geocoder()
+    if pool is not None:
+        line_list += collect_pool(pool)
+    return "\n".join(line_list) + "\n"
+
+def reset():
+    ''' drop all recorded stage durations '''
+    with _lock:
+        _histogram_dict.clear()
+        if enabled:
+            for name in STAGE_LIST:
+                _histogram_dict[name] = Histogram()
+
+reset()
@@ -0,0 +1,281 @@
+"""
+parallel range calculation into shared memory columns
+    birth julian days are split into contiguous shards. Worker processes are
+    warmed up once (init_worker: ephemeris, design date table, definition table)
+    and calculate every shard vectorized (batch ephemeris, design date solver,
+    ChartBatch, classify_batch). Results are written directly into columnar
+    arrays (see column_layout) of one shared memory block, only shard bounds
+    are sent to the workers and only the number of charts comes back, no result
+    objects are pickled.
+
+    progress is reported in the calling process per finished shard
+    (callback(done,total), e.g. print_progress), no tqdm.
+
+    map_batches runs functions with list results (e.g. calc_hd_features_batch)
+    on the same warm, ordered worker pool.
+
+    iter_range_features streams a time grid in order with bounded memory: the
+    shared block is a ring of window shard slots, a slot is reused as soon as
+    its rows were consumed (e.g. written by a sink of hd_sink).
+"""
+import hd_chart
+import hd_ephemeris
+import hd_kernels
+import hd_runtime
+import os
+import sys
+import numpy as np
+
+#warm up steps of worker processes (see hd_runtime.WARM_UP_STEPS)
+WORKER_WARM_UP_STEPS = ["ephemeris","design_table","definition_table"]
+#charts per shard, shards are handed out one by one (load balancing)
+SHARD_SIZE = 2000
+#min. shards per worker, smaller shards if the range is short
+SHARDS_PER_WORKER = 4
+#shards in flight per worker while streaming (slots of the ring, see iter_range_features)
+STREAM_WINDOW_PER_WORKER = 2
+#alignment (bytes) of columns in the shared memory block
+COLUMN_ALIGN = 64
+#result columns: name -> (dtype,shape per chart)
+#typ,auth,inc_cross_typ: codes of hd_kernels.TYP_LIST,AUTH_LIST,CROSS_TYP_LIST
+COLUMN_DICT = {"birth_jd":(np.float64,()),
+               "create_jd":(np.float64,()),
+               "chart":(hd_chart.CHART_DTYPE,()), #ch_gate not filled
+               "typ":(np.int8,()),
+               "auth":(np.int8,()),
+               "split":(np.int8,()),
+               "profile":(np.int8,(2,)),
+               "inc_cross":(np.int8,(4,)),
+               "inc_cross_typ":(np.int8,()),
+               "gate_mask":(np.uint64,()),
+               "channel_mask":(np.uint64,()),
+               "center_mask":(np.uint16,()),
+              }
+
+_columns = None #columns of the shared memory block in worker processes
+_shared_memory = None
+
+def column_layout(n_charts):
+    '''
+    byte offsets of result columns in one block
+    Return:
+        layout(list of tuple): (name,dtype,shape,offset)
+        size(int): block size in bytes
+    '''
+    layout = []
+    offset = 0
+    for name,(dtype,shape) in COLUMN_DICT.items():
+        dtype = np.dtype(dtype)
+        layout.append((name,dtype,(n_charts,)+shape,offset))
+        size = n_charts*dtype.itemsize*int(np.prod(shape,dtype=np.int64))
+        offset += -(-size//COLUMN_ALIGN)*COLUMN_ALIGN
+    return layout,max(offset,1)
+
+def column_views(buffer,n_charts):
+    ''' result columns (dict of np.array) as views of buffer (see column_layout) '''
+    layout,_ = column_layout(n_charts)
+    return {name:np.ndarray(shape,dtype=dtype,buffer=buffer,offset=offset) for name,dtype,shape,offset in layout}
+
+def attach_shared_memory(name):
+    '''
+    open shared memory block of the parent process, the block is unlinked by its
+    creator (workers share the resource tracker of the parent, untracked if supported)
+    '''
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name,track=False) #python >= 3.13
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def init_worker(name=None,n_charts=0):
+    '''
+    initializer of worker processes: warm up ephemeris and tables,
+    attach the result block (name of shared memory, see calc_range_features)
+    '''
+    global _columns,_shared_memory
+    hd_runtime.warm_up(WORKER_WARM_UP_STEPS)
+    if name is not None:
+        _shared_memory = attach_shared_memory(name)
+        _columns = column_views(_shared_memory.buf,n_charts)
+
+def calc_into(columns,lo,hi):
+    '''
+    calculate charts and features of rows lo:hi of columns["birth_jd"] in place
+    Return:
+        count(int): number of calculated charts
+    '''
+    birth_jd = columns["birth_jd"][lo:hi]
+    create_jd = hd_ephemeris.calc_create_dates(birth_jd)
+    lon = hd_ephemeris.calc_longitudes(np.concatenate([birth_jd,create_jd]))
+    charts = hd_chart.ChartBatch.from_longitudes(lon[:len(birth_jd)],lon[len(birth_jd):])
+    result = charts.classify()
+    columns["create_jd"][lo:hi] = create_jd
+    columns["chart"][lo:hi] = charts.data
+    for key in ["typ","auth","inc_cross_typ"]:
+        columns[key][lo:hi] = result[key].codes
+    for key in ["split","profile","inc_cross","gate_mask","channel_mask","center_mask"]:
+        columns[key][lo:hi] = result[key]
+    return hi - lo
+
+def calc_shard(bounds):
+    ''' worker task: one shard (lo,hi) of the shared result block '''
+    return calc_into(_columns,*bounds)
+
+def calc_grid_slot(task):
+    ''' worker task of iter_range_features: grid rows lo:hi into the slot starting at slot_lo '''
+    slot_lo,jd_start,step_days,lo,hi = task
+    _columns["birth_jd"][slot_lo:slot_lo+hi-lo] = jd_start + np.arange(lo,hi)*step_days
+    return calc_into(_columns,slot_lo,slot_lo+hi-lo)
+
+def shard_bounds(n_charts,num_cpu,shard_size=SHARD_SIZE):
+    ''' contiguous (lo,hi) shards, at least SHARDS_PER_WORKER per worker '''
+    size = max(1,min(shard_size,-(-n_charts//(num_cpu*SHARDS_PER_WORKER))))
+    return [(lo,min(lo+size,n_charts)) for lo in range(0,n_charts,size)]
+
+def print_progress(done,total):
+    ''' progress callback: one updated line on stderr '''
+    sys.stderr.write("\r{}/{} ({:.0%})".format(done,total,done/total if total else 1))
+    if done >= total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+def calc_range_features(birth_jd,num_cpu=None,shard_size=SHARD_SIZE,progress=None):
+    '''
+    charts and features of many birth julian days (e.g. a time range) in parallel,
+    columns are copied out of the shared memory block, which is released afterwards
+    Args:
+        birth_jd(array like): birth julian days (UT)
+        num_cpu(int): worker processes, None: cpu count, 1: calculated in this process
+        shard_size(int): max. charts per worker task
+        progress: callable(done,total) called per finished shard, e.g. print_progress
+    Return:
+        columns(dict of np.array): see COLUMN_DICT, "chart" as hd_chart.ChartBatch
+                                   (typ,auth,inc_cross_typ: codes, see categorical)
+    '''
+    birth_jd = np.asarray(birth_jd,dtype=np.float64).ravel()
+    n_charts = len(birth_jd)
+    num_cpu = num_cpu or os.cpu_count() or 1
+    bounds_list = shard_bounds(n_charts,num_cpu,shard_size)
+    done = 0
+    if num_cpu <= 1 or len(bounds_list) <= 1:
+        columns = {name:np.empty(shape,dtype=dtype) for name,dtype,shape,_ in column_layout(n_charts)[0]}
+        columns["birth_jd"][:] = birth_jd
+        for lo,hi in bounds_list:
+            done += calc_into(columns,lo,hi)
+            if progress:
+                progress(done,n_charts)
+    else:
+        from multiprocessing import Pool, shared_memory
+        shm = shared_memory.SharedMemory(create=True,size=column_layout(n_charts)[1])
+        shared_columns = None
+        try:
+            shared_columns = column_views(shm.buf,n_charts)
+            shared_columns["birth_jd"][:] = birth_jd
+            with Pool(min(num_cpu,len(bounds_list)),initializer=init_worker,initargs=(shm.name,n_charts)) as pool:
+                for count in pool.imap_unordered(calc_shard,bounds_list,chunksize=1):
+                    done += count
+                    if progress:
+                        progress(done,n_charts)
+            columns = {name:value.copy() for name,value in shared_columns.items()}
+        finally:
+            shared_columns = None #release views before closing the block
+            shm.close()
+            shm.unlink()
+    columns["chart"] = hd_chart.ChartBatch(columns["chart"])
+    return columns
+
+def column_row_bytes():
+    ''' bytes of one chart in the result columns (see COLUMN_DICT) '''
+    return column_layout(COLUMN_ALIGN)[1]//COLUMN_ALIGN
+
+def stream_window(num_cpu):
+    ''' shard slots of iter_range_features '''
+    return 1 if num_cpu <= 1 else num_cpu*STREAM_WINDOW_PER_WORKER
+
+def iter_range_features(jd_start,step_days,n_charts,num_cpu=None,shard_size=SHARD_SIZE):
+    '''
+    charts and features of the grid jd_start + i*step_days (i < n_charts) in order,
+    memory is bounded by stream_window(num_cpu) shards, independent of n_charts
+    Args:
+        jd_start(float): first birth julian day (UT)
+        step_days(float): grid step
+        n_charts(int): number of grid points
+        num_cpu(int): worker processes, None: cpu count, 1: calculated in this process
+        shard_size(int): charts per yielded batch (last one shorter)
+    Yield:
+        lo(int): grid index of first row
+        columns(dict of np.array): rows lo:lo+count (see COLUMN_DICT), views of the ring,
+                                   valid until the next iteration (copy to keep them)
+    '''
+    num_cpu = num_cpu or os.cpu_count() or 1
+    window = stream_window(num_cpu)
+    lo_iter = iter(range(0,n_charts,shard_size))
+    if window == 1:
+        columns = {name:np.empty(shape,dtype=dtype) for name,dtype,shape,_ in column_layout(shard_size)[0]}
+        for lo in lo_iter:
+            count = min(shard_size,n_charts-lo)
+            columns["birth_jd"][:count] = jd_start + np.arange(lo,lo+count)*step_days
+            calc_into(columns,0,count)
+            yield lo,dict({name:value[:count] for name,value in columns.items()},
+                          chart=hd_chart.ChartBatch(columns["chart"][:count]))
+        return
+    from collections import deque
+    from multiprocessing import Pool, shared_memory
+    shm = shared_memory.SharedMemory(create=True,size=column_layout(window*shard_size)[1])
+    ring = None
+    try:
+        ring = column_views(shm.buf,window*shard_size)
+        with Pool(num_cpu,initializer=init_worker,initargs=(shm.name,window*shard_size)) as pool:
+            pending = deque()
+            def submit(slot):
+                lo = next(lo_iter,None)
+                if lo is not None:
+                    task = (slot*shard_size,jd_start,step_days,lo,min(lo+shard_size,n_charts))
+                    pending.append((slot,lo,pool.apply_async(calc_grid_slot,(task,))))
+            for slot in range(window):
+                submit(slot)
+            while pending:
+                slot,lo,async_result = pending.popleft()
+                rows = slice(slot*shard_size,slot*shard_size+async_result.get())
+                yield lo,dict({name:value[rows] for name,value in ring.items()},
+                              chart=hd_chart.ChartBatch(ring["chart"][rows]))
+                submit(slot) #slot was consumed
+    finally:
+        ring = None
+        try:
+            shm.close()
+        except BufferError: #views still referenced by the caller, released with them
+            pass
+        shm.unlink()
+
+def categorical(columns,key):
+    ''' codes of typ,auth or inc_cross_typ as pd.Categorical (same as classify_batch) '''
+    import pandas as pd
+    category_dict = {"typ":hd_kernels.TYP_LIST,"auth":hd_kernels.AUTH_LIST,"inc_cross_typ":hd_kernels.CROSS_TYP_LIST}
+    return pd.Categorical.from_codes(columns[key],category_dict[key])
+
+def map_batches(func,batch_list,num_cpu=None,progress=None):
+    '''
+    func(batch) of all batches in warm worker processes, results in order of batch_list
+    Args:
+        func: picklable callable, e.g. hd_features.calc_hd_features_batch
+        progress: callable(done,total) per finished batch (counts batches)
+    Return:
+        result_list(list): one result per batch
+    '''
+    num_cpu = num_cpu or os.cpu_count() or 1
+    if num_cpu <= 1 or len(batch_list) <= 1:
+        result_list = []
+        for batch in batch_list:
+            result_list.append(func(batch))
+            if progress:
+                progress(len(result_list),len(batch_list))
+        return result_list
+    from multiprocessing import Pool
+    result_list = []
+    with Pool(min(num_cpu,len(batch_list)),initializer=init_worker) as pool:
+        for result in pool.imap(func,batch_list,chunksize=1):
+            result_list.append(result)
+            if progress:
+                progress(len(result_list),len(batch_list))
+    return result_list
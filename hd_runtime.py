@@ -0,0 +1,115 @@
+"""
+process wide runtime resources, built once and shared by all requests
+    timezone finder (polygon data in memory), ephemeris (optional chebyshev
+    table HD_POSITION_TABLE), design date table, definition table, geocoder
+    and chart store.
+
+    warm_up() builds all resources, readiness() reports the state, e.g. for
+    the /ready endpoint of the api (start_warm_up() runs in background).
+"""
+import hd_cache
+import hd_ephemeris
+import hd_kernels
+import hd_metrics
+import hd_store
+import os
+import threading
+import time
+
+#chebyshev position table (see hd_chebyshev), empty: swiss ephemeris only
+POSITION_TABLE_PATH = os.getenv("HD_POSITION_TABLE","")
+#julian day of ephemeris warm up call (J2000)
+WARM_UP_JD = 2451545.0
+
+_timezone_finder = None
+_lock = threading.Lock()
+_warm_up_thread = None
+_state = {"ready":False,
+          "started":None,
+          "finished":None,
+          "error":None,
+          "steps":{}, #step name -> seconds
+         }
+
+def get_timezone_finder():
+    ''' process wide TimezoneFinder (in memory mode, created on first call) '''
+    global _timezone_finder
+    with _lock:
+        if _timezone_finder is None:
+            from timezonefinder import TimezoneFinder
+            _timezone_finder = TimezoneFinder(in_memory=True)
+    return _timezone_finder
+
+@hd_metrics.timed("timezone")
+def calc_timezone(latitude,longitude):
+    ''' timezone name of coordinates, "" if no zone was found '''
+    return get_timezone_finder().timezone_at(lat=latitude,lng=longitude) or ""
+
+def timezone_at(latitude,longitude):
+    '''
+    timezone name of coordinates, cached on quantized coordinates (see hd_cache.zone_cache)
+    Return:
+        zone(str): e.g. "Europe/Berlin", None if no zone was found
+    '''
+    key = hd_cache.quantize_coordinates(latitude,longitude)
+    return hd_cache.zone_cache.get_or_set(key,calc_timezone,*key) or None
+
+def init_ephemeris():
+    ''' load position table (if configured) and run a first ephemeris calculation '''
+    if POSITION_TABLE_PATH and hd_ephemeris._position_table is None:
+        import hd_chebyshev
+        hd_ephemeris.use_position_table(hd_chebyshev.ChebyshevTable(POSITION_TABLE_PATH))
+    hd_ephemeris.calc_longitudes([WARM_UP_JD])
+    hd_ephemeris.calc_create_dates([WARM_UP_JD],use_cache=False)
+
+def init_geocoder():
+    import geocode
+    return geocode.get_geocoder()
+
+WARM_UP_STEPS = [("timezone_finder",get_timezone_finder),
+                 ("ephemeris",init_ephemeris),
+                 ("design_table",hd_ephemeris.get_design_elapsed_table),
+                 ("definition_table",hd_kernels.get_definition_table),
+                 ("geocoder",init_geocoder),
+                 ("chart_store",hd_store.get_default_store),
+                ]
+
+def warm_up(step_names=None):
+    '''
+    build runtime resources (steps of WARM_UP_STEPS), sets ready state
+    Args:
+        step_names(list of str): names of steps, None: all steps
+    Return:
+        state(dict): see readiness
+    '''
+    _state.update(ready=False,started=time.time(),finished=None,error=None,steps={})
+    try:
+        for name,func in WARM_UP_STEPS:
+            if step_names is not None and name not in step_names:
+                continue
+            t_start = time.perf_counter()
+            func()
+            _state["steps"][name] = round(time.perf_counter() - t_start,4)
+    except Exception as e:
+        _state["error"] = "{}: {}".format(name,e)
+        raise
+    finally:
+        _state["finished"] = time.time()
+    _state["ready"] = True
+    return readiness()
+
+def start_warm_up():
+    ''' run warm_up in a background thread (once per process) '''
+    global _warm_up_thread
+    with _lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up,name="hd_warm_up",daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+def is_ready():
+    return _state["ready"]
+
+def readiness():
+    ''' ready flag, start/finish time, error and duration of warm up steps '''
+    return dict(_state,steps=dict(_state["steps"]))
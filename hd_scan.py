@@ -0,0 +1,145 @@
+"""
+event driven scan of a time range
+    instead of fixed steps the scan predicts the next boundary crossing of
+    all activations (personality and design) from planetary speeds and
+    refines the exact change instant. Result is one record per distinct chart
+    interval (start/end julian day), no change between two samples is missed.
+
+    design activations move with rate d(design jd)/d(birth jd) =
+    sun speed at birth / sun speed at design date.
+"""
+import hd_constants
+import hd_ephemeris
+import hd_events
+from hd_chebyshev import BOUNDARY_DIVISION_DICT
+import numpy as np
+
+#precision of change instants in days (~1ms)
+CHANGE_TOLERANCE = 1e-8
+#max. prediction step per activation in days (stations: speed ~0)
+MAX_STEP_LIST = [hd_events.STEP_DICT[code] for code in hd_constants.SWE_PLANET_DICT.values()]*2
+
+def calc_chart_state(jdut,division):
+    '''
+    positions and speeds of all activations (personality, design) in boundary units
+    Args:
+        jdut(float): birth julian day (UT)
+        division(int): boundaries per circle (see BOUNDARY_DIVISION_DICT)
+    Return:
+        pos(np.array): 2*len(SWE_PLANET_DICT) positions [0,division), personality first
+        vel(np.array): speeds in boundary units per birth day
+    '''
+    create_jd = hd_ephemeris.calc_create_dates([jdut])
+    lon,speed = hd_ephemeris.calc_longitudes(np.append(jdut,create_jd),with_speed=True)
+    sun_idx = hd_ephemeris.PLANET_LIST.index("Sun")
+    design_rate = speed[0,sun_idx]/speed[1,sun_idx]
+    pos = ((lon.ravel() + hd_constants.IGING_offset) % 360)*division/360
+    vel = speed.ravel()*division/360
+    vel[len(hd_ephemeris.PLANET_LIST):] *= design_rate
+
+    return pos,vel
+
+def predict_change(pos,vel):
+    '''
+    predicted time (days) until activations reach the next boundary in motion direction
+    Return:
+        dt(np.array): per activation, limited by MAX_STEP_LIST
+    '''
+    dist = np.where(vel > 0,np.floor(pos)+1-pos,pos-np.floor(pos))
+    with np.errstate(divide="ignore"):
+        dt = dist/np.abs(vel)
+    return np.minimum(dt,MAX_STEP_LIST)
+
+def find_change(t_lo,state_lo,t_hi,state_hi,key,division):
+    '''
+    first instant in (t_lo,t_hi] where chart differs from key,
+        newton estimate from the closer bracket side, two probes around the
+        estimate close the bracket, bisection as safeguard
+    Args:
+        t_lo(float): julian day with chart key
+        state_lo(tuple): pos,vel at t_lo (see calc_chart_state)
+        t_hi(float): julian day with different chart
+        state_hi(tuple): pos,vel at t_hi
+        key(np.array): boundary index of all activations at t_lo
+        division(int): boundaries per circle
+    Return:
+        t_hi(float): change instant (within CHANGE_TOLERANCE)
+        state_hi(tuple): pos,vel at change instant
+    '''
+    while t_hi-t_lo > CHANGE_TOLERANCE:
+        dt_lo = predict_change(*state_lo).min()
+        #time since the earliest crossing of the changed activations
+        pos,vel = state_hi
+        changed = np.floor(pos) != key
+        back = np.where(vel > 0,pos-np.floor(pos),np.floor(pos)+1-pos)
+        dt_hi = (back[changed]/np.abs(vel[changed])).max()
+        t_est = t_lo + dt_lo if dt_lo < dt_hi else t_hi - dt_hi
+        if not (t_lo < t_est < t_hi):
+            t_est = (t_lo+t_hi)/2
+        for t_new in (t_est - 0.45*CHANGE_TOLERANCE,t_est + 0.45*CHANGE_TOLERANCE):
+            if not (t_lo < t_new < t_hi):
+                continue
+            state = calc_chart_state(t_new,division)
+            if (np.floor(state[0]) == key).all():
+                t_lo,state_lo = t_new,state
+            else:
+                t_hi,state_hi = t_new,state
+                break
+
+    return t_hi,state_hi
+
+def scan_chart_intervals(jd_start,jd_end,resolution="line"):
+    '''
+    walk through time range and find all distinct charts
+    Args:
+        jd_start(float): julian day (UT) of first birth instant
+        jd_end(float): julian day (UT) of last birth instant
+        resolution(str): key of BOUNDARY_DIVISION_DICT,
+                         chart changes if any activation crosses this boundary
+    Return:
+        interval_list(list of dict): keys "start_jd","end_jd","index"
+                                     index: boundary index of all activations
+                                     (personality first, order of SWE_PLANET_DICT)
+    '''
+    division = BOUNDARY_DIVISION_DICT[resolution]
+    t = jd_start
+    state = calc_chart_state(t,division)
+    key = np.floor(state[0])
+    interval_list = []
+    t_interval = t
+    while t < jd_end:
+        t_probe = min(t + predict_change(*state).min() + CHANGE_TOLERANCE/2,jd_end)
+        state_probe = calc_chart_state(t_probe,division)
+        if (np.floor(state_probe[0]) == key).all():
+            t,state = t_probe,state_probe
+            continue
+        t_change,state = find_change(t,state,t_probe,state_probe,key,division)
+        interval_list.append({"start_jd":t_interval,
+                              "end_jd":t_change,
+                              "index":key.astype(np.int64),
+                             })
+        t = t_interval = t_change
+        key = np.floor(state[0])
+    interval_list.append({"start_jd":t_interval,
+                          "end_jd":jd_end,
+                          "index":key.astype(np.int64),
+                         })
+
+    return interval_list
+
+def interval_gates_lines(interval_list,resolution="line"):
+    '''
+    gate and line of every activation for list of chart intervals
+    Args:
+        interval_list(list of dict): output of scan_chart_intervals
+        resolution(str): resolution of scan (at least "line" for lines)
+    Return:
+        gate(np.array): shape (len(interval_list),2*len(SWE_PLANET_DICT))
+        line(np.array): same shape, None if resolution is "gate"
+    '''
+    index = np.array([interval["index"] for interval in interval_list])
+    gate = np.array(hd_constants.IGING_CIRCLE_LIST)[index*64//BOUNDARY_DIVISION_DICT[resolution]]
+    if resolution == "gate":
+        return gate,None
+    line = (index*384//BOUNDARY_DIVISION_DICT[resolution]) % 6 + 1
+    return gate,line
@@ -0,0 +1,361 @@
+"""
+streaming output of range calculations with bounded memory
+    stream_range_features calculates a time grid shard by shard (see
+    hd_parallel.iter_range_features) and hands every row group to a sink right
+    away. Memory depends on the row group size and the number of workers, not on
+    the length of the range (estimate_stream_memory). If the estimate exceeds the
+    memory budget, row groups are made smaller (flushed more often), if even
+    MIN_ROW_GROUP does not fit, the scan is refused (MemoryBudgetError).
+
+    sinks: open(n_rows) / write(table) per row group / close(), abort() on errors
+        CsvSink       csv text, header line, one row per chart
+        ParquetSink   parquet file, one row group per write (needs pyarrow)
+        NpzSink       npz archive of one .npy per column (np.load), rows are appended
+                      to .npy files and stored (uncompressed) at close
+
+    table columns (flatten_columns): birth_utc (grid instant, UTC), birth_jd (UT1),
+    create_jd, typ, auth, inc_cross_typ, split, profile_1/2, inc_cross_1..4, gate_mask,
+    channel_mask, center_mask and per activation the fields of activation_fields,
+    e.g. prs_Sun_gate
+
+    python hd_sink.py 1990-01-01 2020-01-01 scan.parquet [--unit minutes] [--intervall 1]
+                      [--num-cpu 8] [--budget-mb 2000] [--fields gate line]
+
+    environment variables:
+        HD_MEMORY_BUDGET_MB   default memory budget (MB) of stream_range_features, 0: none
+"""
+import hd_chart
+import hd_ephemeris
+import hd_kernels
+import hd_parallel
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import swisseph as swe
+
+MEMORY_BUDGET_MB = float(os.getenv("HD_MEMORY_BUDGET_MB","0"))
+#charts per row group (one write of the sink)
+ROW_GROUP = 50000
+#smallest row group used to fit a memory budget
+MIN_ROW_GROUP = 1000
+#memory (MB) of the calling process and of every worker process without results
+#(interpreter, numpy, swisseph, design date and definition tables), measured peak RSS
+BASE_MEMORY_MB = 100
+WORKER_MEMORY_MB = 100
+#activation fields of the table (keys of hd_kernels.ACTIVATION_DTYPE)
+ACTIVATION_FIELDS = ("gate","line")
+#grid step of time units (days), calendar units (months, years) are not uniform
+TIME_UNIT_DICT = {"days":1.0,"hours":1/24,"minutes":1/1440}
+
+class MemoryBudgetError(Exception):
+    ''' estimated memory of a scan exceeds the memory budget, even with the smallest row group '''
+
+def table_columns(activation_fields=ACTIVATION_FIELDS):
+    '''
+    column names and dtypes of the flattened table
+    Return:
+        column_list(list of tuple): (name,dtype)
+    '''
+    column_list = [("birth_utc","datetime64[ms]"),("birth_jd",np.float64),("create_jd",np.float64),
+                   ("typ","<U{}".format(max(map(len,hd_kernels.TYP_LIST)))),
+                   ("auth","<U{}".format(max(map(len,hd_kernels.AUTH_LIST)))),
+                   ("inc_cross_typ","<U{}".format(max(map(len,hd_kernels.CROSS_TYP_LIST)))),
+                   ("split",np.int8),("profile_1",np.int8),("profile_2",np.int8)]
+    column_list += [("inc_cross_{}".format(idx+1),np.int8) for idx in range(4)]
+    column_list += [("gate_mask",np.uint64),("channel_mask",np.uint64),("center_mask",np.uint16)]
+    for idx in range(hd_chart.N_ACTIVATIONS):
+        for key in activation_fields:
+            column_list.append(("{}_{}_{}".format(hd_chart.activation_label(idx),hd_chart.activation_planet(idx),key),
+                                hd_kernels.ACTIVATION_DTYPE[key]))
+    return [(name,np.dtype(dtype)) for name,dtype in column_list]
+
+def jd_to_utc(jdut):
+    ''' UTC instant (np.datetime64 ms) of a julian day (UT1), see swe.jdut1_to_utc '''
+    year,month,day,hour,minute,second = swe.jdut1_to_utc(float(jdut))
+    return np.datetime64(datetime(year,month,day,hour,minute),"ms") + np.timedelta64(int(round(second*1000)),"ms")
+
+def flatten_columns(columns,birth_utc,activation_fields=ACTIVATION_FIELDS):
+    '''
+    one dimensional table columns of result columns (see hd_parallel.COLUMN_DICT)
+    Args:
+        birth_utc(np.array): datetime64[ms] UTC instants of the rows (birth_jd is UT1,
+                             it differs from UTC by up to 0.9 s)
+    Return:
+        table(dict of np.array): keys see table_columns
+    '''
+    table = {"birth_utc":birth_utc,
+             "birth_jd":columns["birth_jd"],
+             "create_jd":columns["create_jd"],
+             "typ":np.array(hd_kernels.TYP_LIST)[columns["typ"]],
+             "auth":np.array(hd_kernels.AUTH_LIST)[columns["auth"]],
+             "inc_cross_typ":np.array(hd_kernels.CROSS_TYP_LIST)[columns["inc_cross_typ"]],
+             "split":columns["split"],
+             "profile_1":columns["profile"][:,0],
+             "profile_2":columns["profile"][:,1],
+            }
+    for idx in range(4):
+        table["inc_cross_{}".format(idx+1)] = columns["inc_cross"][:,idx]
+    for key in ["gate_mask","channel_mask","center_mask"]:
+        table[key] = columns[key]
+    activation = columns["chart"].data["activation"]
+    for idx in range(hd_chart.N_ACTIVATIONS):
+        for key in activation_fields:
+            table["{}_{}_{}".format(hd_chart.activation_label(idx),hd_chart.activation_planet(idx),key)] = activation[key][:,idx]
+    return table
+
+class CsvSink:
+    '''
+    csv file, header line and one line per chart (birth_utc as iso time)
+    Args:
+        path(str): output file
+    '''
+    #memory of one row group relative to the table (text lines)
+    MEMORY_FACTOR = 4
+
+    def __init__(self,path):
+        self.path = path
+        self.file = None
+
+    def open(self,n_rows):
+        self.file = open(self.path,"w",newline="")
+        self.writer = csv.writer(self.file)
+        self.header = False
+
+    def write(self,table):
+        if not self.header:
+            self.writer.writerow(list(table))
+            self.header = True
+        value_list = [np.datetime_as_string(value) if value.dtype.kind == "M" else value.tolist()
+                      for value in table.values()]
+        self.writer.writerows(zip(*value_list))
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            os.remove(self.path)
+
+class ParquetSink:
+    '''
+    parquet file, one row group per write (pyarrow)
+    Args:
+        path(str): output file
+        compression(str): parquet codec, e.g. "snappy", "zstd"
+    '''
+    #memory of one row group relative to the table (arrow table and encoded pages)
+    MEMORY_FACTOR = 3
+
+    def __init__(self,path,compression="snappy"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetSink needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.compression = compression
+        self.writer = None
+
+    def open(self,n_rows):
+        self.writer = None
+
+    def write(self,table):
+        arrow_table = self.pa.table({name:self.pa.array(value) for name,value in table.items()})
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path,arrow_table.schema,compression=self.compression)
+        self.writer.write_table(arrow_table,row_group_size=arrow_table.num_rows)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.path)
+
+class NpzSink:
+    '''
+    npz archive (np.load) with one array per column, rows are appended to .npy
+    files (header with final shape) in a temporary directory next to path and
+    stored at close
+    Args:
+        path(str): output file
+    '''
+    #memory of one row group relative to the table (write buffers)
+    MEMORY_FACTOR = 1
+
+    def __init__(self,path):
+        self.path = path
+        self.directory = None
+
+    def open(self,n_rows):
+        self.n_rows = n_rows
+        self.row = 0
+        self.file_dict = {}
+        self.directory = tempfile.mkdtemp(prefix=".hd_sink_",dir=os.path.dirname(os.path.abspath(self.path)))
+
+    def write(self,table):
+        for name,value in table.items():
+            if name not in self.file_dict:
+                self.file_dict[name] = f = open(os.path.join(self.directory,name + ".npy"),"wb")
+                np.lib.format.write_array_header_2_0(f,{"descr":np.lib.format.dtype_to_descr(value.dtype),
+                                                        "fortran_order":False,"shape":(self.n_rows,)})
+            self.file_dict[name].write(np.ascontiguousarray(value).tobytes())
+        self.row += len(value)
+
+    def close_files(self):
+        for f in self.file_dict.values():
+            f.close()
+        self.file_dict = {}
+
+    def close(self):
+        self.close_files()
+        if self.row != self.n_rows:
+            self.abort()
+            raise ValueError("{} of {} rows written".format(self.row,self.n_rows))
+        with zipfile.ZipFile(self.path,"w",zipfile.ZIP_STORED,allowZip64=True) as archive:
+            for name in os.listdir(self.directory):
+                archive.write(os.path.join(self.directory,name),arcname=name)
+        shutil.rmtree(self.directory)
+
+    def abort(self):
+        self.close_files()
+        if self.directory is not None:
+            shutil.rmtree(self.directory,ignore_errors=True)
+
+SINK_DICT = {".csv":CsvSink,
+             ".parquet":ParquetSink,
+             ".npz":NpzSink,
+            }
+
+def get_sink(path):
+    ''' sink of file extension (see SINK_DICT) '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINK_DICT:
+        raise ValueError("no sink for {} files, use one of {}".format(extension,list(SINK_DICT)))
+    return SINK_DICT[extension](path)
+
+def estimate_stream_memory(row_group,num_cpu,activation_fields=ACTIVATION_FIELDS,memory_factor=1):
+    '''
+    estimated peak memory (MB) of stream_range_features, independent of the range length
+    Args:
+        memory_factor(float): memory of one written row group relative to the table (MEMORY_FACTOR of sink)
+    Return:
+        memory_mb(float): calling process, workers, shard ring and one table
+    '''
+    table_row_bytes = sum(dtype.itemsize for _,dtype in table_columns(activation_fields))
+    ring_bytes = hd_parallel.stream_window(num_cpu)*row_group*hd_parallel.column_row_bytes()
+    table_bytes = row_group*table_row_bytes*(1 + memory_factor)
+    workers = num_cpu if num_cpu > 1 else 0
+    return BASE_MEMORY_MB + workers*WORKER_MEMORY_MB + (ring_bytes + table_bytes)/2**20
+
+def plan_row_group(row_group,num_cpu,activation_fields=ACTIVATION_FIELDS,memory_factor=1,memory_budget_mb=None):
+    '''
+    largest row group <= row_group whose estimated memory fits the budget
+    Raise:
+        MemoryBudgetError: MIN_ROW_GROUP does not fit either (e.g. too many workers)
+    '''
+    if not memory_budget_mb:
+        return row_group
+    while estimate_stream_memory(row_group,num_cpu,activation_fields,memory_factor) > memory_budget_mb:
+        if row_group <= MIN_ROW_GROUP:
+            raise MemoryBudgetError("scan needs ~{:.0f} MB with {} workers, budget {:.0f} MB".format(
+                estimate_stream_memory(row_group,num_cpu,activation_fields,memory_factor),num_cpu,memory_budget_mb))
+        row_group = max(MIN_ROW_GROUP,row_group//2)
+    return row_group
+
+def stream_range_features(jd_start,step_days,n_charts,sink,num_cpu=None,row_group=ROW_GROUP,
+                          activation_fields=ACTIVATION_FIELDS,memory_budget_mb=None,progress=None):
+    '''
+    calculate the grid jd_start + i*step_days (i < n_charts) and write it through sink
+    in row groups (bounded memory, see estimate_stream_memory)
+    Args:
+        sink: CsvSink, ParquetSink, NpzSink or object with open/write/close/abort
+        num_cpu(int): worker processes, None: cpu count
+        row_group(int): max. charts per write
+        activation_fields(tuple of str): fields of every activation in the table
+        memory_budget_mb(float): None: HD_MEMORY_BUDGET_MB, 0: no budget
+        progress: callable(done,total) per row group, e.g. hd_parallel.print_progress
+    Return:
+        n_rows(int): written rows
+    Raise:
+        MemoryBudgetError: estimate exceeds the budget (nothing is calculated)
+    '''
+    num_cpu = num_cpu or os.cpu_count() or 1
+    memory_budget_mb = MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    row_group = plan_row_group(row_group,num_cpu,activation_fields,getattr(sink,"MEMORY_FACTOR",1),memory_budget_mb)
+    #utc grid: same steps from the utc instant of jd_start (whole minutes stay whole minutes)
+    utc_start = jd_to_utc(jd_start)
+    step_ms = np.timedelta64(int(round(step_days*86400000)),"ms")
+    sink.open(n_charts)
+    try:
+        for lo,columns in hd_parallel.iter_range_features(jd_start,step_days,n_charts,num_cpu,row_group):
+            birth_utc = utc_start + np.arange(lo,lo+len(columns["birth_jd"]))*step_ms
+            table = flatten_columns(columns,birth_utc,activation_fields)
+            del columns #slot of the ring is reused after the write
+            sink.write(table)
+            if progress:
+                progress(lo + len(table["birth_jd"]),n_charts)
+    except BaseException:
+        sink.abort()
+        raise
+    sink.close()
+    return n_charts
+
+def timestamp_grid(start_date,end_date,time_unit,intervall):
+    '''
+    uniform grid of a time range (start included, end included if on the grid)
+    Args:
+        start_date(tuple): year,month,day,hour,minute,second,tz_offset
+        end_date(tuple): year,month,day,hour,minute,second,tz_offset (end>start)
+        time_unit(str): days,hours,minutes (key of TIME_UNIT_DICT)
+        intervall(int): step, every X unit
+    Return:
+        jd_start(float), step_days(float), n_charts(int)
+    '''
+    if time_unit not in TIME_UNIT_DICT:
+        raise ValueError("time_unit {} is not uniform, use one of {}".format(time_unit,list(TIME_UNIT_DICT)))
+    jd_start,jd_end = hd_ephemeris.timestamps_to_jd([start_date,end_date])
+    step_days = TIME_UNIT_DICT[time_unit]*intervall
+    if jd_end <= jd_start:
+        raise ValueError('check startdate < enddate')
+    return float(jd_start),step_days,int((jd_end - jd_start)/step_days + 1e-3) + 1 #tolerance: julian day resolution (~40 µs)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="stream a time range scan to csv, parquet or npz")
+    parser.add_argument("start",help="start (UTC), e.g. 1990-01-01 or 1990-01-01T12:00")
+    parser.add_argument("end",help="end (UTC)")
+    parser.add_argument("path",help="output file, format by extension ({})".format(", ".join(SINK_DICT)))
+    parser.add_argument("--unit",default="minutes",choices=list(TIME_UNIT_DICT))
+    parser.add_argument("--intervall",type=int,default=1,help="step in units")
+    parser.add_argument("--num-cpu",type=int,default=None)
+    parser.add_argument("--row-group",type=int,default=ROW_GROUP,help="charts per write")
+    parser.add_argument("--budget-mb",type=float,default=None,help="memory budget (default HD_MEMORY_BUDGET_MB)")
+    parser.add_argument("--fields",nargs="*",default=list(ACTIVATION_FIELDS),choices=list(hd_kernels.ACTIVATION_DTYPE.names),
+                        help="activation fields")
+    args = parser.parse_args(argv)
+
+    start,end = [datetime.fromisoformat(value) for value in (args.start,args.end)]
+    grid = timestamp_grid(start.timetuple()[:6] + (0,),end.timetuple()[:6] + (0,),args.unit,args.intervall)
+    try:
+        n_rows = stream_range_features(*grid,get_sink(args.path),args.num_cpu,args.row_group,tuple(args.fields),
+                                       args.budget_mb,hd_parallel.print_progress)
+    except MemoryBudgetError as e:
+        print(e,file=sys.stderr)
+        return 1
+    print("{} charts written to {}".format(n_rows,args.path))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
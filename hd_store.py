@@ -0,0 +1,316 @@
+"""
+persistent chart store (SQLite), shared by api workers and batch jobs
+    charts are stored as compact activation records (hd_chart, 338 bytes)
+    plus the design julian day, keyed by UTC instant (unix seconds) and
+    store_version (constants, record format, swiss ephemeris version and
+    position source, charts of a position table are not served to swiss
+    ephemeris calculations and vice versa).
+    several processes can read/write the same file (WAL mode).
+
+    the default store is opened on first use if HD_STORE_PATH is set
+    (or by open_store), hd_features.calc_hd_features_batch then reads and
+    fills it.
+
+    command line:
+        python hd_store.py warm hd_store.sqlite --start 2000 1 1 --end 2000 2 1 --unit minutes
+        python hd_store.py stats hd_store.sqlite
+        python hd_store.py purge hd_store.sqlite --table hd_positions.bin
+"""
+import hd_constants
+import hd_ephemeris
+import hd_chart
+import hd_kernels
+import hd_metrics
+import swisseph as swe
+import numpy as np
+import argparse
+import calendar
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+#constants, record format and swiss ephemeris version of stored charts (see store_version)
+VERSION_KEY = (hd_constants.CONSTANTS_VERSION,
+               hd_kernels.ACTIVATION_DTYPE.descr,
+               swe.version)
+#default max. charts (~400 bytes each incl. index)
+MAX_ENTRIES = 10_000_000
+#sqlite: wait for locks of other processes
+BUSY_TIMEOUT = 30.0
+#charts per query/insert statement
+QUERY_CHUNK = 500
+#inserted charts between two size checks of the store (eviction)
+EVICT_INTERVAL = 10000
+
+def store_version(source_key=None):
+    '''
+    version of stored charts: VERSION_KEY and position source
+    Args:
+        source_key(str): key of a position source, None: current source (hd_ephemeris.position_source_key)
+    '''
+    if source_key is None:
+        source_key = hd_ephemeris.position_source_key()
+    return zlib.crc32(repr(VERSION_KEY + (source_key,)).encode())
+
+def instant_key(timestamp):
+    '''
+    store key of a timestamp: UTC unix seconds
+    Args:
+        timestamp(tuple): year,month,day,hour,minute,second,tz_offset
+    Return:
+        key(int)
+    '''
+    local_time = datetime(*timestamp[:5]) + timedelta(seconds=timestamp[5])
+    return calendar.timegm((local_time - timedelta(hours=timestamp[6])).timetuple())
+
+class ChartStore:
+    '''
+    sqlite chart store
+    Args:
+        path(str): database file
+        max_entries(int): charts are evicted (oldest first) above this size,
+                          checked every EVICT_INTERVAL inserted charts
+    '''
+    def __init__(self,path,max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._count = 0 #charts at last size check
+        self._inserted = 0 #charts inserted by this process since last size check
+
+    @property
+    def connection(self):
+        ''' sqlite connection of this thread and process (reopened after fork) '''
+        if getattr(self._local,"pid",None) != os.getpid():
+            connection = sqlite3.connect(self.path,timeout=BUSY_TIMEOUT,isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS charts (
+                                      instant INTEGER NOT NULL,
+                                      version INTEGER NOT NULL,
+                                      activation BLOB NOT NULL,
+                                      create_jd REAL NOT NULL,
+                                      created REAL NOT NULL,
+                                      PRIMARY KEY (instant,version))""")
+            connection.execute("CREATE INDEX IF NOT EXISTS charts_created ON charts(created)")
+            self._local.connection,self._local.pid = connection,os.getpid()
+        return self._local.connection
+
+    def get(self,key_list):
+        '''
+        stored charts of given keys
+        Args:
+            key_list(list of int): keys (see instant_key)
+        Return:
+            found(dict): key -> (activations(np.array ACTIVATION_DTYPE (26,)),create_jd(float))
+        '''
+        found = {}
+        version = store_version()
+        key_list = list(dict.fromkeys(key_list))
+        for idx in range(0,len(key_list),QUERY_CHUNK):
+            chunk = key_list[idx:idx+QUERY_CHUNK]
+            rows = self.connection.execute(
+                "SELECT instant,activation,create_jd FROM charts WHERE version=? AND instant IN ({})"
+                .format(",".join("?"*len(chunk))),[version]+chunk).fetchall()
+            for instant,activation,create_jd in rows:
+                found[instant] = (np.frombuffer(activation,dtype=hd_kernels.ACTIVATION_DTYPE),create_jd)
+        self.hits += len(found)
+        self.misses += len(key_list) - len(found)
+        return found
+
+    def put(self,key_list,activations,create_jd):
+        '''
+        store charts (existing keys are replaced), evict if store is full
+        Args:
+            key_list(list of int): keys (see instant_key)
+            activations(np.array): ACTIVATION_DTYPE, shape (len(key_list),26)
+            create_jd(np.array): design julian days
+        '''
+        now = time.time()
+        version = store_version()
+        rows = [(int(key),version,activation.tobytes(),float(jd),now)
+                for key,activation,jd in zip(key_list,activations,create_jd)]
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO charts VALUES (?,?,?,?,?)",rows)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._inserted += len(rows)
+            check = (self._inserted >= EVICT_INTERVAL or
+                     self._count + self._inserted > self.max_entries)
+        if check:
+            self.evict()
+
+    def get_or_calc(self,timestamp_list,birth_jd=None):
+        '''
+        charts of timestamps, missing charts are calculated and stored
+        Args:
+            timestamp_list(list of tuple): year,month,day,hour,minute,second,tz_offset
+            birth_jd(np.array): julian days (UT) of timestamps, calculated if None
+        Return:
+            charts(hd_chart.ChartBatch): same order as timestamp_list
+            create_jd(np.array): design julian days
+        '''
+        key_list = [instant_key(timestamp) for timestamp in timestamp_list]
+        with hd_metrics.stage("chart_store"):
+            found = self.get(key_list)
+        charts = hd_chart.ChartBatch(np.zeros(len(key_list),dtype=hd_chart.CHART_DTYPE))
+        create_jd = np.empty(len(key_list))
+        missing = [idx for idx,key in enumerate(key_list) if key not in found]
+        for idx,key in enumerate(key_list):
+            if key in found:
+                charts.data["activation"][idx],create_jd[idx] = found[key]
+        if missing:
+            if birth_jd is None:
+                birth_jd = hd_ephemeris.timestamps_to_jd(timestamp_list)
+            missing_jd = np.asarray(birth_jd)[missing]
+            missing_create_jd = hd_ephemeris.calc_create_dates(missing_jd)
+            with hd_metrics.stage("date_to_gate"):
+                lon = hd_ephemeris.calc_longitudes(np.concatenate([missing_jd,missing_create_jd]))
+                new_charts = hd_chart.ChartBatch.from_longitudes(lon[:len(missing)],lon[len(missing):])
+            charts.data[missing] = new_charts.data
+            create_jd[missing] = missing_create_jd
+            #duplicate keys in timestamp_list are stored once
+            missing_keys = {key_list[idx]:pos for pos,idx in enumerate(missing)}
+            self.put(list(missing_keys.keys()),
+                     new_charts.data["activation"][list(missing_keys.values())],
+                     missing_create_jd[list(missing_keys.values())])
+
+        return charts,create_jd
+
+    def evict(self):
+        '''
+        count charts (inserts of other processes included) and delete the oldest above max_entries,
+            down to 1% (max. EVICT_INTERVAL) below max_entries, so the next size check is not
+            due with the next insert. charts of all versions are evicted by age, charts of
+            versions no longer in use are retired this way (or deleted by purge)
+        '''
+        connection = self.connection
+        count = connection.execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+        if count > self.max_entries:
+            target = self.max_entries - min(EVICT_INTERVAL,self.max_entries//100)
+            connection.execute("""DELETE FROM charts WHERE rowid IN
+                                  (SELECT rowid FROM charts ORDER BY created LIMIT ?)""",
+                               [count - target])
+            count = target
+        with self._lock:
+            self._count,self._inserted = count,0
+
+    def purge(self,version_list):
+        '''
+        delete charts of other versions (full table scan, e.g. after a constants or ephemeris update)
+        Args:
+            version_list(list of int): versions to keep (see store_version)
+        Return:
+            count(int): number of deleted charts
+        '''
+        cursor = self.connection.execute("DELETE FROM charts WHERE version NOT IN ({})"
+                                         .format(",".join("?"*len(version_list))),list(version_list))
+        return cursor.rowcount
+
+    def warm(self,start_date,end_date,time_unit="minutes",intervall=1,batch_size=10000):
+        '''
+        calculate and store all charts of a time range (see hd_features.get_timestamp_list)
+        Args:
+            start_date(tuple): year,month,day,hour,minute,second,tz_offset
+            end_date(tuple): year,month,day,hour,minute,second,tz_offset (end>start)
+            time_unit(str): years,months,days,hours,minutes
+            intervall(int): stepwith, every X unit
+            batch_size(int): charts per batch calculation
+        Return:
+            count(int): number of timestamps
+        '''
+        import hd_features
+        timestamp_list = hd_features.get_timestamp_list(start_date,end_date,1,time_unit,intervall)
+        for idx in range(0,len(timestamp_list),batch_size):
+            self.get_or_calc(timestamp_list[idx:idx+batch_size])
+        return len(timestamp_list)
+
+    def stats(self):
+        ''' number of charts, file size and hit/miss counters of this process '''
+        count,n_versions = self.connection.execute(
+            "SELECT COUNT(*),COUNT(DISTINCT version) FROM charts").fetchone()
+        return {"path":self.path,
+                "charts":count,
+                "versions":n_versions,
+                "max_entries":self.max_entries,
+                "file_size":sum(os.path.getsize(file) for file in [self.path,self.path+"-wal"]
+                                if os.path.exists(file)),
+                "hits":self.hits,
+                "misses":self.misses,
+               }
+
+    def close(self):
+        ''' close connection of this thread '''
+        if getattr(self._local,"pid",None) == os.getpid():
+            self._local.connection.close()
+        self._local = threading.local()
+
+#default store (see get_default_store)
+_default_store = None
+
+def open_store(path,max_entries=MAX_ENTRIES):
+    ''' open store and set it as default store, None closes the default store '''
+    global _default_store
+    if _default_store is not None:
+        _default_store.close()
+    _default_store = ChartStore(path,max_entries) if path else None
+    return _default_store
+
+def get_default_store():
+    ''' default store, opened from HD_STORE_PATH on first call (None if not set) '''
+    if _default_store is None and os.getenv("HD_STORE_PATH"):
+        open_store(os.getenv("HD_STORE_PATH"),int(os.getenv("HD_STORE_MAX_ENTRIES",MAX_ENTRIES)))
+    return _default_store
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="persistent chart store")
+    subparsers = parser.add_subparsers(dest="command",required=True)
+    warm_parser = subparsers.add_parser("warm",help="calculate and store charts of a time range")
+    warm_parser.add_argument("path",help="store file")
+    warm_parser.add_argument("--start",type=int,nargs="+",required=True,help="year month day [hour minute] (UTC)")
+    warm_parser.add_argument("--end",type=int,nargs="+",required=True,help="year month day [hour minute] (UTC)")
+    warm_parser.add_argument("--unit",default="minutes",help="years,months,days,hours,minutes")
+    warm_parser.add_argument("--step",type=int,default=1,help="every X unit")
+    warm_parser.add_argument("--max-entries",type=int,default=MAX_ENTRIES)
+    stats_parser = subparsers.add_parser("stats",help="print store summary")
+    stats_parser.add_argument("path",help="store file")
+    purge_parser = subparsers.add_parser("purge",help="delete charts of other versions")
+    purge_parser.add_argument("path",help="store file")
+    purge_parser.add_argument("--table",nargs="*",default=[],
+                              help="keep charts of these position tables (swiss ephemeris charts are always kept)")
+    args = parser.parse_args(argv)
+
+    if args.command == "warm":
+        store = ChartStore(args.path,args.max_entries)
+        start_date = tuple(args.start + [0]*(7-len(args.start)))
+        end_date = tuple(args.end + [0]*(7-len(args.end)))
+        print("{} timestamps".format(store.warm(start_date,end_date,args.unit,args.step)))
+    elif args.command == "purge":
+        import hd_chebyshev
+        store = ChartStore(args.path)
+        version_list = [store_version("swe")]
+        for path in args.table:
+            table = hd_chebyshev.ChebyshevTable(path)
+            version_list.append(store_version(table.source_key))
+            table.close()
+        print("{} charts deleted".format(store.purge(version_list)))
+    else:
+        store = ChartStore(args.path)
+    for key,value in store.stats().items():
+        print("{}: {}".format(key,value))
+    store.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
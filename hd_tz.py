@@ -0,0 +1,209 @@
+"""
+vectorized utc offset resolution from precompiled zone transition tables
+    the transition list of a zone (pytz data) is compiled once into sorted
+    arrays of local time intervals, offsets of many local timestamps are
+    resolved with np.searchsorted.
+
+    local times inside a DST gap (nonexistent) or overlap (ambiguous) are
+    resolved by policy:
+        ambiguous:   "standard" (pytz default: non-DST offset, else the later one),
+                     "earlier" (first occurrence), "later" (second occurrence), "raise"
+        nonexistent: "before" (pytz default: offset before the gap),
+                     "after" (offset after the gap), "raise"
+    the default policies give the same offsets as
+    hd_features.get_utc_offset_from_tz (pytz localize, is_dst=False).
+"""
+import hd_metrics
+import numpy as np
+import pytz
+import threading
+from datetime import datetime
+
+#origin of local/utc seconds
+EPOCH = datetime(1970,1,1)
+AMBIGUOUS_POLICY_LIST = ["standard","earlier","later","raise"]
+NONEXISTENT_POLICY_LIST = ["before","after","raise"]
+
+_zone_table_dict = {}
+_lock = threading.Lock()
+
+class ZoneTable:
+    '''
+    compiled transitions of one zone, period i is valid for local times
+    in [local_start[i],local_end[i]) (seconds since 1970, naive local time)
+    Args:
+        zone(str): e.g. "Europe/Berlin"
+    '''
+    __slots__ = ("zone","local_start","local_end","offset","dst")
+
+    def __init__(self,zone):
+        tz = pytz.timezone(zone)
+        self.zone = zone
+        if hasattr(tz,"_utc_transition_times"):
+            utc_start = np.array([int((time - EPOCH).total_seconds()) for time in tz._utc_transition_times],
+                                 dtype=np.int64)
+            self.offset = np.array([int(info[0].total_seconds()) for info in tz._transition_info],dtype=np.int64)
+            self.dst = np.array([bool(info[1]) for info in tz._transition_info])
+        else: #fixed offset zones (UTC, Etc/GMT+5, ...)
+            utc_start = np.array([np.iinfo(np.int64).min//2],dtype=np.int64)
+            self.offset = np.array([int(tz.utcoffset(EPOCH).total_seconds())],dtype=np.int64)
+            self.dst = np.array([False])
+        utc_end = np.append(utc_start[1:],np.iinfo(np.int64).max//2)
+        self.local_start = utc_start + self.offset
+        self.local_end = utc_end + self.offset
+        #first period is valid for all earlier local times
+        self.local_start[0] = np.iinfo(np.int64).min//2
+
+    def resolve(self,local_seconds,ambiguous="standard",nonexistent="before"):
+        '''
+        utc offsets of local times
+        Args:
+            local_seconds(np.array): naive local times, seconds since 1970 (see local_seconds)
+            ambiguous(str): policy for local times in overlaps (see AMBIGUOUS_POLICY_LIST)
+            nonexistent(str): policy for local times in gaps (see NONEXISTENT_POLICY_LIST)
+        Return:
+            offset(np.array): seconds
+        Raise:
+            pytz.AmbiguousTimeError, pytz.NonExistentTimeError: for policy "raise"
+        '''
+        if ambiguous not in AMBIGUOUS_POLICY_LIST:
+            raise ValueError("ambiguous policy must be one of {}".format(AMBIGUOUS_POLICY_LIST))
+        if nonexistent not in NONEXISTENT_POLICY_LIST:
+            raise ValueError("nonexistent policy must be one of {}".format(NONEXISTENT_POLICY_LIST))
+        local_seconds = np.asarray(local_seconds,dtype=np.int64)
+        #last period starting at or before local time
+        idx = np.searchsorted(self.local_start,local_seconds,side="right") - 1
+        valid = local_seconds < self.local_end[idx]
+        prev_idx = np.maximum(idx-1,0)
+        overlap = valid & (idx > 0) & (local_seconds < self.local_end[prev_idx])
+        gap = ~valid
+        period = idx.copy()
+
+        if overlap.any():
+            if ambiguous == "raise":
+                raise pytz.AmbiguousTimeError(self.describe(local_seconds[overlap][0]))
+            if ambiguous == "earlier":
+                period[overlap] = prev_idx[overlap]
+            elif ambiguous == "standard":
+                #non-DST period, if both/none are DST the later one
+                use_prev = overlap & ~self.dst[prev_idx] & self.dst[idx]
+                period[use_prev] = prev_idx[use_prev]
+        if gap.any():
+            if nonexistent == "raise":
+                raise pytz.NonExistentTimeError(self.describe(local_seconds[gap][0]))
+            if nonexistent == "after":
+                period[gap] = np.minimum(idx[gap]+1,len(self.offset)-1)
+
+        return self.offset[period]
+
+    def describe(self,local_second):
+        return "{} ({})".format(np.datetime64(int(local_second),"s"),self.zone)
+
+def get_zone_table(zone):
+    ''' compiled ZoneTable of zone (compiled on first call, shared by threads) '''
+    table = _zone_table_dict.get(zone)
+    if table is None:
+        with _lock:
+            table = _zone_table_dict.get(zone)
+            if table is None:
+                table = _zone_table_dict[zone] = ZoneTable(zone)
+    return table
+
+def local_seconds(timestamps):
+    '''
+    naive local times as seconds since 1970
+    Args:
+        timestamps(array like): shape (N,5..7): year,month,day,hour,minute[,second[,tz_offset]]
+                                (tz_offset is ignored)
+    Return:
+        seconds(np.array): int64
+    '''
+    timestamps = np.atleast_2d(np.asarray(timestamps,dtype=np.int64))
+    second = timestamps[:,5] if timestamps.shape[1] > 5 else 0
+    month = (timestamps[:,0]-1970)*12 + timestamps[:,1]-1
+    day = (month.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+           + timestamps[:,2]-1)
+    return day*86400 + timestamps[:,3]*3600 + timestamps[:,4]*60 + second
+
+@hd_metrics.timed("utc_offset")
+def resolve_offsets(timestamps,zone,ambiguous="standard",nonexistent="before"):
+    '''
+    utc offsets of many local timestamps of one zone
+    Args:
+        timestamps(array like): shape (N,5..7): year,month,day,hour,minute[,second[,tz_offset]]
+        zone(str): e.g. "Europe/Berlin"
+        ambiguous(str): see ZoneTable.resolve
+        nonexistent(str): see ZoneTable.resolve
+    Return:
+        hours(np.array): offset hours (decimal hours e.g. 0.75 for 45 min)
+    '''
+    offset = get_zone_table(zone).resolve(local_seconds(timestamps),ambiguous,nonexistent)
+    return offset/3600
+
+@hd_metrics.timed("utc_offset")
+def resolve_offsets_zones(timestamps,zone_list,ambiguous="standard",nonexistent="before"):
+    '''
+    utc offsets of local timestamps with individual zones (grouped by zone)
+    Args:
+        timestamps(array like): shape (N,5..7), see resolve_offsets
+        zone_list(list of str): zone of every timestamp
+    Return:
+        hours(np.array): offset hours
+    '''
+    seconds = local_seconds(timestamps)
+    zone_array = np.asarray(zone_list)
+    hours = np.empty(len(seconds))
+    for zone in np.unique(zone_array):
+        mask = zone_array == zone
+        hours[mask] = get_zone_table(str(zone)).resolve(seconds[mask],ambiguous,nonexistent)/3600
+    return hours
+
+def get_utc_offset(timestamp,zone,ambiguous="standard",nonexistent="before"):
+    '''
+    utc offset of one local timestamp, same result as hd_features.get_utc_offset_from_tz
+    Return:
+        hours(float): offset hours
+    '''
+    return float(resolve_offsets([timestamp[:6]],zone,ambiguous,nonexistent)[0])
+
+def regression_corpus(zone,n_random=30,max_transitions=400,seed=0):
+    '''
+    local timestamps for comparison with pytz: random dates 1850-2100 and
+    local times around every transition (edges of gaps and overlaps)
+    Return:
+        timestamps(np.array): shape (N,6)
+    '''
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(local_seconds([(1850,1,1,0,0)])[0],local_seconds([(2100,1,1,0,0)])[0],n_random)
+    tz = pytz.timezone(zone)
+    for idx,time in enumerate(getattr(tz,"_utc_transition_times",[])[1:max_transitions+1]):
+        utc = int((time - EPOCH).total_seconds())
+        for offset in tz._transition_info[idx:idx+2]:
+            seconds = np.append(seconds,utc + int(offset[0].total_seconds())
+                                + np.array([-3600,-1800,-1,0,1,1799,1800,3599,3600,5400]))
+    seconds = seconds[(seconds > local_seconds([(1,1,2,0,0)])[0]) & (seconds < local_seconds([(9999,1,1,0,0)])[0])]
+    time_list = seconds.astype("datetime64[s]").tolist()
+    return np.array([time.timetuple()[:6] for time in time_list],dtype=np.int64)
+
+def verify_offsets(zone_list=None):
+    '''
+    check resolve_offsets (default policies) against pytz localize
+    (hd_features.get_utc_offset_from_tz) on regression_corpus of each zone
+    Args:
+        zone_list(list of str): zones, default all pytz zones
+    Return:
+        count(int): number of compared timestamps
+    Raise:
+        ValueError: on first zone with different offsets
+    '''
+    count = 0
+    for zone in zone_list or pytz.all_timezones:
+        tz = pytz.timezone(zone)
+        timestamps = regression_corpus(zone)
+        reference = np.array([tz.localize(datetime(*timestamp)).utcoffset().total_seconds()/3600
+                              for timestamp in timestamps.tolist()])
+        diff = np.flatnonzero(resolve_offsets(timestamps,zone) != reference)
+        if len(diff):
+            raise ValueError("{}: offset of {} differs from pytz".format(zone,tuple(timestamps[diff[0]])))
+        count += len(timestamps)
+    return count
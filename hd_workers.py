@@ -0,0 +1,265 @@
+"""
+pool of pre-warmed worker processes for the CPU bound part of /calculate
+    (ephemeris, classification, json building). The event loop of the api
+    only awaits results, queueing is bounded: if HD_WORKER_QUEUE requests
+    are waiting for a worker, further requests are rejected (QueueFullError).
+
+    environment variables:
+        HD_WORKERS        number of worker processes (default cpu count),
+                          0: calculation in threads of the api process
+        HD_WORKER_QUEUE   max. waiting requests (default 4 per worker)
+
+    if a worker process dies (e.g. out of memory), the pool is broken: the
+    requests in flight fail with WorkerCrashError and the pool is restarted in
+    the background (calculations run in threads until the workers are warm).
+"""
+import hd_runtime
+import hd_metrics
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+#warm up steps of worker processes (see hd_runtime.WARM_UP_STEPS)
+WORKER_WARM_UP_STEPS = ["ephemeris","design_table","definition_table","chart_store"]
+#timestamp of warm up calculation
+WARM_UP_TIMESTAMP = (2000,1,1,12,0,0,0)
+#number of calculation durations kept for percentiles
+LATENCY_WINDOW = 10000
+
+class QueueFullError(Exception):
+    ''' all workers busy and max. number of waiting requests reached '''
+
+class CalculationError(Exception):
+    ''' calculation or formatting of a response failed, message is the error detail '''
+
+class WorkerCrashError(Exception):
+    ''' a worker process died during the call, the pool is restarted '''
+
+def env_workers():
+    workers = os.getenv("HD_WORKERS")
+    if workers is None:
+        return os.cpu_count() or 1
+    return int(workers)
+
+def init_worker():
+    '''
+    initializer of worker processes: build chart resources and calculate one
+    response (imports, caches) before the first request
+    '''
+    hd_runtime.warm_up(WORKER_WARM_UP_STEPS)
+    calc_response(WARM_UP_TIMESTAMP)
+
+def calc_response(timestamp):
+    '''
+    final /calculate response of timestamp (runs in worker process)
+    Args:
+        timestamp(tuple): year,month,day,hour,minute,second,tz_offset
+    Return:
+        final_result(dict): keys "general","gates","channels"
+    Raise:
+        CalculationError: with detail message of failed step
+    '''
+    import hd_features as hd
+    try:
+        #batch path reads/fills the persistent chart store (HD_STORE_PATH)
+        single_result = hd.calc_hd_features_batch([timestamp], channel_meaning=False)[0]
+    except Exception as e:
+        raise CalculationError(f"Error calculating Human Design features: {str(e)}")
+
+    return build_response(single_result)
+
+def calc_responses(timestamp_list):
+    '''
+    /calculate responses of many timestamps with one batch calculation (runs in worker process),
+    if the batch fails, timestamps are calculated one by one to isolate errors
+    Args:
+        timestamp_list(list of tuple): year,month,day,hour,minute,second,tz_offset
+    Return:
+        item_list(list of dict): for each timestamp {"result":final_result} or {"error":detail}
+    '''
+    import hd_features as hd
+    try:
+        result_list = hd.calc_hd_features_batch(timestamp_list, channel_meaning=False)
+    except Exception:
+        result_list = None
+    item_list = []
+    for idx,timestamp in enumerate(timestamp_list):
+        try:
+            if result_list is None:
+                item_list.append({"result": calc_response(timestamp)})
+            else:
+                item_list.append({"result": build_response(result_list[idx])})
+        except CalculationError as e:
+            item_list.append({"error": str(e)})
+    return item_list
+
+@hd_metrics.timed("build_response")
+def build_response(single_result):
+    '''
+    final /calculate response of calculated features
+    Args:
+        single_result(tuple): output of hd_features.calc_hd_features_batch (one timestamp)
+    Return:
+        final_result(dict): keys "general","gates","channels"
+    Raise:
+        CalculationError: with detail message of failed step
+    '''
+    import convertJSON as cj
+    try:
+        data = {
+            "birth_date": single_result[9],
+            "create_date": single_result[10],
+            "energie_type": single_result[0],
+            "inner_authority": single_result[1],
+            "inc_cross": single_result[2],
+            "profile": single_result[4],
+            "active_chakras": single_result[7],
+            "split": "{}".format(single_result[5]),
+            "variables": {
+                'right_up': 'right',
+                'right_down': 'left',
+                'left_up': 'right',
+                'left_down': 'right'
+            }
+        }
+        general_output = cj.general_dict(data)
+        gates_output = cj.gates_dict(single_result[6])
+        channels_output = cj.channels_dict(single_result[8], False)
+    except IndexError as e:
+        raise CalculationError(f"Error processing calculation results: Missing expected data at index {e}")
+    except Exception as e:
+        raise CalculationError(f"Unexpected error processing results: {e}")
+
+    return {
+        "general": general_output,
+        "gates": gates_output,
+        "channels": channels_output
+    }
+
+class WorkerPool:
+    '''
+    process pool with bounded queue and latency statistics
+    Args:
+        workers(int): worker processes, 0: threads of the calling process
+        max_queue(int): max. requests waiting for a free worker
+    '''
+    def __init__(self,workers,max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = None
+        self.ready = False
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.restarts = 0
+        self.latency = deque(maxlen=LATENCY_WINDOW) #seconds incl. queueing
+        self._lock = threading.Lock()
+
+    def start(self):
+        ''' start worker processes and wait until every worker is warm '''
+        if self.workers > 0 and self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=init_worker)
+            #one task per worker: all processes are spawned and initialized now
+            for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+        self.ready = True
+
+    def restart(self,executor):
+        ''' replace a broken executor: shut it down and start new warm workers in a background thread '''
+        with self._lock:
+            if self.executor is not executor: #already restarted by another call
+                return
+            self.executor = None
+            self.ready = False
+            self.restarts += 1
+        executor.shutdown(wait=False,cancel_futures=True)
+        threading.Thread(target=self.start,name="hd_worker_pool",daemon=True).start()
+
+    def shutdown(self):
+        self.ready = False
+        if self.executor is not None:
+            self.executor.shutdown(wait=True,cancel_futures=True)
+            self.executor = None
+
+    async def run(self,func,*args):
+        '''
+        await func(*args) in a worker, stage durations of the call are
+        merged into the metrics of this process (see hd_metrics.measured_call)
+        Raise:
+            QueueFullError: if max_queue requests are already waiting
+            WorkerCrashError: if the worker process died (pool is restarted, see restart)
+        '''
+        with self._lock:
+            if self.in_flight >= max(self.workers,1) + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError("{} requests in progress".format(self.in_flight))
+            self.in_flight += 1
+        t_start = time.perf_counter()
+        measured = hd_metrics.enabled
+        if measured:
+            func,args = hd_metrics.measured_call,(func,)+args
+        executor = self.executor
+        try:
+            if executor is None:
+                result = await asyncio.to_thread(func,*args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(executor,func,*args)
+            if measured:
+                result,duration_list = result
+                hd_metrics.merge(duration_list)
+        except BaseException as e:
+            with self._lock:
+                self.failed += 1
+            if isinstance(e,BrokenProcessPool):
+                self.restart(executor)
+                raise WorkerCrashError("worker process died, workers are restarted: {}".format(e)) from e
+            if isinstance(e,RuntimeError) and executor is not None and executor is not self.executor:
+                #submitted to an executor that was shut down by a restart
+                raise WorkerCrashError("workers are restarted: {}".format(e)) from e
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        with self._lock:
+            self.completed += 1
+            self.latency.append(time.perf_counter() - t_start)
+        if measured:
+            hd_metrics.observe("worker",time.perf_counter() - t_start)
+        return result
+
+    def stats(self):
+        ''' counters, queue depth and latency percentiles (ms) of the last LATENCY_WINDOW calls '''
+        with self._lock:
+            latency = sorted(self.latency)
+            result = {"workers":self.workers,
+                      "max_queue":self.max_queue,
+                      "ready":self.ready,
+                      "in_flight":self.in_flight,
+                      "queued":max(self.in_flight - max(self.workers,1),0),
+                      "completed":self.completed,
+                      "rejected":self.rejected,
+                      "failed":self.failed,
+                      "restarts":self.restarts,
+                     }
+        for percentile in (50,95,99):
+            result["p{}_ms".format(percentile)] = (round(1000*latency[min(len(latency)*percentile//100,len(latency)-1)],3)
+                                                   if latency else None)
+        return result
+
+_pool = None
+
+def get_pool():
+    ''' process wide WorkerPool (settings from environment, not started) '''
+    global _pool
+    if _pool is None:
+        workers = env_workers()
+        _pool = WorkerPool(workers,int(os.getenv("HD_WORKER_QUEUE",4*max(workers,1))))
+    return _pool
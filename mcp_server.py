@@ -1,7 +1,8 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 import logging
 from typing import Dict, Any, Tuple, Optional
 import json
+import hd_metrics
 
 class HumanDesignMCPServer:
     def __init__(self):
@@ -18,6 +19,27 @@ class HumanDesignMCPServer:
     
     def setup_routes(self):
         self.app.route('/calculate', methods=['GET'])(self.calculate_hd_wrapper)
+        self.app.route('/ready', methods=['GET'])(self.ready)
+        self.app.route('/metrics', methods=['GET'])(self.metrics)
+        if hd_metrics.enabled:
+            self.app.before_request(self.begin_request)
+            self.app.teardown_request(self.end_request)
+
+    def begin_request(self):
+        g.metrics_start = hd_metrics.begin_request()
+
+    def end_request(self, exception=None):
+        if "metrics_start" in g:
+            hd_metrics.end_request(g.metrics_start)
+
+    def metrics(self):
+        """Prometheus metrics: stage latency histograms, cache hit ratios, in flight requests."""
+        return Response(hd_metrics.render(), content_type=hd_metrics.CONTENT_TYPE)
+
+    def ready(self):
+        """Readiness probe: 200 once all runtime resources are warm, else 503."""
+        import hd_runtime
+        return jsonify(hd_runtime.readiness()), 200 if hd_runtime.is_ready() else 503
     
     def validate_input_parameters(self, request_args: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[Dict[str, Any], int]]]:
         """Validate and extract input parameters from the request."""
@@ -49,13 +71,12 @@ class HumanDesignMCPServer:
         try:
             # These would be imported from your actual implementation
             from geocode import get_latitude_longitude
-            from timezonefinder import TimezoneFinder
-            import hd_features as hd
+            import hd_runtime
+            import hd_tz
             
             latitude, longitude = get_latitude_longitude(birth_place)
             if latitude and longitude:
-                tf = TimezoneFinder()
-                zone = tf.timezone_at(lat=latitude, lng=longitude)
+                zone = hd_runtime.timezone_at(latitude, longitude)
                 if not zone:
                     self.logger.warning(f"Timezone lookup failed for {birth_place}. Falling back to UTC.")
                     zone = 'Etc/UTC'
@@ -63,7 +84,7 @@ class HumanDesignMCPServer:
                 self.logger.warning(f"Geocoding failed for {birth_place}. Falling back to UTC timezone.")
                 zone = 'Etc/UTC'
 
-            hours = hd.get_utc_offset_from_tz(birth_time, zone)
+            hours = hd_tz.get_utc_offset(birth_time, zone)
             return latitude, longitude, hours, None
             
         except Exception as e:
@@ -102,13 +123,9 @@ class HumanDesignMCPServer:
                 }
             }
 
-            general_json_str = cj.general(data)
-            gates_json_str = cj.gatesJSON(single_result[6])
-            channels_json_str = cj.channelsJSON(single_result[8], False)
-
-            general_output = json.loads(general_json_str)
-            gates_output = json.loads(gates_json_str)
-            channels_output = json.loads(channels_json_str)
+            general_output = cj.general_dict(data)
+            gates_output = cj.gates_dict(single_result[6])
+            channels_output = cj.channels_dict(single_result[8], False)
 
             final_result = {
                 "general": general_output,
@@ -121,9 +138,6 @@ class HumanDesignMCPServer:
         except IndexError as e:
             self.logger.error(f"Error accessing calculation results: {e}. Result array: {single_result}")
             return None, ({"error": f"Error processing calculation results: Missing expected data at index {e}"}, 500)
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Error decoding JSON from helper functions: {e}")
-            return None, ({"error": f"Internal error generating JSON output: {e}"}, 500)
         except Exception as e:
             self.logger.error(f"Unexpected error during JSON generation: {e}")
             return None, ({"error": f"Unexpected error processing results: {e}"}, 500)
@@ -151,15 +165,21 @@ class HumanDesignMCPServer:
             return jsonify(error_response[0]), error_response[1]
         
         # Step 5: Format output data
-        final_result, error_response = self.format_output_data(single_result)
+        with hd_metrics.stage("build_response"):
+            final_result, error_response = self.format_output_data(single_result)
         if error_response:
             return jsonify(error_response[0]), error_response[1]
         
-        # Step 6: Return successful response
-        return jsonify(final_result)
+        # Step 6: Return successful response, serialized once (format by Accept header)
+        import convertJSON as cj
+        with hd_metrics.stage("serialization"):
+            body, headers = cj.render(final_result, request.headers.get("Accept"), request.headers.get("Accept-Encoding"))
+        return Response(body, headers=headers)
     
     def run(self, host='0.0.0.0', port=5001, debug=True):
         """Run the Flask application."""
+        import hd_runtime
+        hd_runtime.start_warm_up()
         self.app.run(host=host, port=port, debug=debug)
 
 if __name__ == '__main__':